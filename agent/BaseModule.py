@@ -21,9 +21,11 @@ class BaseModule(ABC):
         task: str,
         callback: callable,
         error_callback: callable,
-        partial_callback: callable = None
+        partial_callback: callable = None,
+        restart_callback: callable = None
     ) -> None:
         """
-        Exécute une tâche de manière asynchrone. Peut émettre des fragments via `partial_callback`.
+        Exécute une tâche de manière asynchrone. Peut émettre des fragments via `partial_callback` ;
+        `restart_callback` est appelé si la réponse repart de zéro (fragments reçus à effacer).
         """
         pass
@@ -1,45 +1,89 @@
-from PySide6.QtCore import QThread
 from agent.BaseModule import BaseModule
-from agent.OpenAIWorker import OpenAIWorker
+from agent.LLMEngine import LLMEngine
+from services.lexical_index import DEFAULT_TOP_K, get_lexical_index, format_hits
+from services.prompt_registry import as_messages
 
 class ChatModule(BaseModule):
     name = "chat"
 
-    def __init__(self, api_key, model="gpt-3.5-turbo", stream=True):
+    def __init__(self, api_key, model="gpt-3.5-turbo", stream=True, category="chat",
+                 project_root=None, top_k=DEFAULT_TOP_K):
         self.api_key = api_key
         self.model = model
         self.stream = stream
+        self.category = category  # regroupement dans la télémétrie LLM
+        self.requests = []  # Requêtes en cours (plusieurs appels peuvent se chevaucher)
+        self.top_k = top_k  # nombre d'extraits du projet joints à chaque demande
+        self.project_root = None
+        if project_root:
+            self.set_project_root(project_root)
+
+    def set_project_root(self, project_root):
+        """Projet dont les extraits pertinents accompagnent les demandes (None pour aucun)."""
+        self.project_root = project_root
+        if project_root:
+            get_lexical_index(project_root)  # construction de l'index lancée en arrière-plan
+
+    def project_context(self, query: str):
+        """
+        Message système contenant les top_k extraits du projet les plus pertinents pour
+        `query` (recherche BM25), ou None sans projet, sans résultat ou index en construction.
+        """
+        if not self.project_root or not query.strip():
+            return None
+        hits = get_lexical_index(self.project_root).search(query, self.top_k)
+        if not hits:
+            return None
+        return {
+            "role": "system",
+            "content": "Extraits du projet de l'utilisateur susceptibles d'être utiles :\n\n" + format_hits(hits),
+        }
 
     def can_handle(self, task: str) -> bool:
         return True
 
-    def handle_async(self, task: str, callback, error_callback, partial_callback=None):
-        self.thread = QThread()
-        self.worker = OpenAIWorker(
-            api_key=self.api_key,
+    def handle_async(self, task: str, callback, error_callback, partial_callback=None,
+                     restart_callback=None):
+        # `task` peut aussi être une liste de messages (ex. prompt de services.prompt_registry),
+        # déjà complète : les extraits du projet ne sont ajoutés qu'aux demandes en texte libre
+        messages = as_messages(task)
+        if isinstance(task, str):
+            context = self.project_context(task)
+            if context is not None:
+                messages = [context] + messages
+
+        # Toutes les requêtes partagent la boucle asyncio du moteur LLM :
+        # pas de QThread par appel, et un second appel n'écrase plus le premier.
+        request = LLMEngine.instance().request(
+            messages=messages,
             model=self.model,
-            messages=[{"role": "user", "content": task}],
-            stream=self.stream
+            api_key=self.api_key,
+            stream=self.stream,
+            category=self.category,
         )
-        self.worker.moveToThread(self.thread)
 
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(callback)
-        self.worker.error.connect(error_callback)
+        request.finished.connect(callback)
+        request.error.connect(error_callback)
 
         if self.stream and partial_callback:
-            self.worker.partial.connect(partial_callback)
+            request.partial.connect(partial_callback)
+            if restart_callback:
+                request.restarted.connect(restart_callback)
+
+        # Oublier la requête une fois terminée
+        request.finished.connect(lambda _result, r=request: self._forget(r))
+        request.error.connect(lambda _msg, r=request: self._forget(r))
+        request.cancelled.connect(lambda r=request: self._forget(r))
 
-        # Note: The primary connections for callback and error_callback are made earlier.
-        # The connections below are for thread and worker lifecycle management.
+        self.requests.append(request)
+        request.start()
+        return request
 
-        # Setup thread and worker cleanup
-        # QThread.finished is emitted after the event loop has finished.
-        self.thread.finished.connect(self.worker.deleteLater) 
-        self.thread.finished.connect(self.thread.deleteLater)
-        
-        # Ensure thread quits when worker is done or errors out
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.error.connect(self.thread.quit)
+    def cancel_all(self):
+        """Annule toutes les requêtes en cours (ex. fermeture de la fenêtre appelante)"""
+        for request in list(self.requests):
+            request.cancel()
 
-        self.thread.start()
+    def _forget(self, request):
+        if request in self.requests:
+            self.requests.remove(request)
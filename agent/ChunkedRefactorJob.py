@@ -0,0 +1,155 @@
+"""
+Refactorisation d'un gros module Python partie par partie.
+
+Le module est découpé avec `ast` en fonctions et classes de premier niveau
+(services.code_chunks) ; chaque partie est refactorisée par un appel distinct, avec
+un nombre borné d'appels simultanés, en recevant le contexte commun du module
+(imports, variables globales). Les parties sont ensuite réassemblées dans l'ordre
+d'origine et le module complet est ré-analysé.
+
+Une partie en échec (erreur d'appel, réponse invalide) est conservée telle quelle et
+signalée, sans faire échouer le reste du fichier.
+"""
+
+import asyncio
+
+from PySide6.QtCore import QObject, Signal
+
+from services.code_chunks import (
+    DEFAULT_MAX_LINES,
+    check_replacement,
+    extract_code,
+    module_context,
+    reassemble,
+    split_module,
+)
+from services.prompt_registry import render
+
+CHUNK_TEMPERATURE = 0.2
+CHUNK_MAX_TOKENS = 4096
+
+
+class ChunkedRefactorJob(QObject):
+    finished = Signal(str)  # module refactorisé (bloc Markdown) suivi du rapport d'échecs
+    error = Signal(str)
+    cancelled = Signal()
+    progress = Signal(int, int)  # parties traitées, total
+    chunk_failed = Signal(str, str)  # nom de la partie, raison
+    throttled = Signal(float)  # attente imposée par la limitation de débit (secondes)
+
+    def __init__(self, engine, source, instruction, model, api_key=None, max_workers=4,
+                 max_lines=DEFAULT_MAX_LINES, extra_messages=None):
+        """
+        Args:
+            engine (LLMEngine): Moteur partagé qui exécute les appels
+            source (str): Code Python complet du module
+            instruction (str): Consigne de refactorisation
+            max_workers (int): Nombre maximal de parties refactorisées simultanément
+            max_lines (int): Taille visée d'une partie (lignes)
+            extra_messages (list): Messages ajoutés à chaque appel (ex. extraits du projet)
+        """
+        super().__init__()
+        self.engine = engine
+        self.source = source
+        self.instruction = instruction
+        self.model = model
+        self.api_key = api_key
+        self.max_workers = max(1, int(max_workers))
+        self.max_lines = max_lines
+        self.extra_messages = list(extra_messages or [])
+        self.future = None
+        self.failures = {}  # {nom de la partie: raison}
+        self.code = None  # module recomposé, une fois le job terminé
+
+    def start(self):
+        """Planifie le job sur la boucle du moteur (connecter les signaux avant)."""
+        self.future = self.engine.submit(self._run())
+        return self
+
+    def cancel(self):
+        """Interrompt les appels en cours ; `cancelled` est émis si le job n'était pas terminé."""
+        if self.future is not None and self.future.cancel():
+            self.cancelled.emit()
+
+    # --- Exécution dans la boucle du moteur ---
+
+    async def _run(self):
+        try:
+            result = await self._refactor()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+        self.finished.emit(result)
+
+    def _messages(self, segment, context):
+        prompt = render(
+            "refactor.chunk",
+            instruction=self.instruction,
+            context=context or "# (aucun)",
+            part=segment.name,
+            code=segment.text.rstrip("\n"),
+        )
+        # Extraits communs après les consignes statiques (préfixe partagé par tous les appels)
+        for message in self.extra_messages:
+            prompt.insert(-1, message)
+        return prompt
+
+    async def _refactor_segment(self, segment, context, semaphore):
+        async with semaphore:
+            reply = await self.engine.complete(
+                self._messages(segment, context),
+                self.model,
+                api_key=self.api_key,
+                temperature=CHUNK_TEMPERATURE,
+                max_tokens=CHUNK_MAX_TOKENS,
+                on_throttled=self.throttled.emit,
+                source=type(self).__name__,
+                category="refactor:chunk",
+            )
+        return check_replacement(segment, extract_code(reply))
+
+    async def _refactor(self):
+        try:
+            segments = split_module(self.source, self.max_lines)
+        except SyntaxError as e:
+            raise ValueError(f"Code Python invalide (ligne {e.lineno}) : {e.msg}") from None
+        context = module_context(segments)
+        semaphore = asyncio.Semaphore(self.max_workers)
+        targets = [i for i, s in enumerate(segments) if s.refactorable]
+
+        done = 0
+        self.progress.emit(0, len(targets))
+
+        async def refactor(index):
+            nonlocal done
+            segment = segments[index]
+            try:
+                return index, await self._refactor_segment(segment, context, semaphore)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures[segment.name] = str(e)
+                self.chunk_failed.emit(segment.name, str(e))
+                return index, None
+            finally:
+                done += 1
+                self.progress.emit(done, len(targets))
+
+        results = await asyncio.gather(*(refactor(i) for i in targets))
+        replacements = {index: text for index, text in results if text is not None}
+
+        try:
+            self.code = reassemble(segments, replacements)
+        except SyntaxError as e:
+            # Parties valides isolément mais incompatibles une fois assemblées
+            raise ValueError(f"Module recomposé invalide (ligne {e.lineno}) : {e.msg}") from None
+        return self._report()
+
+    def _report(self):
+        text = f"```python\n{self.code.rstrip()}\n```"
+        if self.failures:
+            lines = [f"- {name} : {reason}" for name, reason in self.failures.items()]
+            text += "\n\n⚠️ Parties conservées sans modification :\n" + "\n".join(lines)
+        return text
@@ -1,18 +1,65 @@
 from agent.BaseModule import BaseModule
 from agent.ChatModule import ChatModule
+from agent.ChunkedRefactorJob import ChunkedRefactorJob
+from agent.LLMEngine import LLMEngine
+from services.code_chunks import split_module
+from services.code_patch import PatchError, apply_edits, check_python, parse_edits, preview
+from services.prompt_registry import render
+
+# Formes de réponse demandées au modèle
+OUTPUT_FULL = "full"  # le code refactorisé complet
+OUTPUT_EDITS = "edits"  # seulement les modifications, appliquées localement (services.code_patch)
 
 
 class CodeRefactorModule(BaseModule):
+    """
+    Tâches prises en charge :
+        refactor:<code>                       refactorisation avec la consigne par défaut
+        refactor:<consigne>::<code>           refactorisation selon la consigne
+        refactor:chunked:<consigne>::<code>   refactorisation partie par partie forcée
+        refactor:edits:<consigne>::<code>     modifications seules (blocs rechercher/remplacer)
+
+    Les deux modes ne se combinent pas : « refactor:chunked:edits: » est refusé (les parties
+    sont toujours renvoyées complètes, puis réassemblées).
+
+    Un module Python d'au moins CHUNKED_MIN_LINES lignes est refactorisé partie par
+    partie (fonctions et classes en parallèle, voir ChunkedRefactorJob).
+
+    En mode OUTPUT_EDITS, le modèle ne renvoie que les passages modifiés : la taille de
+    la réponse, donc sa durée, suit l'ampleur du changement et non celle du fichier.
+    Les modifications sont appliquées localement ; celles qui ne s'ancrent plus sur le
+    code sont rejetées, et un aperçu en diff unifié accompagne le résultat.
+    """
     name = "refactor"
 
-    def __init__(self, api_key, model="gpt-4", stream=True):
-        self.chat = ChatModule(api_key, model, stream)
+    CHUNKED_MIN_LINES = 300
+    # Nombre maximal de parties refactorisées simultanément
+    CHUNK_WORKERS = 4
+
+    def __init__(self, api_key, model="gpt-4", stream=True, project_root=None, output_mode=OUTPUT_FULL):
+        self.chat = ChatModule(api_key, model, stream, category="refactor", project_root=project_root)
+        self.output_mode = output_mode  # forme de réponse par défaut (OUTPUT_FULL ou OUTPUT_EDITS)
+        self.jobs = []  # Jobs de refactorisation par parties en cours
+
+    def set_project_root(self, project_root):
+        self.chat.set_project_root(project_root)
 
     def can_handle(self, task: str) -> bool:
         return task.strip().lower().startswith("refactor:")
 
-    def handle_async(self, task: str, callback, error_callback, partial_callback=None):
+    def handle_async(self, task: str, callback, error_callback, partial_callback=None,
+                     restart_callback=None):
         raw_input = task[len("refactor:"):].strip()
+        force_chunked = raw_input.startswith("chunked:")
+        if force_chunked:
+            raw_input = raw_input[len("chunked:"):].strip()
+        output_mode = self.output_mode
+        if raw_input.startswith("edits:"):
+            if force_chunked:
+                error_callback("Les modes « chunked » et « edits » ne se combinent pas : choisir l'un des deux.")
+                return None
+            output_mode = OUTPUT_EDITS
+            raw_input = raw_input[len("edits:"):].strip()
 
         # Séparation consigne / code
         if "::" in raw_input:
@@ -21,6 +68,13 @@ class CodeRefactorModule(BaseModule):
             instruction = "Refactorise le code suivant de manière propre."
             code = raw_input
 
+        if force_chunked or (output_mode == OUTPUT_FULL and self._should_chunk(code)):
+            return self._start_chunked(instruction.strip(), code, callback, error_callback)
+        if output_mode == OUTPUT_EDITS:
+            return self._start_edits(
+                instruction.strip(), code, callback, error_callback, partial_callback, restart_callback
+            )
+
         prompt = (
             "Tu es un assistant expert Python. Voici une consigne de refactorisation :\n"
             f"- 🧾 Instruction : {instruction.strip()}\n\n"
@@ -28,4 +82,93 @@ class CodeRefactorModule(BaseModule):
             "Renvoie uniquement le code refactorisé dans un bloc Markdown Python."
         )
 
-        self.chat.handle_async(prompt, callback, error_callback, partial_callback)
+        # Extraits du projet liés à la consigne et au code (définitions appelées, usages)
+        messages = [{"role": "user", "content": prompt}]
+        context = self.chat.project_context(f"{instruction}\n{code}")
+        if context is not None:
+            messages.insert(0, context)
+
+        return self.chat.handle_async(messages, callback, error_callback, partial_callback, restart_callback)
+
+    def _start_edits(self, instruction: str, code: str, callback, error_callback, partial_callback=None,
+                     restart_callback=None):
+        messages = render("refactor.edits", instruction=instruction, code=code.strip("\n"))
+        context = self.chat.project_context(f"{instruction}\n{code}")
+        if context is not None:
+            messages.insert(-1, context)
+
+        def on_reply(reply):
+            try:
+                callback(self._apply_edits(code, reply))
+            except PatchError as e:
+                error_callback(str(e))
+
+        # Les fragments diffusés sont les modifications elles-mêmes : un aperçu en direct
+        return self.chat.handle_async(messages, on_reply, error_callback, partial_callback, restart_callback)
+
+    @staticmethod
+    def _apply_edits(code: str, reply: str) -> str:
+        """
+        Applique les modifications renvoyées par le modèle et met en forme le résultat :
+        code modifié, aperçu en diff unifié, modifications rejetées.
+
+        Raises:
+            PatchError: aucune modification applicable, ou code résultant invalide
+        """
+        result = apply_edits(code, parse_edits(reply))
+        rejected = [f"- {edit.label} : {reason}" for edit, reason in result.rejected]
+        if not result.changed:
+            raise PatchError("Aucune modification applicable :\n" + "\n".join(rejected))
+        check_python(result.code, code)
+
+        text = (
+            f"```python\n{result.code.rstrip()}\n```\n\n"
+            f"Aperçu des modifications :\n```diff\n{preview(code, result.code).rstrip()}\n```"
+        )
+        if rejected:
+            text += "\n\n⚠️ Modifications rejetées :\n" + "\n".join(rejected)
+        return text
+
+    def _should_chunk(self, code: str) -> bool:
+        """Gros module Python valide comportant plusieurs fonctions ou classes."""
+        if code.count("\n") + 1 < self.CHUNKED_MIN_LINES:
+            return False
+        try:
+            segments = split_module(code)
+        except SyntaxError:
+            return False
+        return sum(1 for s in segments if s.refactorable) > 1
+
+    def _start_chunked(self, instruction: str, code: str, callback, error_callback):
+        context = self.chat.project_context(f"{instruction}\n{code}")
+        job = ChunkedRefactorJob(
+            LLMEngine.instance(),
+            code,
+            instruction,
+            self.chat.model,
+            api_key=self.chat.api_key,
+            max_workers=self.CHUNK_WORKERS,
+            extra_messages=[context] if context is not None else None,
+        )
+        job.finished.connect(callback)
+        job.error.connect(error_callback)
+        job.progress.connect(lambda done, total: print(f"Refactorisation : {done}/{total} parties"))
+        job.chunk_failed.connect(lambda name, reason: print(f"Partie « {name} » non refactorisée : {reason}"))
+
+        # Oublier le job une fois terminé
+        job.finished.connect(lambda _code, j=job: self._forget(j))
+        job.error.connect(lambda _msg, j=job: self._forget(j))
+        job.cancelled.connect(lambda j=job: self._forget(j))
+
+        self.jobs.append(job)
+        return job.start()
+
+    def _forget(self, job):
+        if job in self.jobs:
+            self.jobs.remove(job)
+
+    def cancel_all(self):
+        """Annule les jobs de refactorisation et les requêtes en cours"""
+        for job in list(self.jobs):
+            job.cancel()
+        self.chat.cancel_all()
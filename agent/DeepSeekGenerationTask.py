@@ -1,45 +1,108 @@
-import openai
-import os
 from PySide6.QtCore import QRunnable, QObject, Signal
+from services.llm_clients import get_client
+from services.llm_cache import make_cache_key
+from services.single_flight import llm_flights
+from services.cancellation import CancellationToken, GenerationCancelled
+from services.rate_limiter import call_with_retry, estimate_tokens
+from services.prompt_registry import as_messages, prompt_key, prompt_text
+from services.llm_telemetry import CallMetrics, STATUS_CANCELLED, STATUS_ERROR
 
 # --- Signaux pour génération IA ---
 class GenerationSignals(QObject):
     finished = Signal(str, str)  # chemin complet, contenu HTML
     error = Signal(str)
+    cancelled = Signal(str)  # chemin complet de la génération annulée
+    throttled = Signal(float)  # attente imposée par la limitation de débit (secondes)
 
 
-api_key = os.getenv("DEEPSEEK_API_KEY")
-
 class DeepSeekGenerationTask(QRunnable):
-    def __init__(self, full_path, prompt):
+    def __init__(self, full_path, prompt, cancel_token=None, category=""):
         super().__init__()
         self.full_path = full_path
-        self.prompt = prompt
+        self.prompt = prompt  # texte libre ou messages (services.prompt_registry)
+        self.cancel_token = cancel_token or CancellationToken()
         self.signals = GenerationSignals()  # Supposant que cette classe existe déjà
-        self.key = api_key
+        self.key = None  # Lue depuis DEEPSEEK_API_KEY par le registre de clients
         self.model = "deepseek-chat"  # Le modèle principal de DeepSeek (DeepSeek-V3)
+        self.category = category  # regroupement dans la télémétrie (ex. type de document)
+        self.metrics = None
     
+    def _generate(self):
+        # Récupérer le client partagé configuré pour l'API DeepSeek
+        client = get_client("deepseek", self.key)
+
+        # Appeler l'API DeepSeek avec les mêmes paramètres que pour OpenAI.
+        # Le mode streaming permet d'interrompre la réponse dès l'annulation.
+        stream = call_with_retry(
+            lambda: client.chat.completions.create(
+                model=self.model,
+                messages=as_messages(self.prompt),
+                temperature=0.7,
+                stream=True
+            ),
+            "deepseek",
+            self.model,
+            estimated_tokens=estimate_tokens(prompt_text(self.prompt)) + 1500,
+            on_throttled=self.signals.throttled.emit,
+            cancel_token=self.cancel_token,
+            metrics=self.metrics,
+        )
+        self.cancel_token.register(stream.close)
+
+        # Récupérer le contenu généré
+        parts = []
+        try:
+            for chunk in stream:
+                self.cancel_token.raise_if_cancelled()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    self.metrics.add_output(chunk.choices[0].delta.content)
+        finally:
+            self.cancel_token.unregister(stream.close)
+            stream.close()
+
+        self.cancel_token.raise_if_cancelled()
+        return "".join(parts).strip()
+
     def run(self):
         try:
-            # Créer un client OpenAI configuré pour utiliser l'API DeepSeek
-            client = openai.Client(
-                api_key=self.key,
-                base_url="https://api.deepseek.com"
-            )
-            
-            # Appeler l'API DeepSeek avec les mêmes paramètres que pour OpenAI
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": self.prompt}],
-                temperature=0.7
+            # S'attacher à une requête identique déjà en cours, le cas échéant
+            key = make_cache_key(self.model, prompt_key(self.prompt), 0.7)
+            self.metrics = CallMetrics(
+                type(self).__name__, "deepseek", self.model, self.category, self.prompt
             )
-            
-            # Récupérer le contenu généré
-            html = response.choices[0].message.content.strip()
+            while True:
+                flight, is_leader = llm_flights.acquire(key)
+                self.metrics.coalesced = not is_leader
+                if is_leader:
+                    try:
+                        html = self._generate()
+                    except Exception as e:
+                        if self.cancel_token.is_cancelled:
+                            e = GenerationCancelled()
+                        llm_flights.abort(flight, e)
+                        raise
+                    llm_flights.complete(flight, html)
+                    break
+
+                try:
+                    html = flight.wait(cancel_token=self.cancel_token)
+                    self.metrics.add_output(html)
+                    break
+                except GenerationCancelled:
+                    # Seul le leader a été annulé : relancer la requête pour notre compte
+                    if self.cancel_token.is_cancelled:
+                        raise
             
             # Émettre le signal de fin avec le résultat
             self.signals.finished.emit(self.full_path, html)
+            self.metrics.finish()
             
         except Exception as e:
-            # Émettre le signal d'erreur
-            self.signals.error.emit(str(e))
\ No newline at end of file
+            if self.cancel_token.is_cancelled:
+                self.metrics.finish(STATUS_CANCELLED)
+                self.signals.cancelled.emit(self.full_path)
+            else:
+                self.metrics.finish(STATUS_ERROR, e)
+                # Émettre le signal d'erreur
+                self.signals.error.emit(str(e))
\ No newline at end of file
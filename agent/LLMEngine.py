@@ -0,0 +1,381 @@
+"""
+Moteur LLM asynchrone partagé par toute l'application.
+
+Une seule boucle asyncio, exécutée dans un thread d'arrière-plan, multiplexe toutes
+les requêtes (chat, documentation, refactorisation, analyse) avec AsyncOpenAI.
+Les résultats reviennent vers Qt via les signaux d'un LLMRequest : l'objet est créé
+dans le thread appelant, donc les émissions depuis la boucle sont livrées en file
+d'attente dans ce thread. Des dizaines de flux simultanés coûtent ainsi un seul thread.
+"""
+
+import asyncio
+import json
+import threading
+
+from PySide6.QtCore import QObject, Signal
+
+from services.llm_clients import get_async_client, aclose_async_clients, stream_usage_options
+from services.llm_router import get_router
+from services.llm_cache import make_cache_key
+from services.cancellation import GenerationCancelled
+from services.single_flight import llm_flights
+from services.rate_limiter import call_with_retry_async, estimate_tokens
+from services.chunk_aggregator import ChunkAggregator
+from services.llm_telemetry import CallMetrics, STATUS_CANCELLED, STATUS_ERROR
+
+
+class LLMRequest(QObject):
+    partial = Signal(str)  # Émis seulement si stream=True, fragments regroupés
+    finished = Signal(str)
+    error = Signal(str)
+    cancelled = Signal()
+    throttled = Signal(float)  # attente imposée par la limitation de débit (secondes)
+    restarted = Signal()  # la réponse repart de zéro : les fragments déjà émis sont à effacer
+
+    def __init__(self, engine, messages, model, provider="openai", api_key=None,
+                 stream=True, temperature=0.7, max_tokens=1000, category="", hedge=False):
+        """
+        model=None confie le choix du fournisseur et du modèle au routeur
+        (services.llm_router) ; hedge=True double alors la requête si le premier
+        token tarde (voir LLMEngine.complete_routed).
+        """
+        super().__init__()
+        self.engine = engine
+        self.messages = messages
+        self.model = model
+        self.provider = provider
+        self.api_key = api_key
+        self.stream = stream
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.category = category  # regroupement dans la télémétrie (chat, analyse…)
+        self.hedge = hedge
+        self.future = None
+
+    def start(self):
+        """Planifie la requête sur la boucle du moteur (connecter les signaux avant)."""
+        self.future = self.engine.start(self)
+        return self
+
+    def cancel(self):
+        """
+        Annule la requête : la tâche asyncio est interrompue et le flux HTTP fermé.
+        `cancelled` est émis si la requête n'était pas déjà terminée.
+        """
+        if self.future is not None and self.future.cancel():
+            self.cancelled.emit()
+
+
+class LLMEngine:
+    # Regroupement des fragments avant leur envoi vers l'interface
+    CHUNK_FLUSH_MS = 16
+    CHUNK_FLUSH_CHARS = 256
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """Retourne le moteur partagé, en démarrant sa boucle au premier appel."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @classmethod
+    def shutdown_instance(cls):
+        """Arrête le moteur partagé s'il a été démarré (à la fermeture de l'application)."""
+        with cls._instance_lock:
+            engine, cls._instance = cls._instance, None
+        if engine is not None:
+            engine.shutdown()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._requests = set()  # garde les LLMRequest en vie jusqu'à leur fin
+        self._thread = threading.Thread(
+            target=self._run_loop, name="LLMEngine", daemon=True
+        )
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def request(self, messages, model, **kwargs) -> LLMRequest:
+        """Crée une requête ; appeler start() après avoir connecté ses signaux."""
+        return LLMRequest(self, messages, model, **kwargs)
+
+    def start(self, request: LLMRequest):
+        self._requests.add(request)
+        future = asyncio.run_coroutine_threadsafe(self._run(request), self.loop)
+        future.add_done_callback(lambda _f: self._requests.discard(request))
+        return future
+
+    def submit(self, coro):
+        """Exécute une coroutine quelconque sur la boucle du moteur (retourne un concurrent.futures.Future)."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def shutdown(self):
+        """Ferme les connexions et arrête la boucle."""
+        if not self.loop.is_running():
+            return
+        try:
+            self.submit(aclose_async_clients()).result(timeout=5)
+        except Exception as e:
+            print(f"Erreur lors de l'arrêt du moteur LLM : {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    # --- Exécution dans la boucle ---
+
+    async def _run(self, request: LLMRequest):
+        key = make_cache_key(
+            request.model,
+            json.dumps(request.messages, ensure_ascii=False),
+            request.temperature,
+        )
+        while True:
+            flight, is_leader = llm_flights.acquire(key)
+            if is_leader:
+                break
+
+            # S'attacher à la requête identique en cours sans bloquer la boucle
+            done = self.loop.create_future()
+            metrics = CallMetrics(
+                "LLMEngine", request.provider, request.model, request.category, request.messages
+            )
+            metrics.coalesced = True
+
+            def on_done(result, error, done=done):
+                self.loop.call_soon_threadsafe(
+                    lambda: done.done() or done.set_result((result, error))
+                )
+
+            listener = flight.subscribe(request.partial.emit if request.stream else None, on_done)
+            try:
+                result, error = await done
+            except asyncio.CancelledError:
+                flight.unsubscribe(listener)
+                metrics.finish(STATUS_CANCELLED)
+                raise
+            if isinstance(error, GenerationCancelled):
+                # Seul le leader a été annulé : relancer la requête pour notre compte,
+                # après avoir fait effacer les fragments déjà transmis
+                metrics.discard_output()
+                metrics.finish(STATUS_CANCELLED)
+                if request.stream:
+                    request.restarted.emit()
+                continue
+            if error is not None:
+                metrics.finish(STATUS_ERROR, error)
+                request.error.emit(str(error))
+            else:
+                metrics.add_output(result)
+                metrics.finish()
+                request.finished.emit(result)
+            return
+
+        try:
+            reply = await self._call_model(request, flight)
+        except asyncio.CancelledError:
+            llm_flights.abort(flight, GenerationCancelled())
+            raise
+        except Exception as e:
+            llm_flights.abort(flight, e)
+            request.error.emit(str(e))
+            return
+        llm_flights.complete(flight, reply)
+        request.finished.emit(reply)
+
+    async def _call_model(self, request: LLMRequest, flight) -> str:
+        def emit_grouped(text):
+            request.partial.emit(text)
+            flight.publish(text)
+
+        if request.model is None:
+            return await self.complete_routed(
+                request.messages,
+                api_key=request.api_key,
+                hedge=request.hedge,
+                stream=request.stream,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                on_chunk=emit_grouped,
+                on_throttled=request.throttled.emit,
+                category=request.category,
+            )
+        return await self.complete(
+            request.messages,
+            request.model,
+            provider=request.provider,
+            api_key=request.api_key,
+            stream=request.stream,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens,
+            on_chunk=emit_grouped,
+            on_throttled=request.throttled.emit,
+            category=request.category,
+        )
+
+    async def complete(self, messages, model, provider="openai", api_key=None, stream=False,
+                       temperature=0.7, max_tokens=1000, on_chunk=None, on_throttled=None,
+                       source="LLMEngine", category="") -> str:
+        """
+        Appel brut au modèle, à utiliser depuis une coroutine exécutée sur la boucle du
+        moteur (ex. orchestration de plusieurs appels). Respecte la limitation de débit ;
+        en streaming, `on_chunk` reçoit les fragments regroupés. Chaque appel est
+        enregistré dans la télémétrie sous (`source`, `category`).
+        """
+        metrics = CallMetrics(source, provider, model, category, messages)
+        try:
+            reply = await self._complete(
+                metrics, messages, model, provider, api_key, stream, temperature,
+                max_tokens, on_chunk, on_throttled,
+            )
+        except asyncio.CancelledError:
+            metrics.finish(STATUS_CANCELLED)
+            raise
+        except Exception as e:
+            metrics.finish(STATUS_ERROR, e)
+            raise
+        metrics.finish()
+        return reply
+
+    async def complete_routed(self, messages, routes=None, hedge=True, api_key=None, stream=False,
+                              temperature=0.7, max_tokens=1000, on_chunk=None, on_throttled=None,
+                              source="LLMEngine", category="") -> str:
+        """
+        Appel confié au routeur : la route la plus rapide parmi les fournisseurs sains.
+
+        Avec `hedge`, si aucun premier token (ou, sans streaming, aucune réponse)
+        n'arrive avant le délai du routeur, ou si la première route échoue, la même
+        requête part vers la route suivante ; la première à produire un token gagne
+        et l'autre est annulée. `api_key` ne s'applique qu'à la route OpenAI.
+        """
+        router = get_router()
+        ranked = router.rank(routes)
+        if not ranked:
+            raise RuntimeError("Aucun fournisseur LLM configuré (clé API manquante)")
+        primary = ranked[0]
+        backup = ranked[1] if hedge and len(ranked) > 1 else None
+
+        tasks = {}  # route -> tâche asyncio
+        winner = None
+        winner_lock = threading.Lock()  # on_chunk peut être appelé hors de la boucle
+
+        def claim(route):
+            nonlocal winner
+            with winner_lock:
+                if winner is None:
+                    winner = route
+                return winner == route
+
+        def forward(route):
+            def on_part(text):
+                if not claim(route):
+                    return
+                # Premier token : annuler les autres routes
+                for other, task in list(tasks.items()):
+                    if other != route:
+                        self.loop.call_soon_threadsafe(task.cancel)
+                if on_chunk:
+                    on_chunk(text)
+            return on_part
+
+        def launch(route):
+            tasks[route] = asyncio.ensure_future(self.complete(
+                messages,
+                route.model,
+                provider=route.provider,
+                api_key=api_key if route.provider == "openai" else None,
+                stream=stream,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                on_chunk=forward(route),
+                on_throttled=on_throttled,
+                source=source,
+                category=category,
+            ))
+
+        launch(primary)
+        hedge_at = self.loop.time() + router.hedge_delay(primary) if backup else None
+        last_error = None
+        try:
+            while True:
+                if winner is not None:
+                    return await tasks[winner]
+                running = [t for t in tasks.values() if not t.done()]
+                hedge_pending = backup is not None and backup not in tasks
+                timeout = max(0.0, hedge_at - self.loop.time()) if hedge_pending else None
+                if running:
+                    await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if winner is not None:
+                    continue
+                for route, task in list(tasks.items()):
+                    if not task.done() or task.cancelled():
+                        continue
+                    if task.exception() is None and claim(route):
+                        return task.result()
+                    last_error = task.exception() or last_error
+                running = [t for t in tasks.values() if not t.done()]
+                # Doubler la requête : délai écoulé, ou première route déjà en échec
+                if hedge_pending and (not running or self.loop.time() >= hedge_at):
+                    launch(backup)
+                elif not running:
+                    raise last_error or RuntimeError("Aucune route LLM n'a abouti")
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+
+    async def _complete(self, metrics, messages, model, provider, api_key, stream, temperature,
+                        max_tokens, on_chunk, on_throttled) -> str:
+        client = get_async_client(provider, api_key)
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        # Comptes exacts de tokens dans le dernier fragment du flux
+        options = stream_usage_options(provider) if stream else {}
+
+        response = await call_with_retry_async(
+            lambda: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=stream,
+                **options
+            ),
+            provider,
+            model,
+            estimated_tokens=prompt_tokens + max_tokens,
+            on_throttled=on_throttled,
+            metrics=metrics,
+        )
+
+        if not stream:
+            metrics.set_usage(getattr(response, "usage", None))
+            if response.choices:
+                reply = (response.choices[0].message.content or "").strip()
+                metrics.add_output(reply)
+                return reply
+            return ""
+
+        aggregator = ChunkAggregator(on_chunk or (lambda _text: None), self.CHUNK_FLUSH_MS, self.CHUNK_FLUSH_CHARS)
+        reply = ""
+        try:
+            async for chunk in response:
+                if getattr(chunk, "usage", None):
+                    metrics.set_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    part = chunk.choices[0].delta.content
+                    reply += part
+                    metrics.add_output(part)
+                    aggregator.add(part)
+        except BaseException:
+            # Y compris l'annulation de la tâche (asyncio.CancelledError)
+            aggregator.discard()
+            raise
+        finally:
+            await response.close()
+        # Envoyer le texte encore en attente avant la fin
+        aggregator.close()
+        return reply
@@ -0,0 +1,220 @@
+"""
+Génération de documentation en map-reduce pour les projets qui dépassent une fenêtre de contexte.
+
+Phase « map » : le projet est découpé en morceaux (fichiers regroupés par dossier),
+chacun est résumé par un appel au modèle, avec un nombre borné d'appels simultanés.
+Les résumés sont mis en cache par empreinte du contenu : après une petite modification,
+seuls les morceaux modifiés sont ré-analysés.
+Phase « reduce » : les résumés (condensés par niveaux s'ils sont trop longs) sont
+assemblés en un document HTML final par un dernier appel, diffusé en streaming.
+
+Tout s'exécute sur la boucle du moteur LLM partagé ; les résultats reviennent en Qt
+via les signaux du job, créé dans le thread appelant.
+"""
+
+import asyncio
+
+from PySide6.QtCore import QObject, Signal
+
+from services.context_packer import (
+    chunk_budget,
+    context_budget,
+    context_window,
+    count_tokens,
+    project_overview,
+    split_into_chunks,
+)
+from services.llm_cache import make_cache_key
+from services.llm_router import get_router
+from services.llm_telemetry import CallMetrics
+from services.prompt_registry import as_messages
+
+MAP_TEMPERATURE = 0.2
+MAP_MAX_TOKENS = 800
+REDUCE_MAX_TOKENS = 4096
+REDUCE_MIN_TOKENS = 512  # en deçà, le document final serait tronqué
+PROMPT_TOKEN_MARGIN = 256  # écart entre le décompte local et celui de l'API (balises des messages)
+OVERVIEW_SHARE = 0.2  # part du budget de la phase « reduce » pour le README et l'arborescence
+
+MAP_INSTRUCTIONS = (
+    "Tu es un assistant technique chargé de préparer la documentation d'un projet logiciel. "
+    "Résume la partie du projet ci-dessous pour un rédacteur qui ne verra pas le code : "
+    "rôle de chaque fichier, classes et fonctions importantes, interactions avec le reste "
+    "du projet, dépendances externes et choix de conception notables. "
+    "Réponds en Markdown concis, sans recopier le code."
+)
+
+CONDENSE_INSTRUCTIONS = (
+    "Tu es un assistant technique. Fusionne les résumés de modules ci-dessous en un seul "
+    "résumé structuré et concis, sans perdre les interactions entre modules ni les choix "
+    "de conception. Réponds en Markdown."
+)
+
+
+class MapReduceDocJob(QObject):
+    partial = Signal(str)  # fragments du document final (phase reduce, en streaming)
+    finished = Signal(str)  # document HTML complet
+    error = Signal(str)
+    cancelled = Signal()
+    progress = Signal(int, int)  # morceaux résumés, total
+    throttled = Signal(float)  # attente imposée par la limitation de débit (secondes)
+
+    def __init__(self, engine, index, model, build_prompt, api_key=None, cache=None,
+                 max_workers=4, stream=True, provider="openai"):
+        """
+        Args:
+            engine (LLMEngine): Moteur partagé qui exécute les appels
+            index (ProjectIndex): Index du projet à documenter
+            model (str): Modèle utilisé pour les deux phases (None : choisi par le routeur)
+            build_prompt (callable): Construit le prompt final (texte ou messages) à partir du contexte assemblé
+            cache (LLMResponseCache): Cache des résumés de morceaux (optionnel)
+            max_workers (int): Nombre maximal d'appels « map » simultanés
+            provider (str): Fournisseur du modèle
+        """
+        super().__init__()
+        if model is None:
+            # Une seule route pour tout le job : les résumés en cache restent valables
+            route = get_router().choose()
+            provider, model = route.provider, route.model
+        self.engine = engine
+        self.index = index
+        self.provider = provider
+        self.model = model
+        self.build_prompt = build_prompt
+        # La clé fournie est celle d'OpenAI ; les autres fournisseurs lisent leur variable d'environnement
+        self.api_key = api_key if provider == "openai" else None
+        self.cache = cache
+        self.max_workers = max(1, int(max_workers))
+        self.stream = stream
+        self.future = None
+        self.cache_hits = 0
+
+    def start(self):
+        """Planifie le job sur la boucle du moteur (connecter les signaux avant)."""
+        self.future = self.engine.submit(self._run())
+        return self
+
+    def cancel(self):
+        """Interrompt les appels en cours ; `cancelled` est émis si le job n'était pas terminé."""
+        if self.future is not None and self.future.cancel():
+            self.cancelled.emit()
+
+    # --- Exécution dans la boucle du moteur ---
+
+    async def _run(self):
+        try:
+            html = await self._generate()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+        self.finished.emit(html)
+
+    async def _summarize(self, instructions, content, semaphore, category="doc:map"):
+        """Un appel de synthèse, servi depuis le cache si le contenu n'a pas changé."""
+        messages = [
+            {"role": "system", "content": instructions},
+            {"role": "user", "content": content},
+        ]
+        key = make_cache_key(self.model, instructions + "\n" + content, MAP_TEMPERATURE)
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                self.cache_hits += 1
+                metrics = CallMetrics(type(self).__name__, self.provider, self.model, category, messages)
+                metrics.cache_hit = True
+                metrics.add_output(cached)
+                metrics.finish()
+                return cached
+
+        async with semaphore:
+            summary = await self.engine.complete(
+                messages,
+                self.model,
+                provider=self.provider,
+                api_key=self.api_key,
+                temperature=MAP_TEMPERATURE,
+                max_tokens=MAP_MAX_TOKENS,
+                on_throttled=self.throttled.emit,
+                source=type(self).__name__,
+                category=category,
+            )
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, key, self.model, summary)
+        return summary
+
+    def _reduce_max_tokens(self, messages) -> int:
+        """
+        Longueur de réponse permise par ce qui reste de la fenêtre après le prompt final.
+
+        Raises:
+            ValueError: si le prompt ne laisse pas la place d'un document complet
+        """
+        prompt_tokens = sum(count_tokens(m["content"], self.model) for m in messages)
+        available = context_window(self.model) - prompt_tokens - PROMPT_TOKEN_MARGIN
+        if available < REDUCE_MIN_TOKENS:
+            raise ValueError(
+                f"Prompt final trop long pour {self.model} ({prompt_tokens} tokens) : "
+                f"moins de {REDUCE_MIN_TOKENS} tokens disponibles pour la réponse"
+            )
+        return min(REDUCE_MAX_TOKENS, available)
+
+    async def _generate(self):
+        await asyncio.to_thread(self.index.refresh)
+        chunks = await asyncio.to_thread(split_into_chunks, self.index, self.model)
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        # Phase « map » : un résumé par morceau
+        done = 0
+        self.progress.emit(0, len(chunks))
+
+        async def map_chunk(chunk):
+            nonlocal done
+            summary = await self._summarize(MAP_INSTRUCTIONS, chunk.text, semaphore)
+            done += 1
+            self.progress.emit(done, len(chunks))
+            return f"## {chunk.name}\n{summary}"
+
+        summaries = list(await asyncio.gather(*(map_chunk(c) for c in chunks)))
+
+        # Condensation par niveaux tant que les résumés ne tiennent pas dans le budget
+        budget = context_budget(self.model)
+        summaries_budget = int(budget * (1 - OVERVIEW_SHARE))
+        group_budget = chunk_budget(self.model)
+        while len(summaries) > 1 and count_tokens("\n\n".join(summaries), self.model) > summaries_budget:
+            groups = []
+            current, current_tokens = [], 0
+            for summary in summaries:
+                tokens = count_tokens(summary, self.model)
+                if current and current_tokens + tokens > group_budget:
+                    groups.append(current)
+                    current, current_tokens = [], 0
+                current.append(summary)
+                current_tokens += tokens
+            groups.append(current)
+            if len(groups) == len(summaries):
+                break  # chaque résumé dépasse déjà la taille d'un groupe
+            summaries = list(await asyncio.gather(
+                *(self._summarize(CONDENSE_INSTRUCTIONS, "\n\n".join(g), semaphore, "doc:condense") for g in groups)
+            ))
+
+        # Phase « reduce » : document final
+        overview = await asyncio.to_thread(
+            project_overview, self.index, self.model, int(budget * OVERVIEW_SHARE)
+        )
+        context = f"{overview}\n\n🧠 Résumés des modules :\n\n" + "\n\n".join(summaries)
+        messages = as_messages(self.build_prompt(context))
+        return await self.engine.complete(
+            messages,
+            self.model,
+            provider=self.provider,
+            api_key=self.api_key,
+            stream=self.stream,
+            temperature=0.7,
+            max_tokens=self._reduce_max_tokens(messages),
+            on_chunk=self.partial.emit,
+            on_throttled=self.throttled.emit,
+            source=type(self).__name__,
+            category="doc:reduce",
+        )
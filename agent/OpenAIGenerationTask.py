@@ -1,47 +1,169 @@
-import openai
-import os
 from PySide6.QtCore import QRunnable, QObject, Signal
+from services.llm_clients import get_client, stream_usage_options
+from services.llm_router import get_router
+from services.llm_cache import make_cache_key
+from services.single_flight import llm_flights
+from services.cancellation import CancellationToken, GenerationCancelled
+from services.rate_limiter import call_with_retry, estimate_tokens
+from services.generation_progress import StreamProgress, STREAM_PROGRESS_START
+from services.chunk_aggregator import ChunkAggregator
+from services.prompt_registry import as_messages, prompt_key, prompt_text
+from services.llm_telemetry import CallMetrics, STATUS_CANCELLED, STATUS_ERROR
 
 # --- Signaux pour génération IA ---
 class GenerationSignals(QObject):
     finished = Signal(str, str)  # chemin complet, contenu HTML
     error = Signal(str)
+    cancelled = Signal(str)  # chemin complet de la génération annulée
     progress = Signal(int)  # pourcentage de progression (0-100)
-
-openai.api_key = os.getenv("OPENAI_API_KEY")
+    throttled = Signal(float)  # attente imposée par la limitation de débit (secondes)
+    stats = Signal(float, float, int)  # TTFT (s), débit (tokens/s), tokens reçus
 
 # --- Tâche asynchrone ---
 class OpenAIGenerationTask(QRunnable):
-    def __init__(self, full_path, prompt):
+    # Taille de réponse attendue, utilisée pour réserver le débit en tokens/min
+    EXPECTED_COMPLETION_TOKENS = 1500
+    # Fréquence maximale des mises à jour de progression envoyées à l'interface
+    CHUNK_FLUSH_MS = 16
+    CHUNK_FLUSH_CHARS = 256
+
+    def __init__(self, full_path, prompt, model="gpt-4", temperature=0.7, cache=None, use_cache=True,
+                 expected_tokens=None, max_tokens=None, cancel_token=None, category="", provider="openai"):
         super().__init__()
         self.full_path = full_path
-        self.prompt = prompt
+        self.prompt = prompt  # texte libre ou messages (services.prompt_registry)
+        if model is None:
+            # Fournisseur et modèle choisis d'après les latences observées
+            route = get_router().choose()
+            provider, model = route.provider, route.model
+        self.provider = provider
+        self.model = model
+        self.temperature = temperature
+        self.cache = cache  # LLMResponseCache optionnel
+        self.use_cache = use_cache  # False pour forcer un nouvel appel au modèle
+        self.cancel_token = cancel_token or CancellationToken()
+        self.max_tokens = max_tokens  # limite envoyée à l'API (None = pas de limite)
+        # Longueur attendue pour la progression : max_tokens, sinon estimation apprise
+        self.expected_tokens = max_tokens or expected_tokens or self.EXPECTED_COMPLETION_TOKENS
+        self.category = category  # regroupement dans la télémétrie (ex. type de document)
         self.signals = GenerationSignals()
+        self.metrics = None
+
+    def _generate(self):
+        """Appelle réellement le modèle et retourne le contenu généré"""
+        # Récupérer le client OpenAI partagé
+        self.cancel_token.raise_if_cancelled()
+        client = get_client(self.provider)
+        tracker = StreamProgress(self.expected_tokens)
+        self.signals.progress.emit(30)
+
+        # Envoyer la requête à l'API ; le flux n'est pas exposé mais sert à mesurer la progression
+        options = {"max_tokens": self.max_tokens} if self.max_tokens else {}
+        stream = call_with_retry(
+            lambda: client.chat.completions.create(
+                model=self.model,
+                messages=as_messages(self.prompt),
+                temperature=self.temperature,
+                stream=True,
+                **stream_usage_options(self.provider),  # comptes exacts dans le dernier fragment
+                **options
+            ),
+            self.provider,
+            self.model,
+            estimated_tokens=estimate_tokens(prompt_text(self.prompt)) + self.expected_tokens,
+            on_throttled=self.signals.throttled.emit,
+            cancel_token=self.cancel_token,
+            metrics=self.metrics,
+        )
+        # L'annulation ferme immédiatement le flux HTTP
+        self.cancel_token.register(stream.close)
+        self.signals.progress.emit(STREAM_PROGRESS_START)
+
+        # Assembler la réponse en suivant les tokens reçus ; la progression
+        # n'est émise qu'au rythme du regroupement, pas à chaque token
+        def emit_progress(_text):
+            self.signals.progress.emit(tracker.percent())
+            self.signals.stats.emit(tracker.ttft or 0.0, tracker.tokens_per_second, tracker.tokens)
+
+        aggregator = ChunkAggregator(emit_progress, self.CHUNK_FLUSH_MS, self.CHUNK_FLUSH_CHARS)
+        parts = []
+        try:
+            for chunk in stream:
+                self.cancel_token.raise_if_cancelled()
+                if getattr(chunk, "usage", None):
+                    self.metrics.set_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    part = chunk.choices[0].delta.content
+                    parts.append(part)
+                    self.metrics.add_output(part)
+                    tracker.add(part)
+                    aggregator.add(part)
+        finally:
+            aggregator.close()
+            self.cancel_token.unregister(stream.close)
+            stream.close()
+
+        # Un flux fermé par l'annulation peut se terminer sans erreur
+        self.cancel_token.raise_if_cancelled()
+        # Traiter la réponse
+        return "".join(parts).strip()
 
     def run(self):
         try:
             # Indiquer que la génération commence
             self.signals.progress.emit(10)
-            
-            # Initialiser le client OpenAI
-            client = openai.OpenAI()
-            self.signals.progress.emit(30)
-            
-            # Envoyer la requête à l'API
-            self.signals.progress.emit(50)
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": self.prompt}],
-                temperature=0.7
+            self.metrics = CallMetrics(
+                type(self).__name__, self.provider, self.model, self.category, self.prompt
             )
-            self.signals.progress.emit(80)
-            
-            # Traiter la réponse
-            html = response.choices[0].message.content.strip()
+
+            # Réponse déjà en cache pour ce (modèle, prompt, température)
+            cache_key = make_cache_key(self.model, prompt_key(self.prompt), self.temperature)
+            if self.cache is not None and self.use_cache:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    self.metrics.cache_hit = True
+                    self.metrics.add_output(cached)
+                    self.signals.finished.emit(self.full_path, cached)
+                    self.signals.progress.emit(100)
+                    self.metrics.finish()
+                    return
+
+            # S'attacher à une requête identique déjà en cours, le cas échéant
+            while True:
+                flight, is_leader = llm_flights.acquire(cache_key)
+                self.metrics.coalesced = not is_leader
+                if is_leader:
+                    try:
+                        html = self._generate()
+                    except Exception as e:
+                        if self.cancel_token.is_cancelled:
+                            e = GenerationCancelled()
+                        llm_flights.abort(flight, e)
+                        raise
+                    llm_flights.complete(flight, html)
+                    if self.cache is not None:
+                        self.cache.put(cache_key, self.model, html)
+                    break
+
+                try:
+                    html = flight.wait(cancel_token=self.cancel_token)
+                    self.metrics.add_output(html)
+                    break
+                except GenerationCancelled:
+                    # Seul le leader a été annulé : relancer la requête pour notre compte
+                    if self.cancel_token.is_cancelled:
+                        raise
             self.signals.progress.emit(95)
-            
+
             # Émettre le signal de fin
             self.signals.finished.emit(self.full_path, html)
             self.signals.progress.emit(100)
+            self.metrics.finish()
         except Exception as e:
-            self.signals.error.emit(str(e))
+            # Une erreur de lecture provoquée par la fermeture du flux n'en est pas une
+            if self.cancel_token.is_cancelled:
+                self.metrics.finish(STATUS_CANCELLED)
+                self.signals.cancelled.emit(self.full_path)
+            else:
+                self.metrics.finish(STATUS_ERROR, e)
+                self.signals.error.emit(str(e))
@@ -1,70 +1,235 @@
-import openai
-import os
 from PySide6.QtCore import QRunnable, QObject, Signal
+from services.llm_clients import get_client, stream_usage_options
+from services.llm_router import get_router
+from services.llm_cache import make_cache_key
+from services.single_flight import llm_flights
+from services.cancellation import CancellationToken, GenerationCancelled
+from services.rate_limiter import call_with_retry, estimate_tokens
+from services.generation_progress import StreamProgress, STREAM_PROGRESS_START
+from services.chunk_aggregator import ChunkAggregator
+from services.prompt_registry import as_messages, prompt_key, prompt_text
+from services.llm_telemetry import CallMetrics, STATUS_CANCELLED, STATUS_ERROR
 
 # --- Signaux pour génération IA en streaming ---
 class StreamingSignals(QObject):
     finished = Signal(str, str)  # chemin complet, contenu HTML final
     error = Signal(str)
+    failed = Signal(str, str)  # chemin complet, message d'erreur
     progress = Signal(int)  # pourcentage de progression (0-100)
     chunk = Signal(str)  # nouveau morceau de texte généré
-
-openai.api_key = os.getenv("OPENAI_API_KEY")
+    cancelled = Signal(str)  # chemin complet de la génération annulée
+    throttled = Signal(float)  # attente imposée par la limitation de débit (secondes)
+    stats = Signal(float, float, int)  # TTFT (s), débit (tokens/s), tokens reçus
+    restarted = Signal(str)  # chemin complet : les morceaux déjà émis sont à effacer
 
 # --- Tâche asynchrone en mode streaming ---
 class OpenAIStreamingTask(QRunnable):
-    def __init__(self, full_path, prompt):
+    # Taille des morceaux lors du rejeu d'une réponse en cache
+    REPLAY_CHUNK_SIZE = 256
+    # Taille de réponse attendue, utilisée pour réserver le débit en tokens/min
+    EXPECTED_COMPLETION_TOKENS = 1500
+    # Regroupement des fragments avant leur envoi vers l'interface
+    CHUNK_FLUSH_MS = 16
+    CHUNK_FLUSH_CHARS = 256
+
+    def __init__(
+        self,
+        full_path,
+        prompt,
+        model="gpt-4",
+        temperature=0.7,
+        cache=None,
+        use_cache=True,
+        cancel_token=None,
+        expected_tokens=None,
+        max_tokens=None,
+        category="",
+        provider="openai",
+    ):
         super().__init__()
         self.full_path = full_path
-        self.prompt = prompt
+        self.prompt = prompt  # texte libre ou messages (services.prompt_registry)
+        if model is None:
+            # Fournisseur et modèle choisis d'après les latences observées
+            route = get_router().choose()
+            provider, model = route.provider, route.model
+        self.provider = provider
+        self.model = model
+        self.temperature = temperature
+        self.cache = cache  # LLMResponseCache optionnel
+        self.use_cache = use_cache  # False pour forcer un nouvel appel au modèle
+        self.cancel_token = cancel_token or CancellationToken()
+        self.max_tokens = max_tokens  # limite envoyée à l'API (None = pas de limite)
+        # Longueur attendue pour la progression : max_tokens, sinon estimation apprise
+        self.expected_tokens = max_tokens or expected_tokens or self.EXPECTED_COMPLETION_TOKENS
+        self.category = category  # regroupement dans la télémétrie (ex. type de document)
         self.signals = StreamingSignals()
         self.accumulated_text = ""
+        self.progress_tracker = None
+        self.metrics = None
 
-    def run(self):
+    def _track(self, part):
+        """Comptabilise un fragment reçu et émet progression et statistiques"""
+        self.progress_tracker.add(part)
+        self._emit_progress()
+
+    def _emit_progress(self):
+        tracker = self.progress_tracker
+        self.signals.progress.emit(tracker.percent())
+        self.signals.stats.emit(tracker.ttft or 0.0, tracker.tokens_per_second, tracker.tokens)
+
+    def _replay_cached(self, text):
+        """Rejoue une réponse en cache sous forme de flux synthétique rapide"""
+        # La longueur exacte est connue : la progression suit le texte rejoué
+        self.progress_tracker = StreamProgress(estimate_tokens(text))
+        for start in range(0, len(text), self.REPLAY_CHUNK_SIZE):
+            part = text[start:start + self.REPLAY_CHUNK_SIZE]
+            self.signals.chunk.emit(part)
+            self.accumulated_text += part
+            self._track(part)
+        self.metrics.add_output(text)
+        self.signals.finished.emit(self.full_path, self.accumulated_text.strip())
+        self.signals.progress.emit(100)
+
+    def _stream(self, flight):
+        """Appelle réellement le modèle en streaming et diffuse chaque morceau aux abonnés"""
+        # Récupérer le client OpenAI partagé
+        self.cancel_token.raise_if_cancelled()
+        client = get_client(self.provider)
+        self.signals.progress.emit(20)
+
+        # Envoyer la requête à l'API en mode streaming
+        self.signals.progress.emit(30)
+        options = {"max_tokens": self.max_tokens} if self.max_tokens else {}
+        stream = call_with_retry(
+            lambda: client.chat.completions.create(
+                model=self.model,
+                messages=as_messages(self.prompt),
+                temperature=self.temperature,
+                stream=True,  # Activer le mode streaming
+                **stream_usage_options(self.provider),  # comptes exacts dans le dernier fragment
+                **options
+            ),
+            self.provider,
+            self.model,
+            estimated_tokens=estimate_tokens(prompt_text(self.prompt)) + self.expected_tokens,
+            on_throttled=self.signals.throttled.emit,
+            cancel_token=self.cancel_token,
+            metrics=self.metrics,
+        )
+        # L'annulation ferme immédiatement le flux HTTP
+        self.cancel_token.register(stream.close)
+
+        self.signals.progress.emit(STREAM_PROGRESS_START)
+
+        # Les fragments sont regroupés avant d'être émis vers l'interface et les abonnés
+        def emit_grouped(text):
+            self.signals.chunk.emit(text)
+            flight.publish(text)
+            self._emit_progress()
+
+        aggregator = ChunkAggregator(emit_grouped, self.CHUNK_FLUSH_MS, self.CHUNK_FLUSH_CHARS)
+
+        # Traiter le flux de réponses
         try:
-            # Indiquer que la génération commence
-            self.signals.progress.emit(10)
-            
-            # Initialiser le client OpenAI
-            client = openai.OpenAI()
-            self.signals.progress.emit(20)
-            
-            # Envoyer la requête à l'API en mode streaming
-            self.signals.progress.emit(30)
-            stream = client.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": self.prompt}],
-                temperature=0.7,
-                stream=True  # Activer le mode streaming
-            )
-            
-            # Initialiser le compteur de progression
-            self.signals.progress.emit(40)
-            chunk_count = 0
-            estimated_total_chunks = 100  # Estimation du nombre total de morceaux
-            
-            # Traiter le flux de réponses
             for chunk in stream:
+                self.cancel_token.raise_if_cancelled()
+                if getattr(chunk, "usage", None):
+                    self.metrics.set_usage(chunk.usage)
                 if chunk.choices and len(chunk.choices) > 0:
                     # Extraire le texte du chunk
                     delta = chunk.choices[0].delta
                     if hasattr(delta, 'content') and delta.content:
-                        # Émettre le nouveau morceau
-                        self.signals.chunk.emit(delta.content)
                         # Accumuler le texte
                         self.accumulated_text += delta.content
-                
-                # Mettre à jour la progression
-                chunk_count += 1
-                progress = min(40 + int(50 * chunk_count / estimated_total_chunks), 90)
-                self.signals.progress.emit(progress)
-            
+                        self.metrics.add_output(delta.content)
+                        # Progression d'après les tokens reçus
+                        self.progress_tracker.add(delta.content)
+                        aggregator.add(delta.content)
+            # Un flux fermé par l'annulation peut se terminer sans erreur
+            self.cancel_token.raise_if_cancelled()
+        except Exception:
+            aggregator.discard()
+            raise
+        finally:
+            self.cancel_token.unregister(stream.close)
+
+        # Envoyer le texte encore en attente avant la fin
+        aggregator.close()
+        return self.accumulated_text.strip()
+
+    def _on_shared_chunk(self, part):
+        """Reçoit un morceau produit par une requête identique déjà en cours"""
+        self.signals.chunk.emit(part)
+        self.accumulated_text += part
+        self.metrics.add_output(part)
+        self._track(part)
+
+    def run(self):
+        try:
+            # Indiquer que la génération commence
+            self.signals.progress.emit(10)
+            # Le TTFT est mesuré depuis l'envoi de la requête, attente de débit comprise
+            self.progress_tracker = StreamProgress(self.expected_tokens)
+            self.metrics = CallMetrics(
+                type(self).__name__, self.provider, self.model, self.category, self.prompt
+            )
+
+            # Réponse déjà en cache pour ce (modèle, prompt, température)
+            cache_key = make_cache_key(self.model, prompt_key(self.prompt), self.temperature)
+            if self.cache is not None and self.use_cache:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    self.metrics.cache_hit = True
+                    self._replay_cached(cached)
+                    self.metrics.finish()
+                    return
+
+            # S'attacher à une requête identique déjà en cours, le cas échéant
+            while True:
+                flight, is_leader = llm_flights.acquire(cache_key)
+                self.metrics.coalesced = not is_leader
+                if is_leader:
+                    try:
+                        html = self._stream(flight)
+                    except Exception as e:
+                        if self.cancel_token.is_cancelled:
+                            e = GenerationCancelled()
+                        llm_flights.abort(flight, e)
+                        raise
+                    llm_flights.complete(flight, html)
+                    if self.cache is not None:
+                        self.cache.put(cache_key, self.model, html)
+                    break
+
+                self.signals.progress.emit(STREAM_PROGRESS_START)
+                try:
+                    html = flight.wait(on_chunk=self._on_shared_chunk, cancel_token=self.cancel_token)
+                    break
+                except GenerationCancelled:
+                    # Seul le leader a été annulé : relancer la requête pour notre compte
+                    if self.cancel_token.is_cancelled:
+                        raise
+                    # Repartir de zéro : texte, progression et affichage déjà reçus sont abandonnés
+                    self.accumulated_text = ""
+                    self.metrics.discard_output()
+                    self.progress_tracker = StreamProgress(self.expected_tokens)
+                    self.signals.restarted.emit(self.full_path)
+
             # Finaliser la génération
             self.signals.progress.emit(95)
-            
+
             # Émettre le signal de fin avec le texte complet
-            self.signals.finished.emit(self.full_path, self.accumulated_text.strip())
+            self.signals.finished.emit(self.full_path, html)
             self.signals.progress.emit(100)
-            
+            self.metrics.finish()
+
         except Exception as e:
-            self.signals.error.emit(str(e))
+            # Une erreur de lecture provoquée par la fermeture du flux n'en est pas une
+            if self.cancel_token.is_cancelled:
+                self.metrics.finish(STATUS_CANCELLED)
+                self.signals.cancelled.emit(self.full_path)
+            else:
+                self.metrics.finish(STATUS_ERROR, e)
+                self.signals.error.emit(str(e))
+                self.signals.failed.emit(self.full_path, str(e))
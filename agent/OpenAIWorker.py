@@ -1,53 +1,143 @@
+import json
+
 from PySide6.QtCore import QObject, Signal, Slot
-import openai
+from services.llm_clients import get_client
+from services.llm_cache import make_cache_key
+from services.single_flight import llm_flights
+from services.cancellation import CancellationToken, GenerationCancelled
+from services.rate_limiter import call_with_retry, estimate_tokens
+from services.chunk_aggregator import ChunkAggregator
+from services.llm_telemetry import CallMetrics, STATUS_CANCELLED, STATUS_ERROR
 
 
 class OpenAIWorker(QObject):
-    partial = Signal(str)   # Emis seulement si stream=True
+    partial = Signal(str)   # Emis seulement si stream=True, fragments regroupés
     finished = Signal(str)
     error = Signal(str)
+    cancelled = Signal()
+    throttled = Signal(float)  # attente imposée par la limitation de débit (secondes)
+    restarted = Signal()  # la réponse repart de zéro : les fragments déjà émis sont à effacer
+
+    # Regroupement des fragments avant leur envoi vers l'interface
+    CHUNK_FLUSH_MS = 16
+    CHUNK_FLUSH_CHARS = 256
 
-    def __init__(self, api_key, model, messages, stream=True):
+    def __init__(self, api_key, model, messages, stream=True, cancel_token=None, category="chat"):
         super().__init__()
         self.api_key = api_key
         self.model = model
         self.messages = messages
         self.stream = stream
+        self.cancel_token = cancel_token or CancellationToken()
+        self.category = category  # regroupement dans la télémétrie
+        self.metrics = None
 
-    @Slot()
-    def run(self):
-        try:
-            client = openai.OpenAI(api_key=self.api_key)
-            reply = ""
+    def cancel(self):
+        """Annule la requête ; peut être appelée depuis n'importe quel thread"""
+        self.cancel_token.cancel()
 
-            if self.stream:
-                stream_response = client.chat.completions.create(
+    def _request(self, flight):
+        """Appelle réellement le modèle et diffuse les fragments aux abonnés"""
+        client = get_client("openai", self.api_key)
+        reply = ""
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in self.messages)
+
+        def create(stream):
+            return call_with_retry(
+                lambda: client.chat.completions.create(
                     model=self.model,
                     messages=self.messages,
                     temperature=0.7,
                     max_tokens=1000,
-                    stream=True
-                )
+                    stream=stream
+                ),
+                "openai",
+                self.model,
+                estimated_tokens=prompt_tokens + 1000,
+                on_throttled=self.throttled.emit,
+                cancel_token=self.cancel_token,
+                metrics=self.metrics,
+            )
+
+        if self.stream:
+            stream_response = create(stream=True)
+            # L'annulation ferme immédiatement le flux HTTP
+            self.cancel_token.register(stream_response.close)
+
+            def emit_grouped(text):
+                self.partial.emit(text)
+                flight.publish(text)
 
+            aggregator = ChunkAggregator(emit_grouped, self.CHUNK_FLUSH_MS, self.CHUNK_FLUSH_CHARS)
+            try:
                 for chunk in stream_response:
+                    self.cancel_token.raise_if_cancelled()
                     if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
                         part = chunk.choices[0].delta.content
                         reply += part
-                        self.partial.emit(part)
+                        self.metrics.add_output(part)
+                        aggregator.add(part)
+            except Exception:
+                aggregator.discard()
+                raise
+            finally:
+                self.cancel_token.unregister(stream_response.close)
+            # Envoyer le texte encore en attente avant la fin
+            aggregator.close()
+        else:
+            response = create(stream=False)
+            self.metrics.set_usage(getattr(response, "usage", None))
+            if response.choices:
+                reply = response.choices[0].message.content.strip()
+                self.metrics.add_output(reply)
             else:
-                response = client.chat.completions.create(
-                    model=self.model,
-                    messages=self.messages,
-                    temperature=0.7,
-                    max_tokens=1000,
-                    stream=False
-                )
-                if response.choices:
-                    reply = response.choices[0].message.content.strip()
-                else:
-                    reply = "" # Ou gérer l'absence de réponse
+                reply = "" # Ou gérer l'absence de réponse
+
+        self.cancel_token.raise_if_cancelled()
+        return reply
+
+    @Slot()
+    def run(self):
+        try:
+            # S'attacher à une requête identique déjà en cours, le cas échéant
+            key = make_cache_key(self.model, json.dumps(self.messages, ensure_ascii=False), 0.7)
+            self.metrics = CallMetrics(
+                type(self).__name__, "openai", self.model, self.category, self.messages
+            )
+            while True:
+                flight, is_leader = llm_flights.acquire(key)
+                self.metrics.coalesced = not is_leader
+                if is_leader:
+                    try:
+                        reply = self._request(flight)
+                    except Exception as e:
+                        if self.cancel_token.is_cancelled:
+                            e = GenerationCancelled()
+                        llm_flights.abort(flight, e)
+                        raise
+                    llm_flights.complete(flight, reply)
+                    break
+
+                on_chunk = self.partial.emit if self.stream else None
+                try:
+                    reply = flight.wait(on_chunk=on_chunk, cancel_token=self.cancel_token)
+                    self.metrics.add_output(reply)
+                    break
+                except GenerationCancelled:
+                    # Seul le leader a été annulé : relancer la requête pour notre compte
+                    if self.cancel_token.is_cancelled:
+                        raise
+                    self.metrics.discard_output()
+                    if self.stream:
+                        self.restarted.emit()
 
             self.finished.emit(reply)
+            self.metrics.finish()
 
         except Exception as e:
-            self.error.emit(str(e))
+            if self.cancel_token.is_cancelled:
+                self.metrics.finish(STATUS_CANCELLED)
+                self.cancelled.emit()
+            else:
+                self.metrics.finish(STATUS_ERROR, e)
+                self.error.emit(str(e))
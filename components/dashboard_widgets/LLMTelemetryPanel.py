@@ -0,0 +1,163 @@
+import time
+
+from PySide6.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QPushButton,
+    QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView,
+)
+from PySide6.QtCore import Qt, QTimer
+
+from services.llm_telemetry import get_telemetry
+
+
+class _NumericItem(QTableWidgetItem):
+    """Cellule affichant un texte formaté mais triée sur sa valeur numérique."""
+
+    def __init__(self, text, value):
+        super().__init__(text)
+        self.setData(Qt.ItemDataRole.UserRole, value)
+
+    def __lt__(self, other):
+        mine = self.data(Qt.ItemDataRole.UserRole)
+        theirs = other.data(Qt.ItemDataRole.UserRole)
+        if mine is None or theirs is None:
+            return theirs is not None
+        return mine < theirs
+
+
+class LLMTelemetryPanel(QWidget):
+    """
+    Tableau de bord des appels LLM : latences et débit par modèle et par type de document,
+    calculés depuis la table de télémétrie (services.llm_telemetry).
+    """
+
+    # (libellé, durée en secondes ; None = tout l'historique)
+    PERIODS = [
+        ("Dernière heure", 3600),
+        ("24 heures", 86400),
+        ("7 jours", 7 * 86400),
+        ("Tout", None),
+    ]
+    GROUPINGS = [
+        ("Modèle et type de document", ("model", "category")),
+        ("Modèle", ("model",)),
+        ("Fournisseur et modèle", ("provider", "model")),
+        ("Type de document", ("category",)),
+        ("Composant", ("source",)),
+        ("Modèle et version du prompt", ("model", "prompt_version")),
+    ]
+    # (libellé, clé du résumé, format)
+    COLUMNS = [
+        ("Appels", "calls", "{:d}"),
+        ("Erreurs", "errors", "{:d}"),
+        ("Abandons client", "client_aborted", "{:d}"),
+        ("Cache / partagés", "cache_hits", "{:d}"),
+        ("Retries", "retries", "{:d}"),
+        ("TTFT p50 (s)", "ttft_p50", "{:.2f}"),
+        ("TTFT p90 (s)", "ttft_p90", "{:.2f}"),
+        ("Latence p50 (s)", "latency_p50", "{:.1f}"),
+        ("Latence p90 (s)", "latency_p90", "{:.1f}"),
+        ("Latence p99 (s)", "latency_p99", "{:.1f}"),
+        ("Tokens/s p50", "tokens_per_second_p50", "{:.0f}"),
+        ("Attente p90 (s)", "queue_wait_p90", "{:.1f}"),
+        ("Prompt en cache", "cached_ratio", "{:.0%}"),
+        ("Coût ($)", "cost", "{:.4f}"),
+    ]
+    REFRESH_INTERVAL_MS = 10000
+
+    def __init__(self, telemetry=None, parent=None):
+        super().__init__(parent)
+        self.telemetry = telemetry
+
+        main_layout = QVBoxLayout(self)
+
+        title_label = QLabel("Performances des appels LLM")
+        title_label.setStyleSheet("font-size: 16px; font-weight: bold; margin-bottom: 6px;")
+        main_layout.addWidget(title_label)
+
+        # Filtres
+        filters_layout = QHBoxLayout()
+        filters_layout.addWidget(QLabel("Période :"))
+        self.period_combo = QComboBox()
+        for label, seconds in self.PERIODS:
+            self.period_combo.addItem(label, seconds)
+        self.period_combo.setCurrentIndex(1)
+        filters_layout.addWidget(self.period_combo)
+
+        filters_layout.addWidget(QLabel("Regrouper par :"))
+        self.grouping_combo = QComboBox()
+        for label, _group_by in self.GROUPINGS:
+            self.grouping_combo.addItem(label)
+        filters_layout.addWidget(self.grouping_combo)
+        filters_layout.addStretch(1)
+
+        self.refresh_button = QPushButton("Actualiser")
+        filters_layout.addWidget(self.refresh_button)
+        main_layout.addLayout(filters_layout)
+
+        self.table = QTableWidget()
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSortingEnabled(True)
+        self.table.verticalHeader().setVisible(False)
+        main_layout.addWidget(self.table, 1)
+
+        self.totals_label = QLabel()
+        self.totals_label.setStyleSheet("color: #6b7280;")
+        main_layout.addWidget(self.totals_label)
+
+        self.period_combo.currentIndexChanged.connect(self.refresh)
+        self.grouping_combo.currentIndexChanged.connect(self.refresh)
+        self.refresh_button.clicked.connect(self.refresh)
+
+        # Actualisation périodique, seulement quand le panneau est visible
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(self.REFRESH_INTERVAL_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.refresh_timer.start()
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        seconds = self.period_combo.currentData()
+        since = None if seconds is None else time.time() - seconds
+        group_by = self.GROUPINGS[self.grouping_combo.currentIndex()][1]
+        summary = (self.telemetry or get_telemetry()).summary(since=since, group_by=group_by)
+
+        headers = [self._group_label(column) for column in group_by] + [c[0] for c in self.COLUMNS]
+        self.table.setSortingEnabled(False)
+        self.table.clear()
+        self.table.setColumnCount(len(headers))
+        self.table.setHorizontalHeaderLabels(headers)
+        self.table.setRowCount(len(summary))
+
+        for row, stats in enumerate(summary):
+            for column, key in enumerate(group_by):
+                self.table.setItem(row, column, QTableWidgetItem(stats[key] or "—"))
+            for offset, (_label, key, fmt) in enumerate(self.COLUMNS):
+                value = stats[key]
+                item = _NumericItem("—" if value is None else fmt.format(value), value)
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.table.setItem(row, len(group_by) + offset, item)
+
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+
+        calls = sum(s["calls"] for s in summary)
+        cost = sum(s["cost"] for s in summary)
+        self.totals_label.setText(f"{calls} appels — coût estimé : {cost:.4f} $")
+
+    @staticmethod
+    def _group_label(column):
+        return {
+            "model": "Modèle",
+            "provider": "Fournisseur",
+            "category": "Type de document",
+            "source": "Composant",
+            "prompt_version": "Version du prompt",
+        }.get(column, column)
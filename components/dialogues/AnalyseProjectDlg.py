@@ -11,7 +11,7 @@ from PySide6.QtWidgets import (
     QHBoxLayout, QGraphicsDropShadowEffect
 )
 from PySide6.QtSvgWidgets import QSvgWidget
-from PySide6.QtCore import Qt, Signal, QThread, QRect, QSize
+from PySide6.QtCore import Qt, Signal, QRect, QSize
 from PySide6.QtGui import QFont, QColor, QPainterPath, QRegion, QKeyEvent
 
 # Importer le worker
@@ -39,7 +39,6 @@ class AnalyseProjectDlg(QDialog):
         self.setModal(True)
 
         self.project_markdown_content = project_markdown_content
-        self.analysis_thread = None
         self.analysis_worker = None
 
         # Dimensions et rayon pour les coins arrondis
@@ -187,60 +186,35 @@ class AnalyseProjectDlg(QDialog):
 
 
     def start_analysis(self):
-        if self.analysis_thread and self.analysis_thread.isRunning():
+        if self.analysis_worker is not None:
             # Ne pas démarrer une nouvelle analyse si une est déjà en cours
             return
 
         self.analyse_button.setEnabled(False)
         self.result_text_edit.setMarkdown("Analyse en cours, veuillez patienter...") # Utiliser setMarkdown pour un meilleur rendu
 
-        self.analysis_thread = QThread() # Pas de parent pour le QThread
+        # La requête s'exécute sur le moteur LLM partagé : pas de QThread dédié
         self.analysis_worker = OpenAIAnalysisWorker(self.project_markdown_content)
-        self.analysis_worker.moveToThread(self.analysis_thread)
 
         # Connecter les signaux du worker aux slots
         self.analysis_worker.analysis_complete.connect(self.on_analysis_complete)
         self.analysis_worker.analysis_error.connect(self.on_analysis_error)
-        
-        # Connecter le démarrage du thread à la méthode run_analysis du worker
-        self.analysis_thread.started.connect(self.analysis_worker.run_analysis)
-        
-        # Signaux pour quitter le thread lorsque le worker a terminé ou a une erreur
-        self.analysis_worker.analysis_complete.connect(self.analysis_thread.quit)
-        self.analysis_worker.analysis_error.connect(self.analysis_thread.quit)
-
-        # Nettoyage après la fin du thread
-        # Il est crucial que deleteLater soit appelé pour que Qt nettoie les objets C++.
-        self.analysis_thread.finished.connect(self.analysis_worker.deleteLater)
-        # NE PAS connecter self.analysis_thread.deleteLater() ici directement.
-        # Géré par _on_thread_finished ou closeEvent.
-        self.analysis_thread.finished.connect(self._on_thread_finished)
-
-        self.analysis_thread.start()
-
-    def _on_thread_finished(self):
-        """Appelé lorsque le thread (sender) se termine normalement."""
-        finishing_thread = self.sender()
-        if not isinstance(finishing_thread, QThread):
-            # Cela ne devrait pas arriver si connecté correctement
-            return
 
+        # Libérer le worker une fois l'analyse terminée ou en erreur
+        self.analysis_worker.analysis_complete.connect(self._on_analysis_done)
+        self.analysis_worker.analysis_error.connect(self._on_analysis_done)
+        self.analysis_worker.analysis_cancelled.connect(self._on_analysis_done)
+
+        self.analysis_worker.run_analysis()
+
+    def _on_analysis_done(self, _message: str = ""):
+        """Appelé lorsque l'analyse se termine, avec succès, en erreur ou annulée."""
         if self.analyse_button and not self.analyse_button.isEnabled():
             self.analyse_button.setEnabled(True)
 
-        # Si le thread qui a terminé est celui que nous suivons activement
-        if hasattr(self, 'analysis_thread') and self.analysis_thread == finishing_thread:
-            # Le worker associé (self.analysis_worker) est déjà connecté à deleteLater
-            # via finishing_thread.finished. Nous devons juste effacer notre référence Python.
-            if hasattr(self, 'analysis_worker'):
-                self.analysis_worker = None
-            
-            # Effacer notre référence Python au thread.
-            self.analysis_thread = None
-        
-        # L'objet QThread (finishing_thread) lui-même doit être marqué pour suppression.
-        # C'est sûr car sa méthode run() est terminée.
-        finishing_thread.deleteLater()
+        if self.analysis_worker is not None:
+            self.analysis_worker.deleteLater()
+            self.analysis_worker = None
 
     def on_analysis_complete(self, report: str):
         if markdown:
@@ -306,31 +280,12 @@ class AnalyseProjectDlg(QDialog):
         # self.analyse_button.setEnabled(True) # Déplacé vers _cleanup_thread_references
 
     def closeEvent(self, event):
-        if hasattr(self, 'analysis_thread') and self.analysis_thread and self.analysis_thread.isRunning():
-            self.analysis_thread.quit() # Demander l'arrêt du thread
-            if not self.analysis_thread.wait(5000): # Attendre jusqu'à 5 secondes
-                # Le thread n'a pas pu s'arrêter à temps.
-                print("Avertissement: Le thread d'analyse n'a pas pu être arrêté proprement lors de la fermeture. "
-                      "Il pourrait y avoir une fuite de ressources ou un comportement inattendu si le thread continue en arrière-plan.")
-                # IMPORTANT: Ne PAS appeler deleteLater sur le thread ici, et ne PAS effacer
-                # self.analysis_thread. Cela "fuira" l'objet QThread et son worker,
-                # mais empêchera l'avertissement "Destroyed while thread is still running".
-                # La solution propre est de rendre la tâche du worker interruptible.
-            # else:
-                # wait() a réussi. Le thread s'est terminé.
-                # Le signal 'finished' a été émis, et _on_thread_finished
-                # s'occupera de deleteLater et de nettoyer les références Python.
-                pass
-        
-        # Si self.analysis_thread existe mais n'est pas isRunning (c.-à-d. qu'il a déjà terminé
-        # avant que closeEvent ne soit appelé), _on_thread_finished devrait déjà
-        # avoir géré son nettoyage. Il n'y a généralement rien à faire ici dans ce cas.
-        # Si _on_thread_finished n'a pas encore été traité par la boucle d'événements,
-        # il le sera. Forcer deleteLater ici pourrait être prématuré ou redondant.
+        # Une analyse encore en cours n'a plus de destinataire : l'annuler
+        if self.analysis_worker is not None:
+            self.analysis_worker.cancel()
 
         super().closeEvent(event)
 
-
 if __name__ == '__main__':
     from PySide6.QtWidgets import QApplication
     import sys
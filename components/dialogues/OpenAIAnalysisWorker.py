@@ -1,31 +1,29 @@
 from PySide6.QtCore import QObject, Signal, Slot, QSettings
 
+from agent.LLMEngine import LLMEngine
+
 class OpenAIAnalysisWorker(QObject):
+    """
+    Lance l'analyse de cohérence sur le moteur LLM partagé.
+    run_analysis() ne bloque pas : aucun QThread dédié n'est nécessaire.
+    """
     analysis_complete = Signal(str)
     analysis_error = Signal(str)
+    analysis_cancelled = Signal()
+
+    MODEL = "gpt-4-turbo"
 
     def __init__(self, markdown_content: str):
         super().__init__()
         self.markdown_content = markdown_content
+        self.request = None
         
         # Utilisation des mêmes noms que dans PhaseWizardWidget pour QSettings
         settings = QSettings("AssistantIA", "PhaseWizard") 
-        api_key = settings.value("api_key_openai", None) 
+        self.api_key = settings.value("api_key_openai", None) 
 
-        if not api_key:
+        if not self.api_key:
             print("ERREUR: Clé API OpenAI ('api_key_openai') non trouvée dans QSettings pour AssistantIA/PhaseWizard.")
-            self.openai_client = None
-        else:
-            try:
-                from services.openai_client import OpenAIClient 
-                self.openai_client = OpenAIClient(api_key=api_key)
-            except ImportError:
-                self.openai_client = None
-                print("ERREUR: Impossible d'importer OpenAIClient depuis services.openai_client.")
-                print("Veuillez vous assurer que le fichier existe et que la classe est correctement définie.")
-            except Exception as e: 
-                self.openai_client = None
-                print(f"ERREUR lors de l'initialisation de OpenAIClient : {e}")
 
     @Slot()
     def run_analysis(self):
@@ -40,26 +38,43 @@ class OpenAIAnalysisWorker(QObject):
                 f"{self.markdown_content}"
             )
             
-            if not self.openai_client:
-                self.analysis_error.emit("Client OpenAI non initialisé. Vérifiez l'import, la configuration de services.openai_client.py, et la présence de la clé API dans QSettings.")
+            if not self.api_key:
+                self.analysis_error.emit("Clé API OpenAI absente. Vérifiez la présence de la clé API dans QSettings.")
                 return
 
-            try:
-                # Utilisation de la méthode generer_code de OpenAIClient
-                if hasattr(self.openai_client, 'generer_code'):
-                    response = self.openai_client.generer_code(prompt)
-                else:
-                    self.analysis_error.emit("La méthode 'generer_code' n'est pas trouvée dans la classe OpenAIClient de services.openai_client.py.")
-                    return
-
-                if response:
-                    self.analysis_complete.emit(response)
-                else:
-                    self.analysis_error.emit("Réponse vide reçue de l'API OpenAI.")
-            except Exception as api_error:
-                print(f"Erreur d'API OpenAI : {api_error}")
-                self.analysis_error.emit(f"Erreur lors de la communication avec l'API OpenAI : {api_error}")
+            self.request = LLMEngine.instance().request(
+                messages=[
+                    {"role": "system", "content": "Tu es un assistant expert en gestion de projet logiciel."},
+                    {"role": "user", "content": prompt}
+                ],
+                model=self.MODEL,
+                api_key=self.api_key,
+                stream=False,
+                temperature=0.3,
+                max_tokens=4000,
+                category="analyse",
+            )
+            self.request.finished.connect(self._on_response)
+            self.request.error.connect(self._on_api_error)
+            self.request.cancelled.connect(self.analysis_cancelled)
+            self.request.start()
 
         except Exception as e:
             print(f"Erreur générale dans run_analysis : {e}")
             self.analysis_error.emit(f"Erreur inattendue lors de la préparation de l'analyse : {e}")
+
+    @Slot()
+    def cancel(self):
+        """Annule l'analyse en cours ; ferme immédiatement la connexion à l'API."""
+        if self.request is not None:
+            self.request.cancel()
+
+    def _on_response(self, response: str):
+        if response:
+            self.analysis_complete.emit(response)
+        else:
+            self.analysis_error.emit("Réponse vide reçue de l'API OpenAI.")
+
+    def _on_api_error(self, message: str):
+        print(f"Erreur d'API OpenAI : {message}")
+        self.analysis_error.emit(f"Erreur lors de la communication avec l'API OpenAI : {message}")
@@ -31,6 +31,8 @@ from components.dialogues.SignupDialog import SignupDialog
 from project.documents.DocumentationOverviewWidget import DocumentationOverviewWidget, DocType
 from project.documents.DocumentationWidget import DocumentationWidget
 from project.quickaccess.QuickAccessWidget import QuickAccessWidget
+from services.llm_clients import close_all as close_all_llm_clients
+from agent.LLMEngine import LLMEngine
 
 
 class MainWindow(QMainWindow):
@@ -362,6 +364,9 @@ if __name__ == "__main__":
     if app is None:  # Crée une nouvelle instance si aucune n'existe
         app = QApplication(sys.argv)
         app.setStyle("Fusion")  # Appliquer le thème Fusion à toute l'application
+        # Fermer les connexions LLM partagées à la sortie
+        app.aboutToQuit.connect(LLMEngine.shutdown_instance)
+        app.aboutToQuit.connect(close_all_llm_clients)
 
     while True:  # Boucle de vie de l'application
         print(
@@ -0,0 +1,275 @@
+# project/documents/BatchGenerationJob.py
+
+"""
+Génération par lots de toutes les sections d'un document ("Générer tout").
+
+Les sections sont placées dans une file de priorité (ordre de la table des matières),
+générées avec un nombre borné de requêtes simultanées, et leur état
+(pending / running / done / failed) est enregistré sur disque après chaque
+changement, avec le contenu des sections terminées. Un lot interrompu (plantage,
+fermeture) reprend là où il s'était arrêté : les sections terminées sont restituées
+(signal section_finished) sans nouvel appel au modèle.
+"""
+
+import heapq
+import json
+import time
+from pathlib import Path
+
+from PySide6.QtCore import QObject, QThreadPool, Signal
+
+from agent.OpenAIStreamingTask import OpenAIStreamingTask
+from services.cancellation import CancellationToken
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class BatchGenerationJob(QObject):
+    section_started = Signal(str)  # chemin de la section
+    section_finished = Signal(str, str)  # chemin, contenu HTML
+    section_failed = Signal(str, str)  # chemin, message d'erreur
+    progress = Signal(int, int, float)  # sections terminées, total, ETA en secondes (-1 si inconnue)
+    finished = Signal(int, int)  # sections réussies, sections en échec
+    cancelled = Signal()
+    throttled = Signal(float)  # attente imposée par la limitation de débit (secondes)
+
+    def __init__(
+        self,
+        checkpoint_path,
+        prompt_builder,
+        cache=None,
+        use_cache=True,
+        max_concurrency=2,
+        expected_tokens=None,
+        category="",
+        parent=None,
+    ):
+        """
+        Args:
+            checkpoint_path: Fichier JSON où l'état du lot est enregistré
+            prompt_builder (callable): Retourne le prompt d'une section à partir de son chemin
+            cache: LLMResponseCache partagé (optionnel)
+            use_cache (bool): False pour ignorer les réponses en cache
+            max_concurrency (int): Nombre maximal de sections générées simultanément
+            expected_tokens (callable): Retourne la longueur attendue (tokens) d'une section (optionnel)
+            category (str): Regroupement des appels dans la télémétrie (ex. type de document)
+        """
+        super().__init__(parent)
+        self.checkpoint_path = Path(checkpoint_path)
+        self.prompt_builder = prompt_builder
+        self.cache = cache
+        self.use_cache = use_cache
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.expected_tokens = expected_tokens
+        self.category = category
+
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(self.max_concurrency)
+
+        self.sections = {}  # {chemin: {"state", "priority", "error", "duration", "html"}}
+        self._queue = []  # tas de (priorité, numéro d'ordre, chemin)
+        self._sequence = 0
+        self._running = {}  # {chemin: (tâche, jeton d'annulation, début)}
+        self._durations = []  # durées des sections générées pendant cette session
+        self._active = False
+
+    # --- Reprise ---
+
+    @staticmethod
+    def load_checkpoint(checkpoint_path) -> dict:
+        """Retourne l'état enregistré d'un lot interrompu, ou un dictionnaire vide."""
+        path = Path(checkpoint_path)
+        if not path.exists():
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f).get("sections", {})
+        except Exception as e:
+            print(f"Erreur lors du chargement du point de reprise {path}: {e}")
+            return {}
+
+    @staticmethod
+    def completed_sections(saved) -> dict:
+        """{chemin: contenu HTML} des sections terminées d'un point de reprise."""
+        return {
+            path: section["html"]
+            for path, section in saved.items()
+            if section.get("state") == DONE and section.get("html")
+        }
+
+    def _save_checkpoint(self):
+        data = {"updated_at": time.time(), "sections": self.sections}
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            tmp_path.replace(self.checkpoint_path)
+        except Exception as e:
+            print(f"Erreur lors de l'enregistrement du point de reprise: {e}")
+
+    def _clear_checkpoint(self):
+        try:
+            self.checkpoint_path.unlink(missing_ok=True)
+        except Exception as e:
+            print(f"Erreur lors de la suppression du point de reprise: {e}")
+
+    # --- File de priorité ---
+
+    def _push(self, path, priority):
+        heapq.heappush(self._queue, (priority, self._sequence, path))
+        self._sequence += 1
+
+    def prioritize(self, path):
+        """Place une section en attente en tête de file (ex. section affichée par l'utilisateur)."""
+        section = self.sections.get(path)
+        if section and section["state"] == PENDING:
+            section["priority"] = -1
+            self._push(path, -1)
+
+    # --- Cycle de vie ---
+
+    def start(self, paths, resume=False):
+        """
+        Lance la génération des sections.
+
+        Args:
+            paths (list): Chemins des sections dans l'ordre de la table des matières
+            resume (bool): Reprendre l'état enregistré au lieu de tout régénérer
+        """
+        completed = self.completed_sections(self.load_checkpoint(self.checkpoint_path)) if resume else {}
+
+        self.sections = {}
+        self._queue = []
+        self._running = {}
+        for priority, path in enumerate(paths):
+            # Les sections interrompues, en échec ou sans contenu enregistré sont retentées
+            if path in completed:
+                self.sections[path] = {"state": DONE, "priority": priority, "error": None, "html": completed[path]}
+            else:
+                self.sections[path] = {"state": PENDING, "priority": priority, "error": None}
+                self._push(path, priority)
+
+        self._durations = []
+        self._active = True
+        self._save_checkpoint()
+        # Restituer le contenu des sections déjà terminées
+        for path, html in completed.items():
+            if path in self.sections:
+                self.section_finished.emit(path, html)
+        self._emit_progress()
+        self._pump()
+
+    def cancel(self):
+        """
+        Arrête le lot : les flux HTTP en cours sont fermés, les sections restent à reprendre.
+        Une section dont la réponse arrive pendant l'annulation est tout de même conservée.
+        """
+        if not self._active:
+            return
+        self._active = False
+        self._queue = []
+        for path, (_task, token, _started) in list(self._running.items()):
+            token.cancel()
+            self.sections[path]["state"] = PENDING
+        self.thread_pool.clear()
+        self._save_checkpoint()
+        self.cancelled.emit()
+
+    def is_active(self) -> bool:
+        return self._active
+
+    def _pump(self):
+        """Démarre des sections tant que la limite de concurrence le permet."""
+        while self._active and self._queue and len(self._running) < self.max_concurrency:
+            _priority, _seq, path = heapq.heappop(self._queue)
+            section = self.sections.get(path)
+            # Entrée obsolète (section déjà démarrée via prioritize)
+            if section is None or section["state"] != PENDING:
+                continue
+
+            token = CancellationToken()
+            task = OpenAIStreamingTask(
+                path,
+                self.prompt_builder(path),
+                cache=self.cache,
+                use_cache=self.use_cache,
+                cancel_token=token,
+                expected_tokens=self.expected_tokens(path) if self.expected_tokens else None,
+                category=self.category,
+            )
+            task.signals.finished.connect(self._on_task_finished)
+            task.signals.failed.connect(self._on_task_failed)
+            task.signals.cancelled.connect(self._on_task_cancelled)
+            task.signals.throttled.connect(self.throttled)
+
+            section["state"] = RUNNING
+            self._running[path] = (task, token, time.monotonic())
+            self.thread_pool.start(task)
+            self.section_started.emit(path)
+
+        self._save_checkpoint()
+
+        if self._active and not self._queue and not self._running:
+            self._complete()
+
+    def _on_task_finished(self, path, html):
+        entry = self._running.pop(path, None)
+        if entry is None:
+            return
+        duration = time.monotonic() - entry[2]
+        self._durations.append(duration)
+        self.sections[path].update({"state": DONE, "error": None, "duration": duration, "html": html})
+        self.section_finished.emit(path, html)
+        if not self._active:
+            # Réponse arrivée pendant l'annulation : gardée, sans démarrer d'autre section
+            self._save_checkpoint()
+            return
+        self._emit_progress()
+        self._pump()
+
+    def _on_task_failed(self, path, msg):
+        entry = self._running.pop(path, None)
+        if entry is None or not self._active:
+            return
+        self.sections[path].update({"state": FAILED, "error": msg})
+        self.section_failed.emit(path, msg)
+        self._emit_progress()
+        self._pump()
+
+    def _on_task_cancelled(self, path):
+        self._running.pop(path, None)
+
+    def _complete(self):
+        self._active = False
+        failed = sum(1 for s in self.sections.values() if s["state"] == FAILED)
+        done = sum(1 for s in self.sections.values() if s["state"] == DONE)
+        if failed:
+            self._save_checkpoint()
+        else:
+            self._clear_checkpoint()
+        self.finished.emit(done, failed)
+
+    # --- Progression ---
+
+    def counts(self) -> dict:
+        result = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for section in self.sections.values():
+            result[section["state"]] += 1
+        return result
+
+    def eta_seconds(self) -> float:
+        """Temps restant estimé à partir de la durée moyenne des sections générées."""
+        if not self._durations:
+            return -1.0
+        counts = self.counts()
+        remaining = counts[PENDING] + counts[RUNNING]
+        average = sum(self._durations) / len(self._durations)
+        return remaining * average / self.max_concurrency
+
+    def _emit_progress(self):
+        counts = self.counts()
+        completed = counts[DONE] + counts[FAILED]
+        self.progress.emit(completed, len(self.sections), self.eta_seconds())
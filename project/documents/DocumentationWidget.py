@@ -35,6 +35,7 @@ from PySide6.QtWidgets import (
     QDialog,
     QDialogButtonBox,
     QInputDialog,
+    QSpinBox,
 )
 from PySide6.QtCore import (
     Qt,
@@ -63,12 +64,20 @@ from PySide6.QtWebEngineCore import (
 
 from project.documents.toc import TOC_STRUCTURE
 from project.documents.DocType import DocType
+from project.documents.BatchGenerationJob import BatchGenerationJob
 from components.ui.IconWithText import IconWithText
 from agent.OpenAIGenerationTask import OpenAIGenerationTask
 from agent.OpenAIStreamingTask import OpenAIStreamingTask
 from services.html_renderer import render_html
 from services.prompt_builder import build_prompt
+from services.prompt_registry import prompt_text, render
+from services import batch_jsonl
 from services.export_pdf import export_pdf
+from services.llm_cache import LLMResponseCache
+from services.generation_progress import ExpectedLengthModel
+from services.rate_limiter import estimate_tokens
+from services.single_flight import llm_flights
+from components.dashboard_widgets.LLMTelemetryPanel import LLMTelemetryPanel
 from components.dialogues.GitCredentialsDialog import GitCredentialsDialog
 from components.dialogues.ProjectNameDlg import ProjectNameDlg
 from components.dialogues.PromptEditorDialog import PromptEditorDialog
@@ -154,6 +163,9 @@ class CustomWebPage(QWebEnginePage):
 
 
 class DocumentationWidget(QWidget):
+    # Modèle des requêtes exportées pour l'API Batch (celui des tâches de génération)
+    BATCH_EXPORT_MODEL = "gpt-4"
+
     def __init__(self, doc_type: DocType):
         super().__init__()
         self.doc_type = doc_type
@@ -166,11 +178,19 @@ class DocumentationWidget(QWidget):
         self.versions = {}  # Stockage des versions {path: {version: content}}
         self.streaming_content = ""  # Stockage temporaire pour le contenu en streaming
         self.is_streaming = False  # Indicateur de génération en streaming
+        self.batch_job = None  # Génération complète en cours ("Générer tout")
+        self.batch_failures = {}  # {chemin: message d'erreur} du dernier lot
+        self.active_generation = None  # Tâche de génération de la section en cours
 
         # Créer le dossier de sauvegarde s'il n'existe pas
         self.save_dir = Path(_project_root_for_sys_path) / "saved_docs"
         self.save_dir.mkdir(exist_ok=True)
 
+        # Cache des réponses LLM partagé entre les types de documents
+        self.llm_cache = LLMResponseCache(self.save_dir / "llm_cache.sqlite")
+        # Longueurs de réponse apprises par section, pour une progression réaliste
+        self.expected_lengths = ExpectedLengthModel(self.save_dir / "expected_lengths.json")
+
         # Charger les données après avoir créé le dossier de sauvegarde
         self.favorites = self.load_favorites()
         self.history = self.load_history()
@@ -341,6 +361,18 @@ class DocumentationWidget(QWidget):
         self.generate_all_btn.setIcon(QIcon("assets/icons/wand.svg"))
         self.generate_all_btn.clicked.connect(self.generate_all_content)
 
+        # Nombre de sections générées simultanément par "Générer tout"
+        self.batch_concurrency_spin = QSpinBox()
+        self.batch_concurrency_spin.setRange(1, 8)
+        self.batch_concurrency_spin.setValue(2)
+        self.batch_concurrency_spin.setToolTip("Générations simultanées pour \"Générer tout\"")
+
+        # Bouton d'annulation de la génération complète
+        self.cancel_batch_btn = QPushButton("Annuler")
+        self.cancel_batch_btn.setIcon(QIcon("assets/icons/circle-stop.svg"))
+        self.cancel_batch_btn.clicked.connect(self.cancel_batch_generation)
+        self.cancel_batch_btn.setVisible(False)
+
         # Bouton de sauvegarde
         self.save_btn = QPushButton("Sauvegarder")
         self.save_btn.setIcon(QIcon("assets/icons/file-down.svg"))
@@ -359,6 +391,8 @@ class DocumentationWidget(QWidget):
         toolbar_layout.addWidget(search_label)
         toolbar_layout.addWidget(self.search_input, 3)
         toolbar_layout.addWidget(self.generate_all_btn, 1)
+        toolbar_layout.addWidget(self.batch_concurrency_spin)
+        toolbar_layout.addWidget(self.cancel_batch_btn)
         toolbar_layout.addWidget(self.save_btn, 1)
         toolbar_layout.addWidget(self.load_btn, 1)
         toolbar_layout.addWidget(self.git_publish_btn, 1)
@@ -459,6 +493,9 @@ class DocumentationWidget(QWidget):
 
         self.content_tabs.addTab(versions_tab, "Versions")
 
+        # Onglet Performances : percentiles des appels LLM par modèle et type de document
+        self.content_tabs.addTab(LLMTelemetryPanel(), "Performances")
+
         right_layout.addWidget(self.content_tabs, 1)
 
         # Barre de boutons
@@ -474,11 +511,24 @@ class DocumentationWidget(QWidget):
         self.generate_streaming_button.setIcon(QIcon("assets/icons/zap.svg"))
         self.generate_streaming_button.clicked.connect(self.generate_content_streaming)
 
+        # Bouton d'arrêt de la génération en cours
+        self.stop_generation_button = QPushButton("Arrêter")
+        self.stop_generation_button.setIcon(QIcon("assets/icons/circle-stop.svg"))
+        self.stop_generation_button.clicked.connect(self.cancel_active_generation)
+        self.stop_generation_button.setVisible(False)
+
         # Menu déroulant pour le bouton de génération
         self.generate_menu = QMenu(self)
         self.customize_prompt_action = QAction("Personnaliser le prompt", self)
         self.customize_prompt_action.triggered.connect(self.customize_prompt)
         self.generate_menu.addAction(self.customize_prompt_action)
+        self.generate_menu.addSeparator()
+        self.export_batch_action = QAction("Exporter les sections en attente (JSONL)…", self)
+        self.export_batch_action.triggered.connect(self.export_pending_batch)
+        self.generate_menu.addAction(self.export_batch_action)
+        self.import_batch_action = QAction("Importer des résultats (JSONL)…", self)
+        self.import_batch_action.triggered.connect(self.import_batch_results)
+        self.generate_menu.addAction(self.import_batch_action)
 
         self.generate_button_menu = QToolButton()
         self.generate_button_menu.setPopupMode(QToolButton.MenuButtonPopup)
@@ -525,6 +575,7 @@ class DocumentationWidget(QWidget):
 
         button_layout.addWidget(self.generate_button_menu)
         button_layout.addWidget(self.generate_streaming_button)
+        button_layout.addWidget(self.stop_generation_button)
         button_layout.addWidget(self.export_button)
         button_layout.addWidget(self.show_source_button)
         button_layout.addWidget(self.favorite_button)
@@ -591,6 +642,22 @@ class DocumentationWidget(QWidget):
         self.autosave_checkbox.stateChanged.connect(self.toggle_autosave)
         status_layout.addWidget(self.autosave_checkbox)
 
+        # Contournement du cache des réponses LLM
+        self.bypass_cache_checkbox = QCheckBox("Ignorer le cache")
+        self.bypass_cache_checkbox.setToolTip(
+            "Forcer un nouvel appel au modèle même si une réponse identique est en cache"
+        )
+        status_layout.addWidget(self.bypass_cache_checkbox)
+
+        # Statistiques du cache
+        self.cache_stats_label = QLabel()
+        status_layout.addWidget(self.cache_stats_label)
+        self.update_cache_stats()
+
+        # Temps avant le premier token et débit de la génération en cours
+        self.generation_stats_label = QLabel()
+        status_layout.addWidget(self.generation_stats_label)
+
         # Dernière sauvegarde
         self.last_save_label = QLabel("Dernière sauvegarde: Jamais")
         status_layout.addWidget(self.last_save_label)
@@ -783,8 +850,14 @@ class DocumentationWidget(QWidget):
     def _handle_item_click(self, path):
         """Fonction commune pour gérer le clic sur un élément"""
         if path:
+            # La génération d'une autre section n'est plus utile
+            if self.active_generation is not None and self.active_generation.full_path != path:
+                self.cancel_active_generation()
             self.current_item_path = path
             self.load_content(path)
+            # Générer en priorité la section consultée pendant un "Générer tout"
+            if self.batch_job is not None and self.batch_job.is_active():
+                self.batch_job.prioritize(path)
             return True
         return False
 
@@ -899,29 +972,7 @@ class DocumentationWidget(QWidget):
 
             # Cas spécial pour l'historique de l'organisation
             if "Historique de l'organisation" in section_name:
-                return f"""
-                Tu es un assistant expert en documentation projet.
-                Génère un contenu HTML structuré pour la section : {section_name}
-                
-                **Instructions strictes :**
-                1. Uniquement du contenu technique utile 
-                2. Pas de notes d'installation/configuration
-                3. Pas de mentions aux bibliothèques utilisées
-                4. Pas de conclusion ou méta-commentaires
-                
-                **Format :**
-                - Titre h2 {section_name} avec l'icône 'clock-9' de Lucide (sans mentionner Lucide)
-                - Contenu technique concis
-                - OBLIGATOIREMENT inclure un diagramme Mermaid de type Gantt avec les années (format YYYY)
-                - Code formaté (sans mention de Prism)
-                - Icônes SVG (sans référence à Lucide)
-                
-                **Interdictions :**
-                - Ne jamais expliquer comment afficher le contenu
-                - Ne jamais mentionner les dépendances techniques
-                - Ne jamais ajouter de notes techniques ou pédagogiques
-                - Ne jamais ajouter ```html en premier ou ``` en dernier
-                """
+                return render("doc.section.history", section=section_name)
             else:
                 return build_prompt(self.doc_type.value, section_name)
 
@@ -939,6 +990,7 @@ class DocumentationWidget(QWidget):
 
         self.progress_bar.setValue(0)
         self.progress_bar.setVisible(True)
+        self.stop_generation_button.setVisible(True)
 
     def generate_content(self):
         if not hasattr(self, "current_item_path"):
@@ -947,13 +999,30 @@ class DocumentationWidget(QWidget):
         path = self.current_item_path
         prompt = self._prepare_prompt(path)
 
+        # Une seule génération de section à la fois
+        self.cancel_active_generation()
+
         # Créer la tâche de génération
-        task = OpenAIGenerationTask(path, prompt)
+        task = OpenAIGenerationTask(
+            path,
+            prompt,
+            cache=self.llm_cache,
+            use_cache=not self.bypass_cache_checkbox.isChecked(),
+            expected_tokens=self.expected_section_tokens(path),
+            category=self.doc_type.name,
+        )
 
         task._finished_connection = task.signals.finished.connect(
             self.on_generation_finished
         )
         task._error_connection = task.signals.error.connect(self.on_generation_error)
+        task._cancelled_connection = task.signals.cancelled.connect(
+            self.on_generation_cancelled
+        )
+        task._throttled_connection = task.signals.throttled.connect(
+            self.on_generation_throttled
+        )
+        task._stats_connection = task.signals.stats.connect(self.on_generation_stats)
 
         # Connecter le signal de progression si disponible
         if hasattr(task.signals, "progress"):
@@ -962,6 +1031,7 @@ class DocumentationWidget(QWidget):
             )
 
         # Ajouter la tâche au pool de threads
+        self.active_generation = task
         self.thread_pool.start(task)
 
         # Mettre à jour l'interface utilisateur
@@ -979,11 +1049,14 @@ class DocumentationWidget(QWidget):
 
         # Enregistrer le contenu final
         self.generated_content[path] = html
+        if self.active_generation is not None and self.active_generation.full_path == path:
+            self.active_generation = None
+        self.expected_lengths.record(path, estimate_tokens(html), group=self.doc_type.name)
 
         if is_streaming:
             self.is_streaming = False
 
-        if self.current_item_path == path:
+        if getattr(self, "current_item_path", None) == path:
             # Afficher le contenu final
             self.html_view.setHtml(render_html(html, self.default_css, skip_title=True))
             self.content_editor.setPlainText(html)
@@ -1000,21 +1073,76 @@ class DocumentationWidget(QWidget):
                 self.status_label.setText(f"Génération terminée pour: {path}")
 
             self.progress_bar.setVisible(False)
+            self.stop_generation_button.setVisible(False)
 
             # Mettre à jour le combo des versions
             self.update_version_combo(path)
 
         # Ajouter à l'historique
         self.add_to_history(path)
+        self.update_cache_stats()
 
         # Sauvegarder automatiquement si activé
         if self.autosave_checkbox.isChecked():
             self.auto_save()
 
+    def update_cache_stats(self):
+        """Met à jour l'affichage des compteurs du cache LLM et du regroupement des requêtes"""
+        stats = self.llm_cache.stats()
+        flights = llm_flights.stats()
+        self.cache_stats_label.setText(
+            f"Cache: {stats['hits']} succès / {stats['misses']} échecs"
+            f" | Requêtes regroupées: {flights['coalesced']}"
+        )
+
+    def expected_section_tokens(self, path):
+        """Longueur attendue (tokens) d'une section, apprise des générations précédentes"""
+        return self.expected_lengths.expected(path, group=self.doc_type.name)
+
+    def on_generation_stats(self, ttft, tokens_per_second, tokens):
+        """Affiche en direct le temps avant le premier token et le débit"""
+        self.generation_stats_label.setText(
+            f"TTFT: {ttft:.2f} s | {tokens_per_second:.1f} tokens/s | {tokens} tokens"
+        )
+
     def on_generation_finished(self, path, html):
         self._save_version_and_update_content(path, html, is_streaming=False)
 
+    def cancel_active_generation(self):
+        """Annule la génération de section en cours et ignore ses derniers signaux"""
+        task, self.active_generation = self.active_generation, None
+        if task is None:
+            return
+        # Les fragments déjà en file d'attente ne doivent plus s'afficher
+        for signal, slot in (
+            (getattr(task.signals, "chunk", None), self.on_streaming_chunk),
+            (task.signals.progress, self.on_generation_progress),
+            (task.signals.stats, self.on_generation_stats),
+        ):
+            if signal is None:
+                continue
+            try:
+                signal.disconnect(slot)
+            except (RuntimeError, TypeError):
+                pass
+        task.cancel_token.cancel()
+        self.is_streaming = False
+        self.generate_button.setText("Générer")
+        self.generate_button.setEnabled(True)
+        self.generate_streaming_button.setText("Générer (Streaming)")
+        self.generate_streaming_button.setEnabled(True)
+        self.stop_generation_button.setVisible(False)
+        if self.batch_job is None or not self.batch_job.is_active():
+            self.progress_bar.setVisible(False)
+        self.status_label.setText(f"Génération annulée pour: {task.full_path}")
+
+    def on_generation_cancelled(self, path):
+        """La tâche annulée s'est arrêtée et a libéré sa place dans le pool"""
+        print(f"Génération annulée: {path}")
+
     def on_generation_error(self, msg):
+        self.active_generation = None
+        self.stop_generation_button.setVisible(False)
         self.html_view.setHtml(f"<h2>Erreur</h2><p>{msg}</p>")
         self.generate_button.setText("Réessayer")
         self.generate_button.setEnabled(True)
@@ -1022,6 +1150,12 @@ class DocumentationWidget(QWidget):
         self.progress_bar.setVisible(False)
         self.status_label.setText(f"Erreur de génération: {msg}")
 
+    def on_generation_throttled(self, wait):
+        """Affiche l'attente imposée par la limitation de débit du fournisseur"""
+        self.status_label.setText(
+            f"Limitation de débit du fournisseur : reprise dans {wait:.1f} s…"
+        )
+
     def on_generation_progress(self, progress):
         self.progress_bar.setValue(progress)
 
@@ -1075,6 +1209,9 @@ class DocumentationWidget(QWidget):
 
         path = self.current_item_path
 
+        # Une seule génération de section à la fois
+        self.cancel_active_generation()
+
         # Réinitialiser le contenu en streaming
         self.streaming_content = ""
         self.current_streaming_path = path.split(">")[-1].strip()
@@ -1084,14 +1221,31 @@ class DocumentationWidget(QWidget):
         prompt = self._prepare_prompt(self.current_streaming_path)
 
         # Créer une tâche de génération en streaming
-        task = OpenAIStreamingTask(path, prompt)
+        task = OpenAIStreamingTask(
+            path,
+            prompt,
+            cache=self.llm_cache,
+            use_cache=not self.bypass_cache_checkbox.isChecked(),
+            expected_tokens=self.expected_section_tokens(path),
+            category=self.doc_type.name,
+        )
 
         # Connecter les signaux
         task._finished_connection = task.signals.finished.connect(
             self.on_streaming_finished
         )
         task._error_connection = task.signals.error.connect(self.on_generation_error)
+        task._cancelled_connection = task.signals.cancelled.connect(
+            self.on_generation_cancelled
+        )
         task._chunk_connection = task.signals.chunk.connect(self.on_streaming_chunk)
+        task._restarted_connection = task.signals.restarted.connect(
+            self.on_streaming_restarted
+        )
+        task._throttled_connection = task.signals.throttled.connect(
+            self.on_generation_throttled
+        )
+        task._stats_connection = task.signals.stats.connect(self.on_generation_stats)
 
         # Connecter le signal de progression si disponible
         if hasattr(task.signals, "progress"):
@@ -1100,6 +1254,7 @@ class DocumentationWidget(QWidget):
             )
 
         # Ajouter la tâche au pool de threads
+        self.active_generation = task
         self.thread_pool.start(task)
 
         # Mettre à jour l'interface utilisateur en utilisant la fonction utilitaire
@@ -1109,6 +1264,12 @@ class DocumentationWidget(QWidget):
         """Gère la fin de la génération en streaming"""
         self._save_version_and_update_content(path, html, is_streaming=True)
 
+    def on_streaming_restarted(self, path):
+        """La génération repart de zéro (requête partagée annulée) : effacer le texte affiché"""
+        self.streaming_content = ""
+        self.html_view.setHtml(render_html("", self.default_css, skip_title=True))
+        self.content_editor.setPlainText("")
+
     def on_streaming_chunk(self, chunk):
 
         # print(chunk)
@@ -1269,14 +1430,15 @@ class DocumentationWidget(QWidget):
         # Récupérer le prompt actuel
         current_prompt = self.custom_prompts.get(
             self.current_item_path,
-            build_prompt(
+            # Le prompt personnalisé est un texte libre : consignes et section réunies
+            prompt_text(build_prompt(
                 self.doc_type.value,
                 (
                     self.current_item_path.split("<i class='nav-icon'></i>")[-1].strip()
                     if "<i class='nav-icon'></i>" in self.current_item_path
                     else self.current_item_path
                 ),
-            ),
+            )),
         )
 
         # Créer une nouvelle instance de PromptEditorDialog avec le prompt actuel
@@ -1835,8 +1997,11 @@ class DocumentationWidget(QWidget):
             QMessageBox.critical(self, "Erreur", f"Une erreur est survenue: {str(e)}")
             self.status_label.setText("Échec de la publication")
 
-    def generate_all_content(self):
-        # Récupérer tous les chemins possibles
+    def _batch_checkpoint_path(self):
+        return self.save_dir / f"batch_{self.doc_type.name}.json"
+
+    def _toc_paths(self):
+        """Chemins de toutes les sections, dans l'ordre de la table des matières"""
         paths = []
 
         def collect_paths(parent_index, current_path=""):
@@ -1847,61 +2012,224 @@ class DocumentationWidget(QWidget):
                 index = model.index(row, 0, parent_index)
                 text = model.data(index)
 
-                # Utilisation d'une icône au lieu du symbole '>' pour la navigation
-                path = (
-                    text
-                    if not current_path
-                    else f"{current_path} <i class='nav-icon'></i> {text}"
-                )
+                # Même format de chemin que get_full_path pour retrouver le contenu au clic
+                path = text if not current_path else f"{current_path} > {text}"
                 paths.append(path)
 
                 # Récursivement collecter les chemins des enfants
                 collect_paths(index, path)
 
         collect_paths(QModelIndex())
+        return paths
 
-        if not paths:
+    def generate_all_content(self):
+        if self.batch_job is not None and self.batch_job.is_active():
             return
 
-        # Demander confirmation
-        reply = QMessageBox.question(
-            self,
-            "Générer tout le contenu",
-            f"Voulez-vous générer le contenu pour {len(paths)} sections ?",
-            QMessageBox.Yes | QMessageBox.No,
-            QMessageBox.No,
-        )
+        # Récupérer tous les chemins possibles, dans l'ordre de la table des matières
+        paths = self._toc_paths()
 
-        if reply == QMessageBox.No:
+        if not paths:
             return
 
-        # Préparer la barre de progression
-        total_sections = len(paths)
-        # self.progress_bar.setRange(0, 100)
+        # Proposer la reprise d'un lot interrompu
+        resume = False
+        saved = BatchGenerationJob.load_checkpoint(self._batch_checkpoint_path())
+        # Seules les sections dont le contenu a été enregistré comptent comme terminées
+        completed = BatchGenerationJob.completed_sections(saved)
+        saved_done = sum(1 for p in paths if p in completed)
+        if saved and saved_done < len(paths):
+            reply = QMessageBox.question(
+                self,
+                "Reprendre la génération",
+                f"Une génération complète a été interrompue ({saved_done}/{len(paths)} sections terminées).\n"
+                "Voulez-vous la reprendre là où elle s'était arrêtée ?",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel,
+                QMessageBox.Yes,
+            )
+            if reply == QMessageBox.Cancel:
+                return
+            resume = reply == QMessageBox.Yes
+
+        if not resume:
+            # Demander confirmation
+            reply = QMessageBox.question(
+                self,
+                "Générer tout le contenu",
+                f"Voulez-vous générer le contenu pour {len(paths)} sections ?",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No,
+            )
+
+            if reply == QMessageBox.No:
+                return
+
+        self.batch_job = BatchGenerationJob(
+            self._batch_checkpoint_path(),
+            self._prepare_prompt,
+            cache=self.llm_cache,
+            use_cache=not self.bypass_cache_checkbox.isChecked(),
+            max_concurrency=self.batch_concurrency_spin.value(),
+            expected_tokens=self.expected_section_tokens,
+            category=self.doc_type.name,
+            parent=self,
+        )
+        self.batch_job.section_finished.connect(self.on_batch_section_finished)
+        self.batch_job.section_failed.connect(self.on_batch_section_failed)
+        self.batch_job.progress.connect(self.on_batch_progress)
+        self.batch_job.finished.connect(self.on_batch_finished)
+        self.batch_job.cancelled.connect(self.on_batch_cancelled)
+        self.batch_job.throttled.connect(self.on_generation_throttled)
+        self.batch_failures = {}
+
+        # Préparer l'interface
+        self.generate_all_btn.setEnabled(False)
+        self.batch_concurrency_spin.setEnabled(False)
+        self.cancel_batch_btn.setVisible(True)
         self.progress_bar.setValue(0)
         self.progress_bar.setVisible(True)
         self.status_label.setText("Génération de la documentation complète...")
 
-        # Générer le contenu pour chaque chemin
-        for i, path in enumerate(paths):
-            # Mettre à jour la barre de progression
-            progress_percent = int((i / total_sections) * 100)
-            self.progress_bar.setValue(progress_percent)
-            self.status_label.setText(
-                f"Génération en cours: {path} ({i+1}/{total_sections})"
+        self.batch_job.start(paths, resume=resume)
+
+    # --- Lot hors ligne (fichiers JSONL au format de l'API Batch) ---
+
+    def export_pending_batch(self):
+        """Exporte les prompts des sections non encore générées dans un fichier JSONL"""
+        paths = [p for p in self._toc_paths() if p not in self.generated_content]
+        if not paths:
+            self.status_label.setText("Aucune section en attente à exporter")
+            return
+
+        batch_jsonl.DEFAULT_BATCH_DIR.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        default_path = batch_jsonl.DEFAULT_BATCH_DIR / f"{self.doc_type.name}-{timestamp}.jsonl"
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Exporter le lot", str(default_path), "Requêtes JSONL (*.jsonl)"
+        )
+        if not file_path:
+            return
+
+        try:
+            batch_jsonl.export_requests(
+                file_path,
+                ((path, self._prepare_prompt(path)) for path in paths),
+                self.BATCH_EXPORT_MODEL,
+                metadata={"doc_type": self.doc_type.name},
             )
+        except OSError as e:
+            QMessageBox.critical(self, "Erreur", f"Impossible d'exporter le lot : {e}")
+            return
+        self.status_label.setText(f"{len(paths)} sections exportées dans {file_path}")
 
-            # Générer le contenu
-            self.current_item_path = path
-            self.generate_content()
-            QApplication.processEvents()  # Permettre à l'interface de se mettre à jour
+    def import_batch_results(self):
+        """Intègre un fichier de résultats JSONL dans le contenu généré et les versions"""
+        batch_path, _ = QFileDialog.getOpenFileName(
+            self, "Lot exporté", str(batch_jsonl.DEFAULT_BATCH_DIR), "Requêtes JSONL (*.jsonl)"
+        )
+        if not batch_path:
+            return
+        if not batch_jsonl.manifest_path(batch_path).exists():
+            QMessageBox.warning(self, "Import impossible", "Le manifeste de ce lot est introuvable.")
+            return
+
+        # Résultats rangés à côté du lot par convention, sinon au choix de l'utilisateur
+        results_path = Path(batch_path).with_suffix(".results.jsonl")
+        if not results_path.exists():
+            chosen, _ = QFileDialog.getOpenFileName(
+                self, "Résultats du lot", str(Path(batch_path).parent), "Résultats JSONL (*.jsonl)"
+            )
+            if not chosen:
+                return
+            results_path = Path(chosen)
+
+        try:
+            manifest = batch_jsonl.load_manifest(batch_path)
+            doc_type = manifest.get("metadata", {}).get("doc_type")
+            if doc_type and doc_type != self.doc_type.name:
+                QMessageBox.warning(
+                    self,
+                    "Type de document incompatible",
+                    f"Ce lot a été exporté pour {doc_type} et non {self.doc_type.name}.",
+                )
+                return
+            contents, errors = batch_jsonl.match_results(batch_path, results_path)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.critical(self, "Erreur", f"Impossible de lire les résultats : {e}")
+            return
+
+        for path, html in contents.items():
+            self._save_version_and_update_content(path, html)
+
+        self.status_label.setText(
+            f"Lot importé : {len(contents)} sections intégrées, {len(errors)} en échec"
+        )
+        if errors:
+            details = "\n".join(f"- {key}: {message}" for key, message in list(errors.items())[:10])
+            QMessageBox.warning(self, "Résultats en échec", f"{len(errors)} requêtes ont échoué :\n{details}")
+
+    def cancel_batch_generation(self):
+        if self.batch_job is not None:
+            self.batch_job.cancel()
+
+    def on_batch_section_finished(self, path, html):
+        # Section restituée à la reprise d'un lot : déjà présente, pas de nouvelle version
+        if self.generated_content.get(path) == html:
+            return
+        self._save_version_and_update_content(path, html)
+
+    def on_batch_section_failed(self, path, msg):
+        print(f"Échec de la génération pour {path}: {msg}")
+        self.batch_failures[path] = msg
+        self.status_label.setText(f"Échec de la génération pour: {path}")
 
-        # Finaliser la barre de progression
-        self.progress_bar.setValue(100)
+    def on_batch_progress(self, completed, total, eta):
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setValue(int(completed * 100 / total) if total else 0)
+        if eta >= 0:
+            minutes, seconds = divmod(int(eta), 60)
+            eta_text = f" - temps restant estimé: {minutes} min {seconds:02d} s"
+        else:
+            eta_text = ""
         self.status_label.setText(
-            f"Génération complète: {total_sections} sections générées"
+            f"Génération complète: {completed}/{total} sections{eta_text}"
         )
 
+    def _reset_batch_ui(self):
+        self.generate_all_btn.setEnabled(True)
+        self.batch_concurrency_spin.setEnabled(True)
+        self.cancel_batch_btn.setVisible(False)
+        self.progress_bar.setVisible(False)
+
+    def on_batch_finished(self, done, failed):
+        self._reset_batch_ui()
+        if failed:
+            self.status_label.setText(
+                f"Génération complète terminée: {done} sections générées, {failed} en échec"
+            )
+            details = "\n".join(
+                f"- {path}: {msg}" for path, msg in list(self.batch_failures.items())[:10]
+            )
+            QMessageBox.warning(
+                self,
+                "Sections en échec",
+                f"{failed} sections n'ont pas pu être générées "
+                f"(elles seront retentées à la reprise) :\n{details}",
+            )
+        else:
+            self.status_label.setText(f"Génération complète: {done} sections générées")
+
+    def on_batch_cancelled(self):
+        self._reset_batch_ui()
+        self.status_label.setText("Génération complète annulée (elle pourra être reprise)")
+
+    def closeEvent(self, event):
+        # Les générations en cours n'ont plus de destinataire ; un lot reste reprenable
+        self.cancel_active_generation()
+        if self.batch_job is not None and self.batch_job.is_active():
+            self.batch_job.cancel()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     import sys
@@ -1,23 +1,102 @@
 # agent_ia_stream.py
+"""
+Serveur IA en streaming (SSE) pour l'interface Qt.
+
+Tout le traitement est asynchrone : les réponses d'OpenAI sont lues avec AsyncOpenAI
+sur la boucle d'uvicorn, via un pool HTTP partagé (services.llm_clients). Un flux lent
+ne bloque donc ni les autres clients de /chat_stream ni /health.
+
+/chat_stream répond en événements SSE typés et numérotés (token, action, usage, done,
+error) ; après une coupure, un client qui l'a annoncé (en-tête X-Resumable: 1) reprend
+avec Last-Event-ID sans relancer le modèle (serveur/event_stream.py). Sans cet en-tête,
+la déconnexion arrête la génération aussitôt.
+
+/metrics expose les métriques du serveur au format Prometheus et /ready vérifie que
+le fournisseur répond (serveur/monitoring.py).
+
+Le modèle « mock » (services.mock_llm) remplace le fournisseur par une simulation
+réglable, pour les tests de charge (serveur/load_test.py).
+"""
+from contextlib import aclosing, asynccontextmanager
+
+import httpx
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from openai import OpenAI
 import os
-import json
-import re
+import sys
 import asyncio
 import datetime
 
-app = FastAPI()
-# Initialisation du client OpenAI avec la nouvelle API
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+import anyio
+
+_project_root_for_sys_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _project_root_for_sys_path not in sys.path:
+    sys.path.insert(0, _project_root_for_sys_path)
+
+from services.llm_clients import aclose_async_clients, get_async_client, stream_usage_options
+from services.rate_limiter import call_with_retry_async, estimate_tokens
+from services.llm_telemetry import CallMetrics, STATUS_CLIENT_ABORTED, STATUS_ERROR
+from services.mock_llm import MOCK_PREFIX, MockAsyncClient, is_mock_model, parse_mock_model
+from serveur import event_stream, monitoring
+from serveur.event_stream import (
+    EVENT_DONE, EVENT_ERROR, EVENT_THROTTLED, EVENT_TOKEN, EVENT_USAGE,
+    StreamRegistry, format_event, parse_event_id, split_actions,
+)
+
+OPENAI_MODEL = "gpt-4"
+MAX_TOKENS = 600
+
+# Délais propres à chaque requête : une connexion ou un flux bloqué libère sa place
+# (lecture = silence maximal entre deux fragments), durée totale bornée par STREAM_TIMEOUT
+REQUEST_TIMEOUT = httpx.Timeout(connect=10.0, read=60.0, write=30.0, pool=10.0)
+STREAM_TIMEOUT = 300.0
+
+
+# Réponses en cours ou récentes, pour la reprise avec Last-Event-ID
+streams = StreamRegistry()
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    yield
+    # Arrêter les générations encore en cours (flux amont fermés)
+    await streams.aclose()
+    # Fermer le pool HTTP asynchrone lié à la boucle du serveur
+    await aclose_async_clients()
+
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/health")
 async def health_check():
     """Endpoint pour vérifier si le serveur est en cours d'exécution"""
     return {"status": "ok", "timestamp": datetime.datetime.now().isoformat()}
 
+
+async def check_upstream():
+    """Requête légère au fournisseur (liste des modèles) : échoue s'il est injoignable."""
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("Clé API OpenAI non configurée")
+    await get_async_client("openai").models.list(timeout=monitoring.READINESS_TIMEOUT)
+
+
+readiness = monitoring.ReadinessProbe(check_upstream)
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Prêt à servir si le fournisseur a répondu (résultat gardé en cache READINESS_TTL s)"""
+    status = await readiness.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Métriques du serveur au format texte de Prometheus"""
+    return PlainTextResponse(monitoring.render_metrics(), media_type=monitoring.CONTENT_TYPE)
+
+
 class PromptRequest(BaseModel):
     message: str
     model: str
@@ -26,72 +105,212 @@ def parse_stream_chunk(chunk):
     # Extraction ligne à ligne (améliorable)
     return chunk
 
+async def create_with_rate_limit(request, provider, model, estimated_tokens, metrics=None):
+    """
+    Lance `request()` via le limiteur de débit partagé.
+    Produit ("throttled", attente) pendant les attentes, puis ("result", réponse).
+    """
+    throttle_events = asyncio.Queue()
+    call = asyncio.create_task(
+        call_with_retry_async(
+            request,
+            provider,
+            model,
+            estimated_tokens=estimated_tokens,
+            on_throttled=throttle_events.put_nowait,
+            metrics=metrics,
+        )
+    )
+    try:
+        while not call.done():
+            waiter = asyncio.ensure_future(throttle_events.get())
+            try:
+                done, _ = await asyncio.wait({call, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            if waiter in done:
+                yield "throttled", waiter.result()
+        yield "result", call.result()
+    finally:
+        # Client parti pendant l'attente : ne pas ouvrir un flux que personne ne lira
+        call.cancel()
+
+
+async def close_upstream(stream):
+    """
+    Ferme le flux du fournisseur (la connexion HTTP est coupée, la génération s'arrête).
+    Protégé de l'annulation : appelé alors que la réponse au client vient d'être annulée.
+    """
+    with anyio.CancelScope(shield=True):
+        try:
+            await stream.close()
+        except Exception as e:
+            print(f"Erreur lors de la fermeture du flux amont : {e}")
+
+
+async def completion_events(client, provider, model_name, chat_msgs, metrics):
+    """
+    Événements de la réponse du fournisseur ; `client` est un AsyncOpenAI partagé ou un
+    fournisseur simulé (services.mock_llm). Produit (type, données), voir event_stream.
+    """
+    deadline = asyncio.get_running_loop().time() + STREAM_TIMEOUT
+    stream = None
+    try:
+        async for kind, value in create_with_rate_limit(
+            lambda: client.chat.completions.create(
+                model=model_name,
+                messages=chat_msgs,
+                max_tokens=MAX_TOKENS,
+                stream=True,
+                timeout=REQUEST_TIMEOUT,
+                **stream_usage_options(provider),
+            ),
+            provider,
+            model_name,
+            estimated_tokens=estimate_tokens(chat_msgs[0]["content"] + chat_msgs[-1]["content"]) + MAX_TOKENS,
+            metrics=metrics,
+        ):
+            if kind == "throttled":
+                # Signaler l'attente au client plutôt qu'une erreur
+                yield EVENT_THROTTLED, {"wait": round(value, 2)}
+            else:
+                stream = value
+        async for chunk in stream:
+            if asyncio.get_running_loop().time() > deadline:
+                raise TimeoutError(f"Réponse interrompue après {STREAM_TIMEOUT:.0f} s")
+            if getattr(chunk, "usage", None):
+                metrics.set_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                part = chunk.choices[0].delta.content
+                metrics.add_output(part)
+                yield EVENT_TOKEN, {"text": part}
+        metrics.finish()
+        yield EVENT_USAGE, {
+            "prompt_tokens": metrics.prompt_tokens,
+            "completion_tokens": metrics.completion_tokens,
+            "cached_tokens": metrics.cached_tokens,
+        }
+        yield EVENT_DONE, {"status": "ok"}
+    finally:
+        if stream is not None:
+            await close_upstream(stream)
+        # Génération arrêtée faute de client à l'écoute (sans effet si l'appel est déjà enregistré)
+        metrics.finish(STATUS_CLIENT_ABORTED)
+
+
+async def answer_events(message, model):
+    """Événements de la réponse à `message` pour le modèle demandé."""
+    if model == "openai" or is_mock_model(model):
+        # Prompt pour structurer la réponse
+        prompt = (
+            f"Tu es un assistant pour la création d'arborescences. "
+            f"Donne ta réponse, puis la liste des actions JSON comme dans l'exemple :\n"
+            f"Réponse: Voici ta structure\n"
+            f"Actions: [{{\"type\": \"mkdir\", \"path\": \"src\"}}]"
+        )
+        chat_msgs = [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": message}
+        ]
+        metrics = None
+        try:
+            if model == "openai":
+                # Vérifier si la clé API est définie
+                if not os.getenv("OPENAI_API_KEY"):
+                    yield EVENT_ERROR, {"message": "Clé API OpenAI non configurée. Veuillez définir la variable d'environnement OPENAI_API_KEY."}
+                    return
+                provider, model_name = "openai", OPENAI_MODEL
+                client = get_async_client("openai")
+            else:
+                # Fournisseur simulé, configuré par le champ `model` (mesures de charge)
+                provider, model_name = MOCK_PREFIX, model
+                client = MockAsyncClient(parse_mock_model(model))
+
+            # Appel en streaming via le client asynchrone et le limiteur de débit partagés
+            metrics = CallMetrics("agent_ia_stream", provider, model_name, "serveur", chat_msgs)
+            # aclosing : le flux amont est fermé même si la génération est arrêtée entre deux fragments
+            async with aclosing(completion_events(client, provider, model_name, chat_msgs, metrics)) as events:
+                async for event in events:
+                    yield event
+        except Exception as e:
+            if metrics is not None:
+                metrics.finish(STATUS_ERROR, e)
+            yield EVENT_ERROR, {"message": f"Erreur lors de la communication avec OpenAI: {str(e)}"}
+    elif model == "deepseek":
+        # À adapter pour DeepSeek : ici, fake streaming mot à mot
+        fake_text = "Réponse: Structure DeepSeek générée.\nActions: [{\"type\": \"mkdir\", \"path\": \"deepseek_dir\"}]"
+        for w in fake_text.split():
+            yield EVENT_TOKEN, {"text": w + " "}
+            await asyncio.sleep(0.09)
+        yield EVENT_DONE, {"status": "ok"}
+    else:
+        yield EVENT_ERROR, {"message": f"Modèle non supporté : {model}"}
+
+
+def event_response(buffer, after=0):
+    """Événements du flux suivant `after` ; compte les flux en cours et les octets envoyés (/metrics)."""
+    label = monitoring.model_label(buffer.model)
+
+    async def frames():
+        monitoring.IN_FLIGHT.inc()
+        try:
+            async with aclosing(buffer.subscribe(after)) as source:
+                async for frame in source:
+                    monitoring.BYTES_STREAMED.inc(len(frame.encode("utf-8")), model=label)
+                    yield frame
+        finally:
+            monitoring.IN_FLIGHT.dec()
+
+    headers = {"X-Stream-Id": buffer.stream_id, "Cache-Control": "no-cache"}
+    return StreamingResponse(frames(), media_type="text/event-stream", headers=headers)
+
+
+def error_response(message, status_code):
+    """Erreur avant toute génération : un seul événement `error`."""
+    return StreamingResponse(
+        iter([format_event(EVENT_ERROR, {"message": message})]),
+        status_code=status_code,
+        media_type="text/event-stream",
+    )
+
+
 @app.post("/chat_stream")
 async def chat_stream(request: Request):
+    """
+    Réponse en événements SSE typés (serveur/event_stream.py).
+    Avec l'en-tête Last-Event-ID, reprend le flux correspondant après l'événement indiqué,
+    sans nouvel appel au modèle (404 si le flux a expiré, 410 si le tampon ne couvre plus
+    l'interruption : il faut alors relancer la requête).
+
+    Une déconnexion arrête la génération aussitôt, sauf si la requête initiale porte
+    l'en-tête « X-Resumable: 1 » : elle est alors conservée RESUME_GRACE secondes.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            stream_id, after = parse_event_id(last_event_id)
+        except ValueError as e:
+            return error_response(str(e), 400)
+        buffer = streams.get(stream_id)
+        if buffer is None:
+            return error_response(f"Flux inconnu ou expiré : {stream_id}", 404)
+        if not buffer.can_resume(after):
+            return error_response(f"Événements suivant {last_event_id} perdus, relancer la requête", 410)
+        return event_response(buffer, after)
+
     try:
         body = await request.json()
         message = body.get("message", "")
         model = body.get("model", "openai").lower()
     except Exception as e:
-        return StreamingResponse(
-            iter([f"data: {json.dumps({'text': f'Erreur de traitement de la requête: {str(e)}'})}\n\n"]),
-            media_type="text/event-stream"
-        )
+        return error_response(f"Erreur de traitement de la requête: {str(e)}", 400)
 
-    async def event_generator():
-        if model == "openai":
-            # Prompt pour structurer la réponse
-            prompt = (
-                f"Tu es un assistant pour la création d'arborescences. "
-                f"Donne ta réponse, puis la liste des actions JSON comme dans l'exemple :\n"
-                f"Réponse: Voici ta structure\n"
-                f"Actions: [{{'type':'mkdir','path':'src'}}]"
-            )
-            chat_msgs = [
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": message}
-            ]
-            try:
-                # Vérifier si la clé API est définie
-                if not os.getenv("OPENAI_API_KEY"):
-                    fake_text = "Erreur: Clé API OpenAI non configurée. Veuillez définir la variable d'environnement OPENAI_API_KEY.\nActions: []"
-                    for w in fake_text.split():
-                        yield f"data: {json.dumps({'text': w+' '})}\n\n"
-                        await asyncio.sleep(0.05)
-                    return
-                    
-                # Appel stream OpenAI avec la nouvelle API
-                stream = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=chat_msgs,
-                    max_tokens=600,
-                    stream=True
-                )
-                answer = ""
-                for chunk in stream:
-                    if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-                        part = chunk.choices[0].delta.content
-                        answer += part
-                        yield f"data: {json.dumps({'text': part})}\n\n"
-                        await asyncio.sleep(0)  # Yield to event loop
-            except Exception as e:
-                # En cas d'erreur avec l'API, renvoyer un message d'erreur
-                error_msg = f"Erreur lors de la communication avec OpenAI: {str(e)}\nActions: []"
-                for w in error_msg.split():
-                    yield f"data: {json.dumps({'text': w+' '})}\n\n"
-                    await asyncio.sleep(0.05)
-        elif model == "deepseek":
-            # À adapter pour DeepSeek : ici, fake streaming mot à mot
-            fake_text = "Réponse: Structure DeepSeek générée.\nActions: [{\"type\": \"mkdir\", \"path\": \"deepseek_dir\"}]"
-            for w in fake_text.split():
-                yield f"data: {json.dumps({'text': w+' '})}\n\n"
-                await asyncio.sleep(0.09)
-        else:
-            yield f"data: {json.dumps({'text': '[Modèle non supporté]'})}\n\n"
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    grace = event_stream.RESUME_GRACE if request.headers.get("x-resumable") == "1" else 0.0
+    buffer = streams.start(split_actions(answer_events(message, model)), model, grace)
+    return event_response(buffer)
 
 
-if __name__ == "__main__":
+def main():
     import uvicorn
     from dotenv import load_dotenv
     
@@ -112,3 +331,7 @@ if __name__ == "__main__":
         uvicorn.run(app, host="0.0.0.0", port=8000)
     except Exception as e:
         print(f"\033[91mErreur lors du démarrage du serveur: {str(e)}\033[0m")
+
+
+if __name__ == "__main__":
+    main()
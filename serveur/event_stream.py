@@ -0,0 +1,282 @@
+# event_stream.py
+"""
+Événements SSE typés du serveur IA, avec reprise après coupure.
+
+Chaque réponse de /chat_stream est une suite d'événements :
+    token      {"text": fragment de la réponse}
+    action     une action proposée, ex. {"type": "mkdir", "path": "src"}
+    usage      {"prompt_tokens", "completion_tokens", "cached_tokens"}
+    throttled  {"wait": secondes d'attente imposées par le limiteur de débit}
+    done       {"status": "ok"}          fin normale
+    error      {"message": "..."}        fin sur erreur
+
+La génération est produite par une tâche indépendante de la connexion HTTP : les
+événements sont numérotés (id « <flux>:<n> », n croissant) et conservés dans un tampon
+circulaire borné (RING_SIZE). Un client qui se reconnecte avec l'en-tête Last-Event-ID
+reçoit la suite depuis le tampon, sans nouvel appel au modèle.
+
+Quand plus aucun client n'écoute, la génération est arrêtée aussitôt (le flux amont
+est fermé), sauf pour un client qui a annoncé savoir reprendre (en-tête
+« X-Resumable: 1 ») : elle est alors conservée RESUME_GRACE secondes pour lui laisser
+le temps de se reconnecter. Un flux terminé reste consultable RESUME_TTL secondes.
+"""
+import ast
+import asyncio
+import json
+import uuid
+from collections import deque
+from contextlib import aclosing
+
+EVENT_TOKEN = "token"
+EVENT_ACTION = "action"
+EVENT_USAGE = "usage"
+EVENT_THROTTLED = "throttled"
+EVENT_DONE = "done"
+EVENT_ERROR = "error"
+
+RING_SIZE = 1024
+RESUME_GRACE = 15.0
+RESUME_TTL = 60.0
+
+ACTIONS_MARKER = "Actions:"
+
+
+def format_event(event: str, data, event_id: str = None) -> str:
+    """Trame SSE (id facultatif, type, données JSON)."""
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def parse_event_id(value: str) -> tuple:
+    """
+    « <flux>:<n> » → (flux, n).
+
+    Raises:
+        ValueError: identifiant mal formé
+    """
+    stream_id, sep, seq = (value or "").strip().rpartition(":")
+    if not sep or not stream_id or not seq.isdigit():
+        raise ValueError(f"Last-Event-ID invalide : {value!r}")
+    return stream_id, int(seq)
+
+
+def parse_actions(text: str) -> list:
+    """Liste d'actions écrite par le modèle (JSON, ou littéral Python avec des apostrophes)."""
+    text = text.strip()
+    if not text:
+        return []
+    try:
+        actions = json.loads(text)
+    except ValueError:
+        try:
+            actions = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            raise ValueError(f"Liste d'actions illisible : {text[:200]}") from None
+    if isinstance(actions, dict):
+        actions = [actions]
+    if not isinstance(actions, list) or not all(isinstance(a, dict) for a in actions):
+        raise ValueError(f"Liste d'actions invalide : {text[:200]}")
+    return actions
+
+
+class ActionSplitter:
+    """
+    Sépare, au fil des fragments, le texte de la réponse de la ligne « Actions: [...] ».
+
+    Le texte est transmis dès que possible ; seule une fin de fragment qui pourrait être
+    le début du marqueur est retenue jusqu'au fragment suivant.
+    """
+
+    def __init__(self, marker=ACTIONS_MARKER):
+        self.marker = marker
+        self._pending = ""
+        self._actions = None  # texte reçu après le marqueur
+
+    def feed(self, text: str) -> str:
+        """Texte de réponse à transmettre pour ce fragment (éventuellement vide)."""
+        if self._actions is not None:
+            self._actions += text
+            return ""
+        self._pending += text
+        index = self._pending.find(self.marker)
+        if index >= 0:
+            answer = self._pending[:index]
+            self._actions = self._pending[index + len(self.marker):]
+            self._pending = ""
+            return answer
+        keep = 0
+        for size in range(min(len(self.marker) - 1, len(self._pending)), 0, -1):
+            if self.marker.startswith(self._pending[-size:]):
+                keep = size
+                break
+        answer = self._pending[:len(self._pending) - keep]
+        self._pending = self._pending[len(answer):]
+        return answer
+
+    def finish(self) -> tuple:
+        """(texte restant, actions) en fin de réponse ; une liste illisible est rendue comme texte."""
+        rest, self._pending = self._pending, ""
+        if self._actions is None:
+            return rest, []
+        try:
+            return rest, parse_actions(self._actions)
+        except ValueError:
+            return rest + self.marker + self._actions, []
+
+
+async def split_actions(events):
+    """
+    Transforme la ligne « Actions: [...] » des événements `token` en événements `action`,
+    émis avant `usage` et la fin du flux. Une liste illisible reste transmise comme texte.
+    """
+    splitter = ActionSplitter()
+    flushed = False
+    async with aclosing(events) as source:
+        async for event, data in source:
+            if event == EVENT_TOKEN:
+                text = splitter.feed(data["text"])
+                if text:
+                    yield EVENT_TOKEN, {"text": text}
+                continue
+            if not flushed and event in (EVENT_USAGE, EVENT_DONE, EVENT_ERROR):
+                flushed = True
+                rest, actions = splitter.finish()
+                if rest:
+                    yield EVENT_TOKEN, {"text": rest}
+                for action in actions:
+                    yield EVENT_ACTION, action
+            yield event, data
+
+
+class StreamBuffer:
+    """Événements numérotés d'une réponse, dans un tampon circulaire borné."""
+
+    def __init__(self, stream_id: str, size: int = RING_SIZE, model: str = "", grace: float = 0.0):
+        self.stream_id = stream_id
+        self.model = model  # modèle demandé (étiquette des métriques)
+        self.grace = grace  # délai de reconnexion avant l'arrêt de la génération (secondes)
+        self.frames = deque(maxlen=size)
+        self.last_seq = 0
+        self.finished = False
+        self.subscribers = 0
+        self.producer = None  # asyncio.Task de la génération
+        self._changed = asyncio.Event()
+        self._abort_handle = None
+
+    @property
+    def first_seq(self) -> int:
+        """Numéro du plus ancien événement encore en mémoire."""
+        return self.last_seq - len(self.frames) + 1
+
+    def append(self, event: str, data) -> None:
+        self.last_seq += 1
+        self.frames.append(format_event(event, data, f"{self.stream_id}:{self.last_seq}"))
+        self._wake()
+
+    def finish(self) -> None:
+        self.finished = True
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def can_resume(self, after: int) -> bool:
+        """Les événements suivant `after` sont-ils encore tous dans le tampon ?"""
+        return self.first_seq - 1 <= after <= self.last_seq
+
+    async def subscribe(self, after: int = 0, grace: float = None):
+        """
+        Trames suivant l'événement `after`, puis les nouvelles jusqu'à la fin du flux.
+        Le dernier client parti, la génération est arrêtée après `grace` secondes
+        (par défaut, le délai du flux ; aussitôt s'il est nul).
+        """
+        self._attach()
+        try:
+            next_seq = after + 1
+            while True:
+                changed = self._changed
+                while next_seq <= self.last_seq:
+                    if next_seq < self.first_seq:
+                        # Client trop lent : les événements manquants ont quitté le tampon
+                        yield format_event(EVENT_ERROR, {"message": "Événements perdus, relancer la requête"})
+                        return
+                    yield self.frames[next_seq - self.first_seq]
+                    next_seq += 1
+                if self.finished:
+                    return
+                await changed.wait()
+        finally:
+            self._detach(self.grace if grace is None else grace)
+
+    def _attach(self):
+        self.subscribers += 1
+        if self._abort_handle is not None:
+            self._abort_handle.cancel()
+            self._abort_handle = None
+
+    def _detach(self, grace: float):
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.finished:
+            if grace > 0:
+                self._abort_handle = asyncio.get_running_loop().call_later(grace, self.abort)
+            else:
+                self.abort()
+
+    def abort(self) -> None:
+        """Arrête la génération (fermeture du flux amont)."""
+        self._abort_handle = None
+        if self.producer is not None and not self.producer.done():
+            self.producer.cancel()
+
+
+class StreamRegistry:
+    """Réponses en cours ou récentes, retrouvées par l'identifiant de flux."""
+
+    def __init__(self, ring_size: int = RING_SIZE, ttl: float = RESUME_TTL):
+        self.ring_size = ring_size
+        self.ttl = ttl
+        self._streams = {}
+
+    def start(self, events, model: str = "", grace: float = 0.0) -> StreamBuffer:
+        """
+        Lance la génération en tâche de fond.
+
+        Args:
+            events: générateur asynchrone de couples (type, données)
+            model (str): Modèle demandé
+            grace (float): Délai de reconnexion après le départ du dernier client
+                (0 : génération arrêtée aussitôt)
+        """
+        buffer = StreamBuffer(uuid.uuid4().hex[:16], self.ring_size, model, grace)
+        self._streams[buffer.stream_id] = buffer
+        buffer.producer = asyncio.create_task(self._produce(buffer, events))
+        return buffer
+
+    def get(self, stream_id: str):
+        return self._streams.get(stream_id)
+
+    def __len__(self):
+        return len(self._streams)
+
+    async def _produce(self, buffer, events):
+        try:
+            async with aclosing(events) as source:
+                async for event, data in source:
+                    buffer.append(event, data)
+        except asyncio.CancelledError:
+            pass  # plus personne à l'écoute
+        except Exception as e:
+            print(f"Erreur lors de la génération du flux {buffer.stream_id} : {e}")
+            buffer.append(EVENT_ERROR, {"message": str(e)})
+        finally:
+            buffer.finish()
+            asyncio.get_running_loop().call_later(self.ttl, self._streams.pop, buffer.stream_id, None)
+
+    async def aclose(self) -> None:
+        """Arrête toutes les générations (arrêt du serveur)."""
+        producers = [b.producer for b in self._streams.values() if b.producer and not b.producer.done()]
+        for producer in producers:
+            producer.cancel()
+        await asyncio.gather(*producers, return_exceptions=True)
+        self._streams.clear()
@@ -0,0 +1,177 @@
+# load_test.py
+"""
+Générateur de charge pour le serveur SSE (/chat_stream).
+
+Pour chaque niveau de concurrence, N clients simultanés enchaînent leurs requêtes en
+streaming ; on mesure pour chaque requête le délai avant le premier fragment (TTFT),
+les intervalles entre fragments (latence inter-token) et la durée totale. Le rapport
+donne le débit (requêtes/s, fragments/s) et les percentiles de ces mesures.
+
+Avec le fournisseur simulé (model=mock…, voir services.mock_llm), le test mesure le
+serveur seul, sans quota ni coût :
+
+    python agent_ia_stream.py
+    python -m serveur.load_test --model "mock?tps=50&ttft=0.3" --concurrency 1 10 100 1000
+
+Au-delà de quelques centaines de clients, relever la limite de descripteurs de
+fichiers du système (ulimit -n) côté serveur et côté générateur.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+_project_root_for_sys_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _project_root_for_sys_path not in sys.path:
+    sys.path.insert(0, _project_root_for_sys_path)
+
+from services.llm_telemetry import PERCENTILES, percentile
+
+DEFAULT_URL = "http://127.0.0.1:8000"
+DEFAULT_LEVELS = (1, 10, 100, 1000)
+DEFAULT_MESSAGE = "Crée une arborescence pour un projet Python avec des tests."
+
+
+@dataclass
+class RequestResult:
+    ok: bool
+    ttft: float = None
+    duration: float = 0.0
+    fragments: int = 0
+    gaps: list = field(default_factory=list)  # intervalles entre fragments (s)
+    error: str = None
+
+
+async def run_request(client, url, model, message) -> RequestResult:
+    started = time.monotonic()
+    last = None
+    result = RequestResult(ok=True)
+    try:
+        async with client.stream("POST", f"{url}/chat_stream", json={"message": message, "model": model}) as response:
+            if response.status_code != 200:
+                return RequestResult(ok=False, duration=time.monotonic() - started, error=f"HTTP {response.status_code}")
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                    continue
+                if not line.startswith("data: "):
+                    continue
+                payload = json.loads(line[len("data: "):])
+                if event == "error":
+                    result.ok = False
+                    result.error = payload.get("message", "").strip()
+                    break
+                if event != "token":
+                    continue  # ex. attente imposée par le limiteur de débit, actions, comptes de tokens
+                now = time.monotonic()
+                if last is None:
+                    result.ttft = now - started
+                else:
+                    result.gaps.append(now - last)
+                last = now
+                result.fragments += 1
+    except (httpx.HTTPError, OSError) as e:
+        result.ok = False
+        result.error = f"{type(e).__name__}: {e}"
+    result.duration = time.monotonic() - started
+    return result
+
+
+async def run_level(url, model, concurrency, requests_per_client, message, timeout) -> dict:
+    """Lance `concurrency` clients simultanés et agrège leurs mesures."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+
+        async def worker():
+            return [await run_request(client, url, model, message) for _ in range(requests_per_client)]
+
+        started = time.monotonic()
+        batches = await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall_time = time.monotonic() - started
+
+    results = [r for batch in batches for r in batch]
+    succeeded = [r for r in results if r.ok]
+    errors = {}
+    for r in results:
+        if not r.ok:
+            errors[r.error] = errors.get(r.error, 0) + 1
+
+    report = {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(succeeded),
+        "error_kinds": errors,
+        "wall_time": wall_time,
+        "requests_per_second": len(succeeded) / wall_time if wall_time else 0.0,
+        "fragments_per_second": sum(r.fragments for r in succeeded) / wall_time if wall_time else 0.0,
+    }
+    measures = {
+        "ttft": [r.ttft for r in succeeded if r.ttft is not None],
+        "itl": [gap for r in succeeded for gap in r.gaps],
+        "duration": [r.duration for r in succeeded],
+    }
+    for name, values in measures.items():
+        for p in PERCENTILES:
+            report[f"{name}_p{p}"] = percentile(values, p)
+    return report
+
+
+def _ms(value):
+    return "—" if value is None else f"{value * 1000:.0f}"
+
+
+def format_report(reports) -> str:
+    header = (
+        f"{'clients':>7} {'req':>6} {'err':>5} {'req/s':>7} {'frag/s':>8} "
+        f"{'TTFT p50/p90/p99 (ms)':>23} {'ITL p50/p90/p99 (ms)':>22} {'durée p50/p99 (ms)':>19}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in reports:
+        ttft = "/".join(_ms(r[f"ttft_p{p}"]) for p in PERCENTILES)
+        itl = "/".join(_ms(r[f"itl_p{p}"]) for p in PERCENTILES)
+        duration = f"{_ms(r['duration_p50'])}/{_ms(r['duration_p99'])}"
+        lines.append(
+            f"{r['concurrency']:>7} {r['requests']:>6} {r['errors']:>5} {r['requests_per_second']:>7.1f} "
+            f"{r['fragments_per_second']:>8.0f} {ttft:>23} {itl:>22} {duration:>19}"
+        )
+        for error, count in r["error_kinds"].items():
+            lines.append(f"{'':>7} {count:>6} × {error[:100]}")
+    return "\n".join(lines)
+
+
+async def run(args) -> list:
+    reports = []
+    for concurrency in args.concurrency:
+        print(f"→ {concurrency} client(s) × {args.requests} requête(s)…", flush=True)
+        reports.append(await run_level(args.url, args.model, concurrency, args.requests, args.message, args.timeout))
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge du serveur SSE /chat_stream.")
+    parser.add_argument("--url", default=DEFAULT_URL, help="Adresse du serveur")
+    parser.add_argument("--model", default="mock", help="Champ `model` envoyé (ex. mock:fast, mock?tps=80, openai)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(DEFAULT_LEVELS),
+                        help="Niveaux de concurrence à mesurer")
+    parser.add_argument("--requests", type=int, default=3, help="Requêtes enchaînées par client")
+    parser.add_argument("--message", default=DEFAULT_MESSAGE)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Délai maximal par requête (s)")
+    parser.add_argument("--json", help="Fichier où enregistrer les résultats détaillés")
+    args = parser.parse_args(argv)
+
+    reports = asyncio.run(run(args))
+    print()
+    print(format_report(reports))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "levels": reports}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# monitoring.py
+"""
+Supervision du serveur IA : métriques au format texte de Prometheus (/metrics) et
+sonde de disponibilité (/ready).
+
+Les métriques des appels sont alimentées par la télémétrie LLM (écouteur de
+services.llm_telemetry) : chaque appel du serveur terminé, quel que soit son issue,
+met à jour les compteurs et histogrammes. Le serveur renseigne lui-même les flux en
+cours et les octets envoyés.
+
+La sonde de disponibilité mesure la latence d'une requête légère au fournisseur
+(liste des modèles, sans consommation de tokens) et garde le résultat en cache
+READINESS_TTL secondes, pour que des sondes fréquentes ne sollicitent pas l'API.
+"""
+import asyncio
+import threading
+import time
+
+from services.llm_telemetry import STATUS_ERROR, add_listener
+
+# Source des appels du serveur dans la télémétrie
+SERVER_SOURCE = "agent_ia_stream"
+
+TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0)
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+READINESS_TTL = 30.0
+READINESS_TIMEOUT = 5.0
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in sorted(self._values.items())]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+REQUESTS = Counter("ia_requests_total", "Requêtes /chat_stream terminées, par modèle et issue", ("model", "status"))
+IN_FLIGHT = Gauge("ia_streams_in_flight", "Flux SSE en cours")
+TTFT = Histogram("ia_ttft_seconds", "Délai avant le premier token", ("model",), TTFT_BUCKETS)
+DURATION = Histogram("ia_request_duration_seconds", "Durée totale des réponses", ("model",), DURATION_BUCKETS)
+UPSTREAM_ERRORS = Counter("ia_upstream_errors_total", "Erreurs renvoyées par le fournisseur", ("provider",))
+BYTES_STREAMED = Counter("ia_stream_bytes_total", "Octets envoyés aux clients SSE", ("model",))
+UPSTREAM_UP = Gauge("ia_upstream_up", "Dernière sonde du fournisseur réussie (1) ou non (0)")
+UPSTREAM_CHECK_LATENCY = Gauge("ia_upstream_check_seconds", "Latence de la dernière sonde du fournisseur")
+
+METRICS = (REQUESTS, IN_FLIGHT, TTFT, DURATION, UPSTREAM_ERRORS, BYTES_STREAMED, UPSTREAM_UP, UPSTREAM_CHECK_LATENCY)
+
+
+def model_label(model: str) -> str:
+    """Étiquette de modèle à cardinalité bornée (« mock:fast?tps=80 » → « mock:fast »)."""
+    return (model or "").split("?", 1)[0]
+
+
+def observe_call(row: dict) -> None:
+    """Écouteur de la télémétrie : ne retient que les appels du serveur."""
+    if row["source"] != SERVER_SOURCE:
+        return
+    model = model_label(row["model"])
+    REQUESTS.inc(model=model, status=row["status"])
+    if row["status"] == STATUS_ERROR:
+        UPSTREAM_ERRORS.inc(provider=row["provider"])
+    if row["ttft"] is not None:
+        TTFT.observe(row["ttft"], model=model)
+    DURATION.observe(row["latency"], model=model)
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+class ReadinessProbe:
+    """Vérification du fournisseur, partagée par les sondes concurrentes et mise en cache."""
+
+    def __init__(self, check, ttl=READINESS_TTL, timeout=READINESS_TIMEOUT):
+        """
+        Args:
+            check (callable): Coroutine sans argument qui échoue si le fournisseur est indisponible
+            ttl (float): Durée de validité d'un résultat (secondes)
+        """
+        self.check = check
+        self.ttl = ttl
+        self.timeout = timeout
+        self._lock = asyncio.Lock()
+        self._result = None
+        self._checked_at = None
+
+    async def status(self) -> dict:
+        """{"ready", "latency", "error", "checked_at", "cached"}"""
+        async with self._lock:
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < self.ttl:
+                return dict(self._result, cached=True)
+
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self.check(), self.timeout)
+                self._result = {"ready": True, "latency": time.monotonic() - started, "error": None}
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                self._result = {"ready": False, "latency": time.monotonic() - started, "error": error}
+            self._result["checked_at"] = time.time()
+            self._checked_at = time.monotonic()
+            UPSTREAM_UP.set(1 if self._result["ready"] else 0)
+            UPSTREAM_CHECK_LATENCY.set(self._result["latency"])
+            return dict(self._result, cached=False)
+
+
+add_listener(observe_call)
@@ -0,0 +1,304 @@
+# test_agent_ia_stream.py
+"""
+Tests du serveur SSE /chat_stream, lancé avec uvicorn sur un port libre.
+
+Le fournisseur est remplacé par un faux client asynchrone dont chaque fragment arrive
+après FRAGMENT_DELAY secondes :
+    - plusieurs flux doivent progresser en parallèle (si une lecture bloquait la boucle
+      d'uvicorn, ils seraient servis l'un après l'autre et /health attendrait leur fin) ;
+    - un client qui se déconnecte doit faire fermer le flux amont aussitôt, ou une fois
+      le délai de reconnexion écoulé s'il a annoncé savoir reprendre (X-Resumable) ;
+    - un client qui se reconnecte avec Last-Event-ID reçoit la suite sans nouvel appel.
+
+Lancement : python -m pytest serveur
+"""
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+import uvicorn
+
+_project_root_for_sys_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _project_root_for_sys_path not in sys.path:
+    sys.path.insert(0, _project_root_for_sys_path)
+
+from serveur import agent_ia_stream, event_stream
+from services import llm_telemetry
+
+CLIENTS = 8
+FRAGMENTS = 10
+FRAGMENT_DELAY = 0.1
+
+
+class FakeStream:
+    """Flux de fragments au format des ChatCompletionChunk, produits lentement."""
+
+    def __init__(self, fragments, delay):
+        self.fragments = list(fragments)
+        self.delay = delay
+        self.sent = 0
+        self.closed_at = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.fragments:
+            raise StopAsyncIteration
+        await asyncio.sleep(self.delay)
+        if not self.fragments:
+            raise StopAsyncIteration  # fermé pendant l'attente
+        self.sent += 1
+        delta = SimpleNamespace(content=self.fragments.pop(0))
+        return SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+
+    async def close(self):
+        self.fragments = []
+        self.closed_at = time.monotonic()
+
+
+class FakeAsyncClient:
+    def __init__(self, fragments=FRAGMENTS, parts=None):
+        self.parts = parts or [f"mot{i} " for i in range(fragments)]
+        self.streams = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **_kwargs):
+        stream = FakeStream(self.parts, FRAGMENT_DELAY)
+        self.streams.append(stream)
+        return stream
+
+
+@pytest.fixture
+def provider():
+    return FakeAsyncClient()
+
+
+@pytest.fixture
+def telemetry(monkeypatch, tmp_path):
+    store = llm_telemetry.LLMTelemetry(tmp_path / "metrics.sqlite")
+    monkeypatch.setattr(llm_telemetry, "_telemetry", store)
+    return store
+
+
+@pytest.fixture
+def server_url(monkeypatch, provider, telemetry):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(agent_ia_stream, "get_async_client", lambda *args, **kwargs: provider)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(agent_ia_stream.app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert time.monotonic() < deadline, "le serveur n'a pas démarré"
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        sock.close()
+
+
+async def _events(response):
+    """Événements SSE de la réponse : dicts {"id", "event", "data"}."""
+    event = {}
+    async for line in response.aiter_lines():
+        if not line:
+            if event:
+                yield event
+            event = {}
+        elif not line.startswith(":"):
+            field, _, value = line.partition(": ")
+            event[field] = json.loads(value) if field == "data" else value
+
+
+async def _stream(client, url, started):
+    """Lit un flux complet ; retourne (instant du premier fragment, instant de fin, nb de fragments)."""
+    first = None
+    count = 0
+    async with client.stream("POST", f"{url}/chat_stream", json={"message": "src", "model": "openai"}) as response:
+        assert response.status_code == 200
+        async for event in _events(response):
+            if event["event"] == "token":
+                count += 1
+                if first is None:
+                    first = time.monotonic() - started
+    return first, time.monotonic() - started, count
+
+
+def test_concurrent_streams_progress_in_parallel(server_url):
+    async def scenario():
+        limits = httpx.Limits(max_connections=CLIENTS + 1)
+        async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+            started = time.monotonic()
+            streams = [asyncio.create_task(_stream(client, server_url, started)) for _ in range(CLIENTS)]
+
+            # /health répond pendant que tous les flux sont en cours
+            await asyncio.sleep(FRAGMENT_DELAY * FRAGMENTS / 3)
+            health_started = time.monotonic()
+            health = await client.get(f"{server_url}/health")
+            health_latency = time.monotonic() - health_started
+
+            results = await asyncio.gather(*streams)
+            return time.monotonic() - started, health.status_code, health_latency, results
+
+    elapsed, health_status, health_latency, results = asyncio.run(scenario())
+
+    single_stream = FRAGMENTS * FRAGMENT_DELAY
+    assert all(count == FRAGMENTS for _first, _end, count in results)
+    # En série, il faudrait CLIENTS × single_stream secondes
+    assert elapsed < 2.5 * single_stream, f"flux servis en série ({elapsed:.2f} s)"
+    # Chaque client a reçu son premier fragment avant qu'aucun flux ne soit terminé
+    assert max(first for first, _end, _count in results) < min(end for _first, end, _count in results)
+    assert health_status == 200
+    assert health_latency < single_stream / 2, f"/health bloqué ({health_latency:.2f} s)"
+
+
+@pytest.mark.parametrize("provider, resumable", [
+    (FakeAsyncClient(fragments=100), False),
+    (FakeAsyncClient(fragments=100), True),
+])
+def test_client_disconnect_aborts_upstream(server_url, provider, resumable, telemetry, monkeypatch):
+    monkeypatch.setattr(event_stream, "RESUME_GRACE", 3 * FRAGMENT_DELAY)
+    grace = event_stream.RESUME_GRACE if resumable else 0.0
+    headers = {"X-Resumable": "1"} if resumable else {}
+
+    async def scenario():
+        async with httpx.AsyncClient(timeout=30) as client:
+            received = 0
+            async with client.stream(
+                "POST", f"{server_url}/chat_stream", json={"message": "src", "model": "openai"}, headers=headers
+            ) as response:
+                async for line in response.aiter_lines():
+                    if line.startswith("data: "):
+                        received += 1
+                    if received == 3:
+                        break  # le client ferme la connexion en cours de réponse
+            return time.monotonic()
+
+    left_at = asyncio.run(scenario())
+    deadline = time.monotonic() + 5
+    while not telemetry.rows() and time.monotonic() < deadline:
+        time.sleep(0.02)
+
+    stream = provider.streams[0]
+    assert stream.closed_at is not None, "le flux amont n'a pas été fermé"
+    # Génération arrêtée en amont dans le fragment suivant, ou après le délai de reconnexion
+    assert grace - FRAGMENT_DELAY <= stream.closed_at - left_at < grace + 2 * FRAGMENT_DELAY
+    assert stream.sent < 10
+    assert [row["status"] for row in telemetry.rows()] == [llm_telemetry.STATUS_CLIENT_ABORTED]
+
+
+def _sample(metrics_text, prefix):
+    """Valeur de la ligne de métrique commençant par `prefix` (0 si absente)."""
+    for line in metrics_text.splitlines():
+        if line.startswith(prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_metrics_and_readiness(server_url, monkeypatch):
+    checks = []
+
+    async def check():
+        checks.append(time.monotonic())
+
+    monkeypatch.setattr(agent_ia_stream.readiness, "check", check)
+    monkeypatch.setattr(agent_ia_stream.readiness, "_checked_at", None)
+
+    async def scenario():
+        async with httpx.AsyncClient(timeout=30) as client:
+            before = (await client.get(f"{server_url}/metrics")).text
+            _first, _end, count = await _stream(client, server_url, time.monotonic())
+            after = await client.get(f"{server_url}/metrics")
+            ready = [await client.get(f"{server_url}/ready") for _ in range(3)]
+            return before, count, after, ready
+
+    before, count, after, ready = asyncio.run(scenario())
+
+    assert after.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = after.text
+    ok = 'ia_requests_total{model="gpt-4",status="ok"}'
+    assert _sample(text, ok) - _sample(before, ok) == 1
+    duration = 'ia_request_duration_seconds_count{model="gpt-4"}'
+    assert _sample(text, duration) - _sample(before, duration) == 1
+    assert _sample(text, 'ia_ttft_seconds_bucket{model="gpt-4",le="+Inf"}') >= 1
+    assert _sample(text, 'ia_stream_bytes_total{model="openai"}') > count * len("data: ")
+    assert _sample(text, "ia_streams_in_flight") == 0
+
+    # La vérification du fournisseur est faite une fois puis servie depuis le cache
+    assert [r.status_code for r in ready] == [200, 200, 200]
+    assert len(checks) == 1
+    assert [r.json()["cached"] for r in ready] == [False, True, True]
+
+
+@pytest.mark.parametrize("provider", [FakeAsyncClient(fragments=20)])
+def test_resume_with_last_event_id(server_url, provider):
+    async def scenario():
+        async with httpx.AsyncClient(timeout=30) as client:
+            first = []
+            async with client.stream(
+                "POST", f"{server_url}/chat_stream", json={"message": "src", "model": "openai"},
+                headers={"X-Resumable": "1"},
+            ) as response:
+                async for event in _events(response):
+                    first.append(event)
+                    if len(first) == 5:
+                        break  # connexion coupée
+
+            await asyncio.sleep(3 * FRAGMENT_DELAY)  # la génération continue pendant la coupure
+            async with client.stream(
+                "POST", f"{server_url}/chat_stream", headers={"Last-Event-ID": first[-1]["id"]}
+            ) as response:
+                assert response.status_code == 200
+                rest = [event async for event in _events(response)]
+
+            expired = await client.post(f"{server_url}/chat_stream", headers={"Last-Event-ID": "inconnu:3"})
+            return first, rest, expired.status_code
+
+    first, rest, expired_status = asyncio.run(scenario())
+
+    events = first + rest
+    stream_id = first[0]["id"].split(":")[0]
+    # Identifiants consécutifs : aucun événement perdu ni répété
+    assert [event["id"] for event in events] == [f"{stream_id}:{n}" for n in range(1, len(events) + 1)]
+    text = "".join(event["data"]["text"] for event in events if event["event"] == "token")
+    assert text == "".join(f"mot{i} " for i in range(20))
+    assert [event["event"] for event in events[-2:]] == ["usage", "done"]
+    assert len(provider.streams) == 1, "le modèle a été rappelé à la reprise"
+    assert expired_status == 404
+
+
+@pytest.mark.parametrize("provider", [FakeAsyncClient(parts=[
+    "Réponse: voici", " la structure\nAct", "ions: [{\"type\": \"mkdir\",", " \"path\": \"src\"},",
+    " {'type': 'create_file', 'path': 'src/main.py'}]",
+])])
+def test_actions_are_typed_events(server_url, provider):
+    async def scenario():
+        async with httpx.AsyncClient(timeout=30) as client:
+            async with client.stream(
+                "POST", f"{server_url}/chat_stream", json={"message": "src", "model": "openai"}
+            ) as response:
+                return [event async for event in _events(response)]
+
+    events = asyncio.run(scenario())
+
+    text = "".join(event["data"]["text"] for event in events if event["event"] == "token")
+    assert text == "Réponse: voici la structure\n"
+    assert [event["data"] for event in events if event["event"] == "action"] == [
+        {"type": "mkdir", "path": "src"},
+        {"type": "create_file", "path": "src/main.py"},
+    ]
+    assert [event["event"] for event in events[-3:]] == ["action", "usage", "done"]
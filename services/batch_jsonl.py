@@ -0,0 +1,262 @@
+# services/batch_jsonl.py
+
+"""
+Génération hors ligne par fichiers JSONL, au format de l'API Batch d'OpenAI.
+
+« Générer tout » sur une table des matières complète représente des centaines
+d'appels indépendants dont personne n'attend le résultat en direct. Plutôt que de
+les enchaîner en temps réel, on peut :
+    1. exporter les prompts des sections en attente dans un fichier JSONL
+       (une requête /v1/chat/completions par ligne, identifiée par `custom_id`),
+       accompagné d'un manifeste qui associe chaque `custom_id` à sa section ;
+    2. soumettre ce fichier à l'API Batch (tarif réduit, délai de 24 h au plus),
+       ou le traiter localement avec process_locally() (modèle factice ou cassette
+       enregistrée, pour les essais hors ligne) ;
+    3. importer le fichier de résultats : chaque réponse est rattachée à sa section
+       par `custom_id`.
+
+Utilisation en ligne de commande (traitement local) :
+    python -m services.batch_jsonl requetes.jsonl resultats.jsonl [--cassette chemin.json]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from services.prompt_registry import as_messages, template_id
+
+DEFAULT_BATCH_DIR = Path(__file__).resolve().parent.parent / "saved_docs" / "batches"
+BATCH_ENDPOINT = "/v1/chat/completions"
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+@dataclass
+class BatchResult:
+    custom_id: str
+    content: str = None  # None en cas d'échec
+    error: str = None
+    usage: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.content is not None
+
+
+def make_custom_id(index: int, key: str) -> str:
+    """Identifiant court et stable d'une requête (les chemins de section sont longs)."""
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:10]
+    return f"section-{index:04d}-{digest}"
+
+
+def manifest_path(batch_path) -> Path:
+    batch_path = Path(batch_path)
+    return batch_path.with_name(batch_path.name + MANIFEST_SUFFIX)
+
+
+def build_request(custom_id: str, prompt, model: str, temperature: float = 0.7, max_tokens: int = None) -> dict:
+    """Ligne de requête au format de l'API Batch."""
+    body = {"model": model, "messages": list(as_messages(prompt)), "temperature": temperature}
+    if max_tokens:
+        body["max_tokens"] = max_tokens
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def _write_json_atomic(path: Path, data) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def export_requests(path, entries, model: str, temperature: float = 0.7, max_tokens: int = None,
+                    metadata: dict = None) -> dict:
+    """
+    Écrit les requêtes dans `path` (JSONL) et leur manifeste à côté.
+
+    Args:
+        entries (iterable): Couples (clé, prompt) ; la clé identifie la section côté application
+        metadata (dict): Informations libres conservées dans le manifeste (ex. type de document)
+
+    Returns:
+        dict: le manifeste ({"requests": {custom_id: clé}, ...})
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    requests = {}
+    templates = set()
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for index, (key, prompt) in enumerate(entries):
+            custom_id = make_custom_id(index, key)
+            requests[custom_id] = key
+            templates.add(template_id(prompt))
+            line = build_request(custom_id, prompt, model, temperature, max_tokens)
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+    manifest = {
+        "created_at": time.time(),
+        "model": model,
+        "temperature": temperature,
+        "prompt_versions": sorted(t for t in templates if t),
+        "metadata": metadata or {},
+        "requests": requests,
+    }
+    _write_json_atomic(manifest_path(path), manifest)
+    return manifest
+
+
+def load_manifest(batch_path) -> dict:
+    with open(manifest_path(batch_path), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _parse_result(line: dict) -> BatchResult:
+    custom_id = line.get("custom_id", "")
+    error = line.get("error")
+    if error:
+        message = error.get("message") if isinstance(error, dict) else str(error)
+        return BatchResult(custom_id, error=message or "Erreur inconnue")
+
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    status = response.get("status_code", 200)
+    if status != 200:
+        message = (body.get("error") or {}).get("message") if isinstance(body, dict) else None
+        return BatchResult(custom_id, error=message or f"Statut HTTP {status}")
+
+    choices = body.get("choices") or []
+    if not choices:
+        return BatchResult(custom_id, error="Réponse sans contenu")
+    content = (choices[0].get("message") or {}).get("content") or ""
+    return BatchResult(custom_id, content=content.strip(), usage=body.get("usage") or {})
+
+
+def read_results(path) -> list:
+    """Lit un fichier de résultats de l'API Batch ; les lignes illisibles sont signalées en erreur."""
+    results = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, raw in enumerate(f, start=1):
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                results.append(_parse_result(json.loads(raw)))
+            except (ValueError, AttributeError) as e:
+                results.append(BatchResult("", error=f"Ligne {number} illisible : {e}"))
+    return results
+
+
+def match_results(batch_path, results_path) -> tuple:
+    """
+    Rattache les résultats aux clés exportées grâce au manifeste du lot.
+
+    Returns:
+        tuple: ({clé: contenu}, {clé ou custom_id: message d'erreur})
+    """
+    requests = load_manifest(batch_path)["requests"]
+    contents, errors = {}, {}
+    for result in read_results(results_path):
+        key = requests.get(result.custom_id)
+        if key is None:
+            errors[result.custom_id or "?"] = result.error or "custom_id absent du manifeste"
+        elif result.ok:
+            contents[key] = result.content
+        else:
+            errors[key] = result.error
+    return contents, errors
+
+
+# --- Traitement local (essais hors ligne) ---
+
+def stub_completion(body: dict) -> str:
+    """Modèle factice déterministe : une section HTML reprenant la demande."""
+    request = body["messages"][-1]["content"] if body.get("messages") else ""
+    digest = hashlib.sha1(json.dumps(body, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:8]
+    return f"<h2>{request}</h2>\n<p>Contenu généré hors ligne ({body.get('model', '')}, {digest}).</p>"
+
+
+def client_completion(client):
+    """Adapte un client OpenAI (réseau ou cassette rejouée) au traitement local."""
+    def complete(body):
+        response = client.chat.completions.create(**body)
+        content = response.choices[0].message.content if response.choices else ""
+        usage = response.usage.model_dump() if getattr(response, "usage", None) else {}
+        return content or "", usage
+    return complete
+
+
+def process_locally(input_path, output_path, complete=None) -> int:
+    """
+    Produit un fichier de résultats au format de l'API Batch sans passer par celle-ci.
+
+    Args:
+        complete (callable): Reçoit le corps de la requête et retourne le texte généré,
+            ou un couple (texte, usage) ; par défaut stub_completion
+
+    Returns:
+        int: nombre de requêtes traitées
+    """
+    complete = complete or stub_completion
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with open(input_path, "r", encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as dst:
+        for raw in src:
+            raw = raw.strip()
+            if not raw:
+                continue
+            request = json.loads(raw)
+            count += 1
+            line = {"id": f"batch_req_local_{count:06d}", "custom_id": request["custom_id"]}
+            try:
+                reply = complete(request["body"])
+                content, usage = reply if isinstance(reply, tuple) else (reply, {})
+                line["response"] = {
+                    "status_code": 200,
+                    "request_id": f"local-{count:06d}",
+                    "body": {
+                        "object": "chat.completion",
+                        "model": request["body"].get("model"),
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": usage,
+                    },
+                }
+                line["error"] = None
+            except Exception as e:
+                line["response"] = None
+                line["error"] = {"code": "local_processing_error", "message": str(e)}
+            dst.write(json.dumps(line, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Traite localement un fichier de requêtes JSONL (format API Batch).")
+    parser.add_argument("requests", help="Fichier de requêtes exporté")
+    parser.add_argument("results", help="Fichier de résultats à produire")
+    parser.add_argument("--cassette", help="Cassette à rejouer (services.llm_cassette) au lieu du modèle factice")
+    args = parser.parse_args(argv)
+
+    complete = None
+    if args.cassette:
+        from services import llm_cassette
+        from services.llm_clients import get_client, use_cassette
+        use_cassette(llm_cassette.REPLAY, args.cassette, timing=llm_cassette.TIMING_NONE)
+        complete = client_completion(get_client("openai"))
+
+    count = process_locally(args.requests, args.results, complete)
+    print(f"{count} requêtes traitées -> {args.results}")
+
+
+if __name__ == "__main__":
+    main()
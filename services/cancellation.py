@@ -0,0 +1,65 @@
+# services/cancellation.py
+
+"""
+Annulation coopérative des requêtes LLM.
+
+Un CancellationToken est partagé entre celui qui lance une génération (l'interface)
+et la tâche qui l'exécute. Lors de l'annulation, les ressources enregistrées
+(typiquement le flux HTTP en cours) sont fermées immédiatement, ce qui débloque
+la lecture du flux dans le thread de travail.
+"""
+
+import threading
+
+
+class GenerationCancelled(Exception):
+    """Levée dans une tâche lorsque sa génération a été annulée."""
+
+    def __init__(self, message="Génération annulée"):
+        super().__init__(message)
+
+
+class CancellationToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        """Annule la génération et ferme les ressources enregistrées."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+            self._callbacks.clear()
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Erreur lors de la fermeture d'une ressource annulée : {e}")
+
+    def register(self, callback) -> None:
+        """
+        Enregistre une fonction de fermeture (ex. `stream.close`).
+        Si le jeton est déjà annulé, elle est appelée immédiatement.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def unregister(self, callback) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise GenerationCancelled()
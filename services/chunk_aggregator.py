@@ -0,0 +1,131 @@
+# services/chunk_aggregator.py
+
+"""
+Regroupement des fragments de texte produits en streaming.
+
+Un modèle envoie souvent des fragments de 1 à 3 caractères : les émettre un par un
+vers l'interface provoque des milliers de signaux inter-threads, chacun suivi d'un
+rafraîchissement. Le ChunkAggregator accumule les fragments et ne les transmet que
+toutes les `interval_ms` millisecondes ou dès que `max_chars` caractères sont en
+attente. Un thread de fond unique vide les tampons restés en attente quand le flux
+marque une pause, et flush() force l'envoi du reste en fin de génération.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+DEFAULT_INTERVAL_MS = 16  # environ une image à 60 Hz
+DEFAULT_MAX_CHARS = 256
+
+
+class _FlushScheduler:
+    """Thread de fond partagé qui vide les tampons dont l'échéance est dépassée."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []  # (échéance, numéro d'ordre, agrégateur)
+        self._sequence = itertools.count()
+        self._thread = None
+
+    def schedule(self, aggregator, deadline):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="ChunkAggregator", daemon=True
+                )
+                self._thread.start()
+            heapq.heappush(self._heap, (deadline, next(self._sequence), aggregator))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                deadline, _seq, aggregator = self._heap[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+            aggregator._flush_if_due()
+
+
+_scheduler = _FlushScheduler()
+
+
+class ChunkAggregator:
+    def __init__(self, emit, interval_ms: float = DEFAULT_INTERVAL_MS, max_chars: int = DEFAULT_MAX_CHARS):
+        """
+        Args:
+            emit (callable): Reçoit le texte regroupé (ex. `signals.chunk.emit`)
+            interval_ms (float): Délai maximal entre la réception d'un fragment et son envoi
+            max_chars (int): Taille du tampon déclenchant un envoi immédiat
+        """
+        self.emit = emit
+        self.interval = max(0.0, interval_ms) / 1000.0
+        self.max_chars = max(1, int(max_chars))
+        # Le verrou couvre aussi l'émission pour garantir l'ordre des fragments
+        # entre le thread producteur et le thread de fond.
+        self._lock = threading.RLock()
+        self._buffer = []
+        self._size = 0
+        self._deadline = None
+        self._closed = False
+        self.received = 0  # fragments reçus
+        self.emitted = 0  # envois effectués
+
+    def add(self, text: str) -> None:
+        """Ajoute un fragment ; l'envoie immédiatement si le tampon est plein ou échu."""
+        if not text:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            self.received += 1
+            self._buffer.append(text)
+            self._size += len(text)
+            now = time.monotonic()
+            if self._size >= self.max_chars or self.interval == 0:
+                self._emit_locked()
+            elif self._deadline is None:
+                self._deadline = now + self.interval
+                _scheduler.schedule(self, self._deadline)
+            elif now >= self._deadline:
+                self._emit_locked()
+
+    def flush(self) -> None:
+        """Envoie immédiatement le texte en attente (à appeler en fin de flux)."""
+        with self._lock:
+            self._emit_locked()
+
+    def close(self) -> None:
+        """Envoie le reste puis ignore tout fragment ultérieur."""
+        with self._lock:
+            self._emit_locked()
+            self._closed = True
+
+    def discard(self) -> None:
+        """Abandonne le texte en attente sans l'envoyer (ex. génération annulée)."""
+        with self._lock:
+            self._buffer = []
+            self._size = 0
+            self._deadline = None
+            self._closed = True
+
+    def _flush_if_due(self):
+        with self._lock:
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                self._emit_locked()
+
+    def _emit_locked(self):
+        self._deadline = None
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._size = 0
+        self.emitted += 1
+        self.emit(text)
@@ -0,0 +1,138 @@
+# services/code_chunks.py
+
+"""
+Découpage d'un module Python en parties refactorisables indépendamment.
+
+Le source est partagé avec `ast` en segments contigus qui, mis bout à bout, le
+redonnent exactement :
+    - les fonctions et classes de premier niveau (décorateurs compris), regroupées
+      tant qu'elles restent sous `max_lines` lignes, forment les parties à refactoriser ;
+    - tout le reste (imports, constantes, variables globales, code de premier niveau)
+      forme le contexte du module, transmis tel quel avec chaque partie et jamais modifié.
+
+Après refactorisation, reassemble() remplace chaque partie par sa nouvelle version
+(ou la conserve si elle a échoué) et vérifie que le module obtenu s'analyse toujours.
+"""
+
+import ast
+import re
+from dataclasses import dataclass
+
+DEFAULT_MAX_LINES = 200  # taille visée d'une partie envoyée au modèle
+MAX_CONTEXT_LINES = 120  # au-delà, le contexte du module est tronqué dans les prompts
+
+_CODE_BLOCK_RE = re.compile(r"```(?:python|py)?[ \t]*\n(.*?)```", re.DOTALL)
+
+
+@dataclass
+class Segment:
+    text: str
+    start_line: int  # 1-indexé
+    end_line: int
+    name: str = ""  # noms des définitions couvertes ("" pour le contexte du module)
+
+    @property
+    def refactorable(self) -> bool:
+        return bool(self.name)
+
+
+def _definition_ranges(tree: ast.Module) -> list:
+    """[(première ligne, dernière ligne, nom)] des fonctions et classes de premier niveau."""
+    ranges = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            ranges.append((start, node.end_lineno, node.name))
+    return ranges
+
+
+def _is_blank(lines) -> bool:
+    return all(not line.strip() or line.lstrip().startswith("#") for line in lines)
+
+
+def split_module(source: str, max_lines: int = DEFAULT_MAX_LINES) -> list:
+    """
+    Segments contigus du module (voir l'en-tête). Les définitions consécutives, séparées
+    seulement par des lignes vides ou des commentaires, sont regroupées jusqu'à `max_lines`.
+
+    Raises:
+        SyntaxError: si le source n'est pas du Python valide
+    """
+    tree = ast.parse(source)
+    lines = source.splitlines(keepends=True)
+    segments = []
+    cursor = 1  # première ligne pas encore attribuée
+
+    def add(start, end, name=""):
+        if end >= start:
+            segments.append(Segment("".join(lines[start - 1:end]), start, end, name))
+
+    for start, end, name in _definition_ranges(tree):
+        gap = lines[cursor - 1:start - 1]
+        previous = segments[-1] if segments else None
+        if (
+            previous is not None
+            and previous.refactorable
+            and previous.end_line == cursor - 1
+            and _is_blank(gap)
+            and end - previous.start_line + 1 <= max_lines
+        ):
+            # Regrouper avec la partie précédente (lignes intermédiaires comprises)
+            segments[-1] = Segment(
+                "".join(lines[previous.start_line - 1:end]),
+                previous.start_line,
+                end,
+                f"{previous.name}, {name}",
+            )
+        else:
+            add(cursor, start - 1)
+            add(start, end, name)
+        cursor = end + 1
+    add(cursor, len(lines))
+    return segments
+
+
+def module_context(segments: list, max_lines: int = MAX_CONTEXT_LINES) -> str:
+    """Imports, constantes et code de premier niveau, transmis avec chaque partie."""
+    text = "".join(s.text for s in segments if not s.refactorable)
+    kept = [line for line in text.splitlines() if line.strip()]
+    if len(kept) > max_lines:
+        kept = kept[:max_lines] + ["# ... (contexte tronqué)"]
+    return "\n".join(kept)
+
+
+def extract_code(reply: str) -> str:
+    """Code renvoyé par le modèle : le premier bloc Markdown, sinon la réponse entière."""
+    match = _CODE_BLOCK_RE.search(reply)
+    return (match.group(1) if match else reply).strip("\n")
+
+
+def check_replacement(segment: Segment, code: str) -> str:
+    """
+    Valide la nouvelle version d'une partie et la normalise (fin de ligne conservée).
+
+    Raises:
+        ValueError: si le code est vide, invalide ou ne définit plus de fonction ni de classe
+    """
+    if not code.strip():
+        raise ValueError("réponse vide")
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        raise ValueError(f"code invalide (ligne {e.lineno}) : {e.msg}") from None
+    if not _definition_ranges(tree):
+        raise ValueError("aucune fonction ni classe dans la réponse")
+    trailing = segment.text[len(segment.text.rstrip("\n")):]
+    return code.rstrip("\n") + (trailing or "\n")
+
+
+def reassemble(segments: list, replacements: dict) -> str:
+    """
+    Recompose le module ; `replacements` associe l'indice d'un segment à son nouveau texte.
+
+    Raises:
+        SyntaxError: si le module recomposé ne s'analyse pas
+    """
+    source = "".join(replacements.get(i, s.text) for i, s in enumerate(segments))
+    ast.parse(source)
+    return source
@@ -0,0 +1,193 @@
+# services/code_patch.py
+
+"""
+Application locale des modifications renvoyées par le modèle en mode « edits ».
+
+Plutôt que de regénérer un fichier entier pour en changer deux lignes, le modèle
+renvoie seulement ses modifications, sous l'une de ces deux formes :
+
+    - des blocs rechercher/remplacer ancrés sur le code existant :
+
+        <<<<<<< SEARCH
+        lignes actuelles, recopiées à l'identique
+        =======
+        nouvelles lignes
+        >>>>>>> REPLACE
+
+    - un diff unifié (```diff ... ```), dont chaque hunk devient un bloc
+      rechercher/remplacer (lignes de contexte et supprimées → lignes de contexte et ajoutées).
+
+Chaque modification doit correspondre à un seul endroit du code actuel : une
+modification introuvable (code modifié entre-temps, recopie inexacte) ou ambiguë est
+rejetée et signalée, les autres sont appliquées. Le résultat est vérifié (syntaxe
+Python) et un aperçu sous forme de diff unifié est produit.
+"""
+
+import ast
+import difflib
+import re
+from dataclasses import dataclass, field
+
+_SEARCH_REPLACE_RE = re.compile(
+    r"^<{5,9} ?SEARCH[^\n]*\n(.*?)^={5,9}[ \t]*\n(.*?)^>{5,9} ?REPLACE[^\n]*$",
+    re.DOTALL | re.MULTILINE,
+)
+_DIFF_BLOCK_RE = re.compile(r"```(?:diff|patch)[ \t]*\n(.*?)```", re.DOTALL)
+_HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(ValueError):
+    """Réponse sans modification exploitable, ou résultat invalide."""
+
+
+@dataclass
+class Edit:
+    search: str
+    replace: str
+    label: str = ""  # repère pour les messages (n° du bloc ou en-tête du hunk)
+
+
+@dataclass
+class PatchResult:
+    code: str
+    applied: list = field(default_factory=list)  # [Edit]
+    rejected: list = field(default_factory=list)  # [(Edit, raison)]
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.applied)
+
+
+def _parse_search_replace(reply: str) -> list:
+    return [
+        Edit(search, replace, f"bloc {number}")
+        for number, (search, replace) in enumerate(_SEARCH_REPLACE_RE.findall(reply), 1)
+    ]
+
+
+def _parse_unified_diff(diff: str) -> list:
+    edits = []
+    old, new, header = [], [], None
+
+    def close():
+        if header is not None and (old or new):
+            edits.append(Edit("".join(old), "".join(new), header))
+
+    for line in diff.splitlines(keepends=True):
+        if line.startswith(("--- ", "+++ ", "diff ", "index ")):
+            continue
+        match = _HUNK_HEADER_RE.match(line)
+        if match:
+            close()
+            old, new, header = [], [], line.strip()
+            continue
+        if header is None:
+            continue
+        body = line[1:] if line[:1] in (" ", "-", "+") else line
+        if not body.endswith("\n"):
+            body += "\n"
+        if line.startswith("-"):
+            old.append(body)
+        elif line.startswith("+"):
+            new.append(body)
+        elif line.startswith("\\"):
+            continue  # « \ No newline at end of file »
+        else:
+            old.append(body)
+            new.append(body)
+    close()
+    return edits
+
+
+def parse_edits(reply: str) -> list:
+    """
+    Modifications contenues dans la réponse du modèle.
+
+    Raises:
+        PatchError: si la réponse ne contient ni bloc rechercher/remplacer ni diff unifié
+    """
+    edits = _parse_search_replace(reply)
+    if not edits:
+        blocks = _DIFF_BLOCK_RE.findall(reply)
+        edits = [e for block in blocks for e in _parse_unified_diff(block)]
+    if not edits and _HUNK_HEADER_RE.search(reply):
+        edits = _parse_unified_diff(reply)  # diff sans bloc Markdown
+    if not edits:
+        raise PatchError("Aucune modification reconnue dans la réponse (blocs SEARCH/REPLACE ou diff unifié attendus)")
+    return edits
+
+
+def _locate(source: str, search: str) -> tuple:
+    """(début, fin) de l'unique occurrence de `search`, en tolérant les espaces de fin de ligne."""
+    count = source.count(search)
+    if count == 1:
+        start = source.index(search)
+        return start, start + len(search)
+    if count > 1:
+        raise PatchError(f"passage présent {count} fois, ajouter du contexte pour lever l'ambiguïté")
+
+    # Recherche ligne à ligne en ignorant les espaces de fin (fréquents dans les recopies)
+    lines = source.splitlines(keepends=True)
+    wanted = [line.rstrip() for line in search.splitlines()]
+    matches = [
+        i for i in range(len(lines) - len(wanted) + 1)
+        if [line.rstrip() for line in lines[i:i + len(wanted)]] == wanted
+    ]
+    if len(matches) > 1:
+        raise PatchError(f"passage présent {len(matches)} fois, ajouter du contexte pour lever l'ambiguïté")
+    if not matches:
+        raise PatchError("passage introuvable dans le code actuel (modification obsolète ou recopie inexacte)")
+    start = sum(len(line) for line in lines[:matches[0]])
+    end = start + sum(len(line) for line in lines[matches[0]:matches[0] + len(wanted)])
+    return start, end
+
+
+def apply_edits(source: str, edits: list) -> PatchResult:
+    """Applique les modifications dans l'ordre ; celles qui ne s'ancrent pas sont rejetées."""
+    code = source
+    result = PatchResult(code)
+    for edit in edits:
+        if not edit.search.strip():
+            result.rejected.append((edit, "passage à rechercher vide"))
+            continue
+        try:
+            start, end = _locate(code, edit.search)
+        except PatchError as e:
+            result.rejected.append((edit, str(e)))
+            continue
+        replace = edit.replace
+        if code[start:end].endswith("\n") and replace and not replace.endswith("\n"):
+            replace += "\n"
+        code = code[:start] + replace + code[end:]
+        result.applied.append(edit)
+    result.code = code
+    return result
+
+
+def check_python(code: str, source: str = None) -> None:
+    """
+    Vérifie la syntaxe du code modifié (si `source` est fourni, seulement quand le
+    code d'origine était lui-même du Python valide).
+
+    Raises:
+        PatchError: si le code modifié n'est plus du Python valide
+    """
+    if source is not None:
+        try:
+            ast.parse(source)
+        except SyntaxError:
+            return
+    try:
+        ast.parse(code)
+    except SyntaxError as e:
+        raise PatchError(f"Code modifié invalide (ligne {e.lineno}) : {e.msg}") from None
+
+
+def preview(source: str, code: str, name: str = "code.py") -> str:
+    """Diff unifié entre le code d'origine et le code modifié."""
+    return "".join(difflib.unified_diff(
+        source.splitlines(keepends=True),
+        code.splitlines(keepends=True),
+        fromfile=f"a/{name}",
+        tofile=f"b/{name}",
+    ))
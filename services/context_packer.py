@@ -0,0 +1,355 @@
+# services/context_packer.py
+
+"""
+Construction d'un contexte de projet borné en tokens pour les prompts de documentation.
+
+Plutôt que de prendre les premiers fichiers rencontrés par os.walk, les fichiers
+Python sont classés (points d'entrée, modules les plus importés, taille), puis le
+contexte est rempli dans cet ordre : un résumé de chaque fichier (docstring,
+classes, fonctions), suivi d'un extrait de son code tant que le budget le permet.
+Le budget est une fraction de la fenêtre de contexte du modèle choisi, et le
+nombre de tokens consommés par fichier est rapporté.
+
+Les fichiers et leurs résumés proviennent du ProjectIndex persistant du projet :
+seuls les fichiers modifiés depuis la dernière requête sont relus.
+Le comptage utilise tiktoken s'il est installé, sinon l'estimation ~4 caractères/token.
+"""
+
+import math
+import os
+from dataclasses import dataclass
+
+from services.project_index import ProjectIndex
+from services.rate_limiter import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:  # dépendance optionnelle
+    tiktoken = None
+
+# Fenêtre de contexte (tokens) des modèles utilisés par l'application
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16_385,
+    "gpt-4": 8_192,
+    "gpt-4-turbo": 128_000,
+    "gpt-4-turbo-preview": 128_000,
+    "gpt-4o": 128_000,
+    "gpt-4o-mini": 128_000,
+    "deepseek-chat": 64_000,
+}
+DEFAULT_CONTEXT_WINDOW = 8_192
+
+# Part de la fenêtre réservée au contexte du projet (le reste : consignes et réponse)
+DEFAULT_CONTEXT_FRACTION = 0.5
+
+# Répartition du budget
+README_SHARE = 0.15
+TREE_SHARE = 0.10
+MAX_EXCERPT_SHARE = 0.25  # un seul fichier ne peut consommer plus de 25 % du budget
+
+_encodings = {}
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    """Nombre de tokens de `text` pour `model` (tiktoken si disponible, sinon estimation)."""
+    if not text:
+        return 0
+    if tiktoken is None:
+        return estimate_tokens(text)
+    encoding = _encodings.get(model)
+    if encoding is None:
+        try:
+            encoding = tiktoken.encoding_for_model(model or "")
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        _encodings[model] = encoding
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def context_window(model: str) -> int:
+    """Taille (tokens) de la fenêtre de contexte de `model`, prompt et réponse compris."""
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+def context_budget(model: str, fraction: float = DEFAULT_CONTEXT_FRACTION) -> int:
+    """Budget en tokens accordé au contexte du projet pour `model`."""
+    return int(context_window(model) * fraction)
+
+
+@dataclass
+class PackedContext:
+    text: str
+    budget: int
+    used_tokens: int
+    file_tokens: dict  # {chemin relatif: tokens consommés}
+    skipped_files: list  # fichiers sans place dans le budget
+
+    def report(self) -> str:
+        """Rapport lisible de la consommation du budget, fichier par fichier."""
+        lines = [f"Contexte : {self.used_tokens}/{self.budget} tokens"]
+        for path, tokens in self.file_tokens.items():
+            lines.append(f"  {tokens:>6}  {path}")
+        if self.skipped_files:
+            lines.append(f"  {len(self.skipped_files)} fichier(s) hors budget")
+        return "\n".join(lines)
+
+
+def _module_name(rel_path):
+    parts = rel_path[:-3].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+
+def rank_files(files):
+    """
+    Classe les fichiers Python indexés par importance : points d'entrée, puis modules
+    les plus importés par le reste du projet ; les très gros fichiers sont légèrement pénalisés.
+    """
+    by_module = {_module_name(f.path): f.path for f in files}
+    imported_by = {f.path: 0 for f in files}
+    for f in files:
+        own = _module_name(f.path)
+        targets = set()
+        for name in f.imports:
+            # "pkg.mod.Classe" → "pkg.mod" si c'est un module du projet
+            while name and name not in by_module:
+                name = name.rpartition(".")[0]
+            if name and name != own:
+                targets.add(by_module[name])
+        for path in targets:
+            imported_by[path] += 1
+
+    def score(f):
+        return (
+            (10.0 if f.is_entry_point else 0.0)
+            + 3.0 * math.log1p(imported_by[f.path])
+            - 0.5 * math.log1p(f.tokens / 1000)
+        )
+
+    return sorted(files, key=lambda f: (-score(f), f.path))
+
+
+def _truncate(text, max_tokens, model):
+    """Coupe `text` sur une fin de ligne pour tenir dans `max_tokens`."""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    # Approximation par caractères, affinée ligne par ligne
+    ratio = max_tokens / max(count_tokens(text, model), 1)
+    cut = text[: int(len(text) * ratio)]
+    cut = cut[: cut.rfind("\n")] if "\n" in cut else cut
+    while cut and count_tokens(cut, model) > max_tokens:
+        cut = cut[: cut.rfind("\n")] if "\n" in cut else ""
+    return cut
+
+
+def _tree_listing(paths):
+    """Arborescence indentée à partir des chemins relatifs indexés."""
+    lines = []
+    seen_dirs = set()
+    for path in sorted(paths):
+        parts = path.split("/")
+        for depth, name in enumerate(parts[:-1]):
+            directory = "/".join(parts[: depth + 1])
+            if directory not in seen_dirs:
+                seen_dirs.add(directory)
+                lines.append(f"{'  ' * depth}- {name}/")
+        lines.append(f"{'  ' * (len(parts) - 1)}- {parts[-1]}")
+    return "\n".join(lines)
+
+
+def pack_project_context(
+    root: str,
+    model: str,
+    fraction: float = DEFAULT_CONTEXT_FRACTION,
+    budget: int = None,
+    index: ProjectIndex = None,
+) -> PackedContext:
+    """
+    Construit le contexte d'un projet dans la limite d'un budget de tokens.
+
+    Args:
+        root (str): Dossier racine du projet
+        model (str): Modèle cible (détermine la fenêtre de contexte et l'encodage)
+        fraction (float): Part de la fenêtre de contexte accordée au projet
+        budget (int): Budget explicite en tokens (prioritaire sur `fraction`)
+        index (ProjectIndex): Index du projet à réutiliser (rafraîchi ici)
+    """
+    budget = budget or context_budget(model, fraction)
+    if index is None:
+        index = ProjectIndex(root)
+    index.refresh()
+    parts = []
+    file_tokens = {}
+    used = 0
+
+    def add(section, key=None):
+        nonlocal used
+        # Le séparateur de ligne entre sections est compté avec la section
+        tokens = count_tokens(section, model) + 1
+        parts.append(section)
+        used += tokens
+        if key is not None:
+            file_tokens[key] = file_tokens.get(key, 0) + tokens
+        return tokens
+
+    add(f"📁 Projet : {os.path.basename(os.path.abspath(root))}")
+
+    # README
+    if index.get("README.md") is not None:
+        readme = _truncate(index.read("README.md"), int(budget * README_SHARE), model)
+        if readme:
+            add(f"📄 README.md:\n{readme}", "README.md")
+
+    # Arborescence (tronquée si le projet est grand)
+    all_files = index.files()
+    tree = _truncate(_tree_listing(f.path for f in all_files), int(budget * TREE_SHARE), model)
+    add(f"📂 Structure du projet :\n{tree}")
+
+    # Classement des fichiers Python à partir de leurs résumés indexés
+    ranked = rank_files([f for f in all_files if f.language == "python"])
+
+    # 1er passage : les résumés, dans l'ordre d'importance
+    add("\n🧠 Résumés des modules :")
+    summarized = []
+    skipped = []
+    for source in ranked:
+        if used + count_tokens(source.summary, model) + 1 > budget:
+            skipped.append(source.path)
+            continue
+        add(source.summary, source.path)
+        summarized.append(source)
+
+    # 2e passage : les extraits de code, tant qu'il reste du budget
+    excerpts_title = "\n🧾 Extraits de code :"
+    if summarized and used + count_tokens(excerpts_title, model) + 100 < budget:
+        add(excerpts_title)
+    for source in summarized:
+        remaining = budget - used
+        if remaining < 100:
+            break
+        header = f"\n### {source.path} :\n```python\n"
+        limit = min(remaining, int(budget * MAX_EXCERPT_SHARE)) - count_tokens(header + "\n```", model) - 1
+        excerpt = _truncate(index.read(source.path), limit, model) if limit > 0 else ""
+        if excerpt.strip():
+            add(f"{header}{excerpt}\n```", source.path)
+
+    return PackedContext(
+        text="\n".join(parts),
+        budget=budget,
+        used_tokens=used,
+        file_tokens=file_tokens,
+        skipped_files=skipped,
+    )
+
+
+# --- Découpage pour la génération map-reduce ---
+
+# Langages dont le code est résumé en phase « map »
+CODE_LANGUAGES = {
+    "python", "javascript", "typescript", "java", "kotlin", "go", "rust", "c", "cpp",
+    "csharp", "ruby", "php", "swift", "sql", "shell",
+}
+
+# Taille maximale d'un morceau, en part de la fenêtre de contexte (le reste : consignes et résumé)
+DEFAULT_CHUNK_FRACTION = 0.4
+MAX_CHUNK_TOKENS = 12_000
+
+
+@dataclass
+class ProjectChunk:
+    name: str  # dossier ou fichier couvert
+    files: list  # chemins relatifs inclus
+    text: str
+    tokens: int
+
+
+def chunk_budget(model: str, fraction: float = DEFAULT_CHUNK_FRACTION) -> int:
+    """Taille maximale (tokens) d'un morceau envoyé en phase « map »."""
+    return min(int(context_window(model) * fraction), MAX_CHUNK_TOKENS)
+
+
+def code_tokens(index: ProjectIndex) -> int:
+    """Taille totale estimée du code du projet indexé."""
+    return sum(f.tokens for f in index.files() if f.language in CODE_LANGUAGES)
+
+
+def _split_lines(text, max_tokens, model):
+    """Découpe un gros fichier en parties de `max_tokens` tokens, sur des fins de ligne."""
+    parts = []
+    current = []
+    current_tokens = 0
+    for line in text.splitlines(keepends=True):
+        tokens = count_tokens(line, model)
+        if current and current_tokens + tokens > max_tokens:
+            parts.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += tokens
+    if current:
+        parts.append("".join(current))
+    return parts
+
+
+def split_into_chunks(index: ProjectIndex, model: str, max_tokens: int = None) -> list:
+    """
+    Regroupe les fichiers de code par dossier en morceaux d'au plus `max_tokens` tokens.
+    Un fichier trop gros est découpé en plusieurs parties. L'index doit être à jour.
+    """
+    max_tokens = max_tokens or chunk_budget(model)
+    chunks = []
+    current = []  # [(chemin, bloc)]
+    current_dir = None
+    current_tokens = 0
+
+    def close_current():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append(ProjectChunk(
+                name=current_dir or ".",
+                files=[path for path, _ in current],
+                text="\n".join(block for _, block in current),
+                tokens=current_tokens,
+            ))
+        current, current_tokens = [], 0
+
+    for entry in index.files():
+        if entry.language not in CODE_LANGUAGES:
+            continue
+        text = index.read(entry.path)
+        if not text.strip():
+            continue
+        directory = entry.path.rpartition("/")[0]
+        block = f"### {entry.path}\n```{entry.language}\n{text}\n```"
+        tokens = count_tokens(block, model)
+
+        if tokens > max_tokens:
+            close_current()
+            # Marge pour l'en-tête et l'écart entre comptage par ligne et comptage global
+            pieces = _split_lines(text, int(max_tokens * 0.9) - 50, model)
+            for number, piece in enumerate(pieces, 1):
+                label = f"{entry.path} (partie {number}/{len(pieces)})"
+                piece_block = f"### {label}\n```{entry.language}\n{piece}\n```"
+                chunks.append(ProjectChunk(label, [entry.path], piece_block, count_tokens(piece_block, model)))
+            continue
+
+        if directory != current_dir or current_tokens + tokens > max_tokens:
+            close_current()
+            current_dir = directory
+        current.append((entry.path, block))
+        current_tokens += tokens
+
+    close_current()
+    return chunks
+
+
+def project_overview(index: ProjectIndex, model: str, budget: int) -> str:
+    """En-tête commun (nom, README, arborescence) borné à `budget` tokens."""
+    parts = [f"📁 Projet : {os.path.basename(index.root)}"]
+    if index.get("README.md") is not None:
+        readme = _truncate(index.read("README.md"), budget // 2, model)
+        if readme:
+            parts.append(f"📄 README.md:\n{readme}")
+    tree = _truncate(_tree_listing(f.path for f in index.files()), budget // 2, model)
+    parts.append(f"📂 Structure du projet :\n{tree}")
+    return "\n".join(parts)
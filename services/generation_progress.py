@@ -0,0 +1,108 @@
+# services/generation_progress.py
+
+"""
+Progression réelle d'une génération en streaming.
+
+La progression est calculée à partir des tokens reçus, rapportés à la longueur
+attendue de la réponse : soit `max_tokens`, soit une longueur apprise par section
+à partir des générations précédentes (moyenne mobile exponentielle).
+On mesure aussi le temps avant le premier token (TTFT) et le débit en tokens/s.
+"""
+
+import json
+import threading
+import time
+from pathlib import Path
+
+from services.rate_limiter import estimate_tokens
+
+DEFAULT_EXPECTED_TOKENS = 1500
+
+# Plage de la barre de progression réservée à la réception du flux
+STREAM_PROGRESS_START = 40
+STREAM_PROGRESS_END = 95
+
+
+class ExpectedLengthModel:
+    """Longueur de réponse attendue par section, apprise et enregistrée sur disque."""
+
+    SMOOTHING = 0.3  # poids de la dernière génération dans la moyenne
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._lengths = {}
+        try:
+            if self.path.exists():
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._lengths = json.load(f)
+        except Exception as e:
+            print(f"Erreur lors du chargement des longueurs attendues: {e}")
+
+    def expected(self, key: str, group: str = None, default: int = DEFAULT_EXPECTED_TOKENS) -> int:
+        """
+        Retourne la longueur attendue (en tokens) pour `key`, à défaut celle du
+        groupe (ex. type de document), à défaut `default`.
+        """
+        with self._lock:
+            value = self._lengths.get(key)
+            if value is None and group is not None:
+                value = self._lengths.get(f"group:{group}")
+        return int(value) if value else default
+
+    def record(self, key: str, tokens: int, group: str = None) -> None:
+        """Intègre la longueur d'une génération terminée."""
+        if tokens <= 0:
+            return
+        with self._lock:
+            for name in [key] + ([f"group:{group}"] if group else []):
+                previous = self._lengths.get(name)
+                self._lengths[name] = (
+                    tokens
+                    if previous is None
+                    else previous + self.SMOOTHING * (tokens - previous)
+                )
+            data = dict(self._lengths)
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"Erreur lors de l'enregistrement des longueurs attendues: {e}")
+
+
+class StreamProgress:
+    """Suivi d'un flux : tokens reçus, TTFT, débit et pourcentage de progression."""
+
+    def __init__(self, expected_tokens: int = None):
+        self.expected_tokens = max(1, expected_tokens or DEFAULT_EXPECTED_TOKENS)
+        self.started_at = time.monotonic()
+        self.first_token_at = None
+        self.tokens = 0
+
+    def add(self, text: str) -> None:
+        if not text:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        # Un fragment de flux correspond en général à un token
+        self.tokens += estimate_tokens(text)
+
+    @property
+    def ttft(self) -> float | None:
+        """Temps avant le premier token, en secondes."""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def tokens_per_second(self) -> float:
+        if self.first_token_at is None:
+            return 0.0
+        elapsed = time.monotonic() - self.first_token_at
+        return self.tokens / elapsed if elapsed > 0 else 0.0
+
+    def percent(self) -> int:
+        """Pourcentage dans [STREAM_PROGRESS_START, STREAM_PROGRESS_END)."""
+        ratio = min(self.tokens / self.expected_tokens, 0.99)
+        span = STREAM_PROGRESS_END - STREAM_PROGRESS_START
+        return STREAM_PROGRESS_START + int(span * ratio)
@@ -0,0 +1,148 @@
+# services/llm_cache.py
+
+"""
+Cache persistant des réponses LLM, adressé par le contenu de la requête.
+
+Une réponse est identifiée par l'empreinte SHA-256 de (modèle, prompt, température).
+Les entrées sont stockées dans une base SQLite et évincées selon leur âge et
+selon la taille totale du cache (les moins récemment utilisées partent en premier).
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024  # 50 Mo
+DEFAULT_MAX_AGE = 30 * 24 * 3600  # 30 jours
+
+
+def make_cache_key(model: str, prompt: str, temperature: float) -> str:
+    """Calcule la clé de cache d'une requête."""
+    payload = json.dumps(
+        {"model": model, "prompt": prompt, "temperature": round(float(temperature), 4)},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Cache LRU sur disque des réponses LLM.
+
+    L'objet est partagé entre le thread de l'interface et les tâches du QThreadPool :
+    toutes les opérations sont protégées par un verrou.
+    """
+
+    def __init__(self, db_path, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.db_path = Path(db_path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)"
+        )
+        self._conn.commit()
+        self.evict()
+
+    def get(self, key: str) -> str | None:
+        """Retourne la réponse en cache (et la marque comme récemment utilisée), ou None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, content: str) -> None:
+        """Enregistre une réponse puis applique la politique d'éviction."""
+        if not content:
+            return
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO responses (key, model, content, size, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, model, content, size, now, now),
+            )
+            self._conn.commit()
+        self.evict()
+
+    def evict(self) -> None:
+        """Supprime les entrées expirées puis les moins récemment utilisées au-delà de max_bytes."""
+        with self._lock:
+            if self.max_age:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?",
+                    (time.time() - self.max_age,),
+                )
+
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY last_access ASC"
+                ).fetchall()
+                to_delete = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    to_delete.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", to_delete)
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Vide entièrement le cache."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Retourne les compteurs de succès/échecs et l'occupation du cache."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
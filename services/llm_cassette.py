@@ -0,0 +1,293 @@
+# services/llm_cassette.py
+
+"""
+Enregistrement et rejeu hors ligne des appels LLM, au niveau du transport HTTP.
+
+En mode « record », chaque requête est transmise normalement et la réponse (statut,
+en-têtes, fragments du flux avec leur instant de réception) est ajoutée à une
+cassette JSON. En mode « replay », aucune connexion n'est ouverte : la réponse
+enregistrée pour une requête identique (méthode, chemin, corps JSON) est rejouée,
+avec le rythme d'origine, accéléré, ou sans aucune attente.
+
+Les transports s'insèrent dans les clients httpx du registre services.llm_clients ;
+tous les appels de l'application (documentation, chat, refactorisation, analyse,
+serveur SSE) sont donc couverts sans modification. Activation par variables
+d'environnement (LLM_CASSETTE_MODE, LLM_CASSETTE_PATH, LLM_CASSETTE_TIMING,
+LLM_CASSETTE_SPEED) ou par services.llm_clients.use_cassette().
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Rythme du rejeu
+TIMING_RECORDED = "recorded"  # délais d'origine
+TIMING_ACCELERATED = "accelerated"  # délais d'origine divisés par `speed`
+TIMING_NONE = "none"  # aucune attente
+
+DEFAULT_SPEED = 10.0
+
+
+class CassetteMiss(LookupError):
+    """Aucune réponse enregistrée ne correspond à la requête rejouée."""
+
+
+def request_key(method: str, path: str, body: bytes) -> str:
+    """Identifiant d'une requête : méthode, chemin et corps JSON normalisé."""
+    try:
+        body_text = json.dumps(json.loads(body or b"null"), sort_keys=True, ensure_ascii=False)
+    except ValueError:
+        body_text = (body or b"").decode("utf-8", errors="replace")
+    payload = f"{method.upper()} {path}\n{body_text}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _encode_chunk(data: bytes) -> dict:
+    try:
+        return {"text": data.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"b64": base64.b64encode(data).decode("ascii")}
+
+
+def _decode_chunk(chunk: dict) -> bytes:
+    if "b64" in chunk:
+        return base64.b64decode(chunk["b64"])
+    return chunk["text"].encode("utf-8")
+
+
+class Cassette:
+    """Fichier JSON d'interactions enregistrées, partagé entre threads."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.interactions = []
+        self._cursors = {}  # rang de la prochaine réponse à rejouer, par clé
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.interactions = json.load(f).get("interactions", [])
+
+    def add(self, interaction: dict) -> None:
+        with self._lock:
+            self.interactions.append(interaction)
+            self._save_locked()
+
+    def _save_locked(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "interactions": self.interactions}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def next_for(self, key: str) -> dict:
+        """
+        Réponse suivante pour `key`. Des requêtes identiques sont servies dans l'ordre
+        d'enregistrement ; la dernière est réutilisée une fois la liste épuisée.
+        """
+        with self._lock:
+            matches = [i for i in self.interactions if i["key"] == key]
+            if not matches:
+                raise CassetteMiss(f"Aucune réponse enregistrée pour cette requête ({key[:12]}) dans {self.path}")
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            return matches[min(cursor, len(matches) - 1)]
+
+
+def _describe(request: httpx.Request, body: bytes) -> dict:
+    return {
+        "key": request_key(request.method, request.url.path, body),
+        "method": request.method,
+        "path": request.url.path,
+        "body": body.decode("utf-8", errors="replace"),
+    }
+
+
+def _prepare_for_recording(request: httpx.Request) -> httpx.Request:
+    # Réponses non compressées : la cassette reste lisible et rejouable telle quelle
+    request.headers["Accept-Encoding"] = "identity"
+    return request
+
+
+def _delays(chunks, timing, speed):
+    previous = 0.0
+    for chunk in chunks:
+        offset = chunk.get("t", 0.0)
+        delay = max(0.0, offset - previous)
+        previous = offset
+        if timing == TIMING_NONE:
+            delay = 0.0
+        elif timing == TIMING_ACCELERATED:
+            delay /= speed
+        yield delay, _decode_chunk(chunk)
+
+
+def _miss_response(request, error):
+    # Le SDK transformerait une exception du transport en erreur de connexion, que
+    # services.rate_limiter réessaierait : une réponse 404 explicite est définitive.
+    return httpx.Response(
+        status_code=404,
+        json={"error": {"message": str(error), "type": "cassette_miss", "code": "cassette_miss"}},
+        request=request,
+    )
+
+
+def _replay_response(request, interaction, stream):
+    return httpx.Response(
+        status_code=interaction["status"],
+        headers=interaction["headers"],
+        stream=stream,
+        request=request,
+    )
+
+
+# --- Transports synchrones ---
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, stream, started, interaction, cassette):
+        self._stream = stream
+        self._started = started
+        self._interaction = interaction
+        self._cassette = cassette
+        self._chunks = []
+
+    def __iter__(self):
+        for data in self._stream:
+            self._chunks.append({"t": round(time.monotonic() - self._started, 4), **_encode_chunk(data)})
+            yield data
+        # Seules les réponses lues jusqu'au bout sont enregistrées
+        self._interaction["chunks"] = self._chunks
+        self._cassette.add(self._interaction)
+
+    def close(self):
+        self._stream.close()
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, chunks, timing, speed):
+        self._chunks = chunks
+        self._timing = timing
+        self._speed = speed
+
+    def __iter__(self):
+        for delay, data in _delays(self._chunks, self._timing, self._speed):
+            if delay:
+                time.sleep(delay)
+            yield data
+
+
+class RecordingTransport(httpx.BaseTransport):
+    def __init__(self, inner: httpx.BaseTransport, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        started = time.monotonic()
+        response = self.inner.handle_request(_prepare_for_recording(request))
+        interaction = {
+            **_describe(request, body),
+            "status": response.status_code,
+            "headers": [[k, v] for k, v in response.headers.multi_items()],
+        }
+        response.stream = _RecordingStream(response.stream, started, interaction, self.cassette)
+        return response
+
+    def close(self):
+        self.inner.close()
+
+
+class ReplayTransport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette, timing: str = TIMING_RECORDED, speed: float = DEFAULT_SPEED):
+        self.cassette = cassette
+        self.timing = timing
+        self.speed = speed
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        try:
+            interaction = self.cassette.next_for(request_key(request.method, request.url.path, body))
+        except CassetteMiss as e:
+            return _miss_response(request, e)
+        return _replay_response(request, interaction, _ReplayStream(interaction["chunks"], self.timing, self.speed))
+
+
+# --- Transports asynchrones ---
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, started, interaction, cassette):
+        self._stream = stream
+        self._started = started
+        self._interaction = interaction
+        self._cassette = cassette
+        self._chunks = []
+
+    async def __aiter__(self):
+        async for data in self._stream:
+            self._chunks.append({"t": round(time.monotonic() - self._started, 4), **_encode_chunk(data)})
+            yield data
+        self._interaction["chunks"] = self._chunks
+        self._cassette.add(self._interaction)
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks, timing, speed):
+        self._chunks = chunks
+        self._timing = timing
+        self._speed = speed
+
+    async def __aiter__(self):
+        for delay, data in _delays(self._chunks, self._timing, self._speed):
+            if delay:
+                await asyncio.sleep(delay)
+            yield data
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncBaseTransport, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        started = time.monotonic()
+        response = await self.inner.handle_async_request(_prepare_for_recording(request))
+        interaction = {
+            **_describe(request, body),
+            "status": response.status_code,
+            "headers": [[k, v] for k, v in response.headers.multi_items()],
+        }
+        response.stream = _AsyncRecordingStream(response.stream, started, interaction, self.cassette)
+        return response
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, timing: str = TIMING_RECORDED, speed: float = DEFAULT_SPEED):
+        self.cassette = cassette
+        self.timing = timing
+        self.speed = speed
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        try:
+            interaction = self.cassette.next_for(request_key(request.method, request.url.path, body))
+        except CassetteMiss as e:
+            return _miss_response(request, e)
+        return _replay_response(
+            request, interaction, _AsyncReplayStream(interaction["chunks"], self.timing, self.speed)
+        )
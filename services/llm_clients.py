@@ -0,0 +1,267 @@
+# services/llm_clients.py
+
+"""
+Registre des clients LLM partagés par tout le processus.
+
+Chaque appel à un fournisseur (OpenAI, DeepSeek, ...) passe par un client
+unique par couple (fournisseur, clé API). Les connexions HTTP restent ouvertes
+(keep-alive) entre deux générations, ce qui évite de refaire la poignée de main
+TLS et de recréer un pool httpx à chaque requête.
+
+Le transport HTTP peut être remplacé par une cassette (services.llm_cassette) pour
+enregistrer les échanges ou les rejouer hors ligne.
+"""
+
+import asyncio
+import os
+import threading
+
+import httpx
+import openai
+
+from services import llm_cassette
+
+# Configuration des fournisseurs compatibles avec l'API OpenAI (mêmes identifiants
+# que project/structure/data/ia_types.json). `stream_usage` : le fournisseur accepte
+# stream_options={"include_usage": True} pour renvoyer les comptes de tokens en streaming.
+PROVIDERS = {
+    "openai": {
+        "base_url": None,
+        "api_key_env": "OPENAI_API_KEY",
+        "stream_usage": True,
+    },
+    "deepseek": {
+        "base_url": "https://api.deepseek.com",
+        "api_key_env": "DEEPSEEK_API_KEY",
+        "stream_usage": True,
+    },
+    "google": {
+        "base_url": "https://generativelanguage.googleapis.com/v1beta/openai/",
+        "api_key_env": "GEMINI_API_KEY",
+    },
+    "anthropic": {
+        "base_url": "https://api.anthropic.com/v1/",
+        "api_key_env": "ANTHROPIC_API_KEY",
+    },
+    "local": {
+        # Serveur local compatible OpenAI (Ollama, LM Studio) ; actif si l'URL est définie
+        "base_url_env": "LOCAL_LLM_BASE_URL",
+        "api_key_env": "LOCAL_LLM_API_KEY",
+        "default_api_key": "local",
+    },
+}
+
+# Délais partagés par tous les clients (connexion courte, lecture longue pour le streaming)
+DEFAULT_TIMEOUT = httpx.Timeout(connect=10.0, read=120.0, write=30.0, pool=30.0)
+
+# Limites du pool de connexions keep-alive
+DEFAULT_LIMITS = httpx.Limits(
+    max_connections=32,
+    max_keepalive_connections=16,
+    keepalive_expiry=120.0,
+)
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_lock = threading.Lock()
+_clients = {}
+_http_clients = {}
+# Les clients asynchrones sont liés à la boucle asyncio qui les utilise
+_async_clients = {}
+_async_http_clients = {}
+
+
+def resolve_api_key(provider: str, api_key: str | None = None) -> str | None:
+    """Retourne la clé fournie ou, à défaut, celle de la variable d'environnement du fournisseur."""
+    if api_key:
+        return api_key
+    config = PROVIDERS.get(provider, {})
+    env_name = config.get("api_key_env")
+    key = os.getenv(env_name) if env_name else None
+    if key is None:
+        key = config.get("default_api_key")
+    if key is None and _cassette is not None and _cassette[0] == llm_cassette.REPLAY:
+        # Le rejeu n'appelle pas l'API : une clé fictive suffit
+        key = "cassette-replay"
+    return key
+
+
+def base_url_for(provider: str) -> str | None:
+    config = PROVIDERS[provider]
+    if "base_url_env" in config:
+        return os.getenv(config["base_url_env"])
+    return config.get("base_url")
+
+
+def is_configured(provider: str) -> bool:
+    """Le fournisseur peut être appelé : clé API disponible et, le cas échéant, URL définie."""
+    config = PROVIDERS.get(provider)
+    if config is None:
+        return False
+    if "base_url_env" in config and not base_url_for(provider):
+        return False
+    return resolve_api_key(provider) is not None
+
+
+def stream_usage_options(provider: str) -> dict:
+    """Options à ajouter à un appel en streaming pour recevoir les comptes de tokens."""
+    if PROVIDERS.get(provider, {}).get("stream_usage"):
+        return {"stream_options": {"include_usage": True}}
+    return {}
+
+
+def use_cassette(mode: str | None, path=None, timing: str = llm_cassette.TIMING_RECORDED,
+                 speed: float = llm_cassette.DEFAULT_SPEED) -> None:
+    """
+    Active l'enregistrement ("record") ou le rejeu ("replay") des appels LLM dans la
+    cassette `path`, ou revient au réseau avec mode=None. Les clients existants sont
+    recréés avec le nouveau transport.
+    """
+    global _cassette
+    if mode not in (None, llm_cassette.RECORD, llm_cassette.REPLAY):
+        raise ValueError(f"Mode de cassette inconnu : {mode}")
+    close_all()
+    with _lock:
+        # Les clients asynchrones seront recréés par leur boucle au prochain appel
+        _async_clients.clear()
+        _async_http_clients.clear()
+        _cassette = None if mode is None else (mode, llm_cassette.Cassette(path), timing, float(speed))
+
+
+def _cassette_from_env():
+    mode = os.getenv("LLM_CASSETTE_MODE")
+    path = os.getenv("LLM_CASSETTE_PATH")
+    if not mode or not path:
+        return None
+    return (
+        mode,
+        llm_cassette.Cassette(path),
+        os.getenv("LLM_CASSETTE_TIMING", llm_cassette.TIMING_RECORDED),
+        float(os.getenv("LLM_CASSETTE_SPEED", llm_cassette.DEFAULT_SPEED)),
+    )
+
+
+# Cassette active : (mode, Cassette, rythme, accélération) ou None
+_cassette = _cassette_from_env()
+
+
+def _create_http_client() -> httpx.Client:
+    transport = httpx.HTTPTransport(limits=DEFAULT_LIMITS, http2=HTTP2_AVAILABLE)
+    if _cassette is not None:
+        mode, cassette, timing, speed = _cassette
+        if mode == llm_cassette.RECORD:
+            transport = llm_cassette.RecordingTransport(transport, cassette)
+        else:
+            transport = llm_cassette.ReplayTransport(cassette, timing, speed)
+    return httpx.Client(timeout=DEFAULT_TIMEOUT, transport=transport)
+
+
+def _create_async_http_client() -> httpx.AsyncClient:
+    transport = httpx.AsyncHTTPTransport(limits=DEFAULT_LIMITS, http2=HTTP2_AVAILABLE)
+    if _cassette is not None:
+        mode, cassette, timing, speed = _cassette
+        if mode == llm_cassette.RECORD:
+            transport = llm_cassette.AsyncRecordingTransport(transport, cassette)
+        else:
+            transport = llm_cassette.AsyncReplayTransport(cassette, timing, speed)
+    return httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, transport=transport)
+
+
+def get_client(provider: str = "openai", api_key: str | None = None) -> openai.OpenAI:
+    """
+    Retourne le client partagé pour le fournisseur donné, en le créant au besoin.
+
+    Args:
+        provider (str): Identifiant du fournisseur (clé de PROVIDERS)
+        api_key (str): Clé API explicite; sinon lue dans l'environnement
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"Fournisseur LLM inconnu : {provider}")
+
+    key = resolve_api_key(provider, api_key)
+    registry_key = (provider, key)
+
+    with _lock:
+        client = _clients.get(registry_key)
+        if client is None:
+            http_client = _http_clients.get(provider)
+            if http_client is None:
+                http_client = _create_http_client()
+                _http_clients[provider] = http_client
+
+            client = openai.OpenAI(
+                api_key=key,
+                base_url=base_url_for(provider),
+                timeout=DEFAULT_TIMEOUT,
+                # Les nouvelles tentatives sont gérées par services.rate_limiter
+                max_retries=0,
+                http_client=http_client,
+            )
+            _clients[registry_key] = client
+        return client
+
+
+def get_async_client(provider: str = "openai", api_key: str | None = None) -> openai.AsyncOpenAI:
+    """
+    Retourne le client asynchrone partagé pour le fournisseur donné.
+    Doit être appelée depuis la boucle asyncio qui utilisera le client.
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"Fournisseur LLM inconnu : {provider}")
+
+    loop = asyncio.get_running_loop()
+    key = resolve_api_key(provider, api_key)
+    registry_key = (provider, key, loop)
+
+    with _lock:
+        client = _async_clients.get(registry_key)
+        if client is None:
+            http_key = (provider, loop)
+            http_client = _async_http_clients.get(http_key)
+            if http_client is None:
+                http_client = _create_async_http_client()
+                _async_http_clients[http_key] = http_client
+
+            client = openai.AsyncOpenAI(
+                api_key=key,
+                base_url=base_url_for(provider),
+                timeout=DEFAULT_TIMEOUT,
+                max_retries=0,
+                http_client=http_client,
+            )
+            _async_clients[registry_key] = client
+        return client
+
+
+async def aclose_async_clients() -> None:
+    """Ferme les clients asynchrones liés à la boucle courante."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        http_clients = [c for (_, l), c in _async_http_clients.items() if l is loop]
+        for registry_key in [k for k in _async_clients if k[2] is loop]:
+            del _async_clients[registry_key]
+        for http_key in [k for k in _async_http_clients if k[1] is loop]:
+            del _async_http_clients[http_key]
+
+    for http_client in http_clients:
+        try:
+            await http_client.aclose()
+        except Exception as e:
+            print(f"Erreur lors de la fermeture d'un client HTTP asynchrone : {e}")
+
+
+def close_all() -> None:
+    """Ferme toutes les connexions du registre (à appeler à la fermeture de l'application)."""
+    with _lock:
+        for http_client in _http_clients.values():
+            try:
+                http_client.close()
+            except Exception as e:
+                print(f"Erreur lors de la fermeture d'un client HTTP : {e}")
+        _http_clients.clear()
+        _clients.clear()
@@ -0,0 +1,167 @@
+# services/llm_router.py
+
+"""
+Choix du fournisseur et du modèle d'après les latences observées.
+
+Le routeur conserve, pour chaque couple (fournisseur, modèle), une fenêtre glissante
+des derniers appels : délai avant le premier token (TTFT) et succès ou échec. Il
+est alimenté automatiquement par la télémétrie (services.llm_telemetry), quel que
+soit le composant à l'origine de l'appel.
+
+    - rank() classe les routes configurées : d'abord les routes saines, par TTFT
+      médian croissant (une route encore sans mesure reçoit une estimation par
+      défaut, l'ordre de préférence départageant les ex aequo) ;
+    - hedge_delay() donne le délai au-delà duquel une requête sans premier token
+      est doublée vers la route suivante (p95 du TTFT, borné).
+
+La requête doublée (« hedged request ») est exécutée par LLMEngine.complete_routed.
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from services.llm_clients import is_configured
+from services.llm_telemetry import STATUS_CANCELLED, STATUS_CLIENT_ABORTED, STATUS_ERROR, add_listener, percentile
+
+
+@dataclass(frozen=True)
+class Route:
+    provider: str
+    model: str
+
+
+# Routes candidates, par ordre de préférence (utilisé tant qu'il n'y a pas de mesures)
+DEFAULT_ROUTES = (
+    Route("openai", "gpt-4"),
+    Route("deepseek", "deepseek-chat"),
+    Route("google", "gemini-1.5-pro"),
+    Route("anthropic", "claude-3-5-sonnet-latest"),
+    Route("local", "llama3.1"),
+)
+
+WINDOW_SECONDS = 15 * 60  # les mesures plus anciennes sont oubliées
+WINDOW_SIZE = 100  # nombre maximal de mesures conservées par route
+MIN_SAMPLES = 3  # mesures nécessaires avant de se fier aux percentiles
+MAX_ERROR_RATE = 0.5  # au-delà, la route est considérée en mauvaise santé
+DEFAULT_TTFT = 3.0  # estimation (s) pour une route encore sans mesure
+
+DEFAULT_HEDGE_DELAY = 4.0
+MIN_HEDGE_DELAY = 1.0
+MAX_HEDGE_DELAY = 15.0
+HEDGE_PERCENTILE = 95
+
+
+class RouteStats:
+    """Fenêtre glissante des appels d'une route : (instant, TTFT ou None, succès)."""
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW_SIZE)
+
+    def add(self, ttft, ok, now=None):
+        self.samples.append((time.monotonic() if now is None else now, ttft, ok))
+
+    def _recent(self, now):
+        while self.samples and now - self.samples[0][0] > WINDOW_SECONDS:
+            self.samples.popleft()
+        return list(self.samples)
+
+    def ttfts(self, now):
+        return [ttft for _t, ttft, ok in self._recent(now) if ok and ttft is not None]
+
+    def error_rate(self, now):
+        recent = self._recent(now)
+        if len(recent) < MIN_SAMPLES:
+            return 0.0
+        return sum(1 for _t, _ttft, ok in recent if not ok) / len(recent)
+
+
+class LLMRouter:
+    def __init__(self, routes=DEFAULT_ROUTES, available=is_configured):
+        """
+        Args:
+            routes (iterable): Routes candidates par ordre de préférence
+            available (callable): Indique si un fournisseur est utilisable (clé API configurée)
+        """
+        self.routes = tuple(routes)
+        self.available = available
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def observe(self, provider, model, ttft, ok):
+        with self._lock:
+            self._stats.setdefault(Route(provider, model), RouteStats()).add(ttft, ok)
+
+    def observe_row(self, row: dict):
+        """Écouteur de la télémétrie : seuls les vrais appels au fournisseur sont comptés."""
+        if row["cache_hit"] or row["coalesced"]:
+            return
+        if row["status"] in (STATUS_CANCELLED, STATUS_CLIENT_ABORTED):
+            return
+        self.observe(row["provider"], row["model"], row["ttft"], row["status"] != STATUS_ERROR)
+
+    def _snapshot(self, route, now):
+        stats = self._stats.get(route)
+        if stats is None:
+            return [], 0.0
+        return stats.ttfts(now), stats.error_rate(now)
+
+    def rank(self, routes=None) -> list:
+        """Routes disponibles, de la plus rapide à la plus lente, les routes en échec en dernier."""
+        candidates = [r for r in (routes or self.routes) if self.available(r.provider)]
+        now = time.monotonic()
+        scored = []
+        with self._lock:
+            for preference, route in enumerate(candidates):
+                ttfts, error_rate = self._snapshot(route, now)
+                median = percentile(ttfts, 50) if len(ttfts) >= MIN_SAMPLES else DEFAULT_TTFT
+                unhealthy = error_rate >= MAX_ERROR_RATE
+                scored.append((unhealthy, median, preference, route))
+        scored.sort(key=lambda item: item[:3])
+        return [route for *_score, route in scored]
+
+    def choose(self, routes=None) -> Route:
+        ranked = self.rank(routes)
+        if not ranked:
+            raise RuntimeError("Aucun fournisseur LLM configuré (clé API manquante)")
+        return ranked[0]
+
+    def hedge_delay(self, route: Route) -> float:
+        """Attente du premier token avant de doubler la requête vers une autre route."""
+        with self._lock:
+            ttfts, _error_rate = self._snapshot(route, time.monotonic())
+        if len(ttfts) < MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return min(MAX_HEDGE_DELAY, max(MIN_HEDGE_DELAY, percentile(ttfts, HEDGE_PERCENTILE)))
+
+    def snapshot(self) -> list:
+        """État courant par route (pour affichage) : TTFT p50/p95, taux d'erreur, mesures."""
+        now = time.monotonic()
+        with self._lock:
+            rows = []
+            for route, stats in self._stats.items():
+                ttfts = stats.ttfts(now)
+                rows.append({
+                    "provider": route.provider,
+                    "model": route.model,
+                    "samples": len(stats.samples),
+                    "ttft_p50": percentile(ttfts, 50),
+                    "ttft_p95": percentile(ttfts, 95),
+                    "error_rate": stats.error_rate(now),
+                })
+        return rows
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> LLMRouter:
+    """Routeur partagé, alimenté par la télémétrie de tous les appels."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = LLMRouter()
+            add_listener(_router.observe_row)
+        return _router
@@ -0,0 +1,344 @@
+# services/llm_telemetry.py
+
+"""
+Télémétrie des appels LLM, par requête, dans une base SQLite locale.
+
+Chaque appel (tâches de génération, moteur asynchrone, serveur SSE) est décrit par
+un CallMetrics : modèle, fournisseur, catégorie (type de document, chat, analyse…),
+tokens du prompt et de la réponse, attente imposée par la limitation de débit,
+délai avant le premier token (TTFT), latence totale, débit en tokens/s, nombre de
+nouvelles tentatives, réponse servie par le cache ou partagée avec une requête
+identique, tokens du prompt servis par le cache de préfixe du fournisseur, version
+du modèle de prompt (services.prompt_registry), statut et coût estimé. LLMTelemetry.summary() calcule les percentiles
+par modèle et par catégorie pour le panneau de suivi.
+"""
+
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from services.prompt_registry import template_id
+from services.rate_limiter import estimate_tokens
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parent.parent / "saved_docs" / "llm_metrics.sqlite"
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+STATUS_CANCELLED = "cancelled"
+STATUS_CLIENT_ABORTED = "client_aborted"  # client du serveur SSE parti avant la fin de la réponse
+
+# Tarifs en dollars par million de tokens (prompt, prompt servi par le cache du
+# fournisseur, réponse) ; les préfixes couvrent les variantes datées
+# (ex. gpt-4o-2024-08-06). Les modèles inconnus ont un coût nul.
+PRICING = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4-turbo": (10.00, 10.00, 30.00),
+    "gpt-4-1106-preview": (10.00, 10.00, 30.00),
+    "gpt-4-0125-preview": (10.00, 10.00, 30.00),
+    "gpt-4": (30.00, 30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+    "deepseek-chat": (0.27, 0.07, 1.10),
+    "deepseek-reasoner": (0.55, 0.14, 2.19),
+}
+
+PERCENTILES = (50, 90, 99)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """Coût estimé d'un appel en dollars (0 si le modèle n'a pas de tarif connu)."""
+    model = (model or "").lower()
+    # Préfixe le plus long : « gpt-4o-mini » avant « gpt-4o » avant « gpt-4 »
+    for name in sorted(PRICING, key=len, reverse=True):
+        if model.startswith(name):
+            prompt_price, cached_price, completion_price = PRICING[name]
+            cached_tokens = min(cached_tokens, prompt_tokens)
+            return (
+                (prompt_tokens - cached_tokens) * prompt_price
+                + cached_tokens * cached_price
+                + completion_tokens * completion_price
+            ) / 1_000_000
+    return 0.0
+
+
+def percentile(values, p: float):
+    """Percentile par interpolation linéaire (None si la liste est vide)."""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    rank = (len(values) - 1) * p / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return values[low]
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+class LLMTelemetry:
+    """Table `llm_calls`, partagée entre threads (écritures protégées par un verrou)."""
+
+    COLUMNS = (
+        "ts", "source", "provider", "model", "category", "prompt_tokens", "completion_tokens",
+        "queue_wait", "ttft", "latency", "tokens_per_second", "retries", "cache_hit",
+        "coalesced", "status", "cost", "error", "cached_tokens", "prompt_version",
+    )
+    # Colonnes ajoutées après la création de la table : (nom, définition)
+    ADDED_COLUMNS = (
+        ("cached_tokens", "INTEGER NOT NULL DEFAULT 0"),
+        ("prompt_version", "TEXT NOT NULL DEFAULT ''"),
+    )
+
+    def __init__(self, db_path=None):
+        self.db_path = Path(db_path or DEFAULT_DB_PATH)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        # Écritures fréquentes et courtes : journal WAL sans synchronisation à chaque appel
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                source TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                category TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                queue_wait REAL NOT NULL,
+                ttft REAL,
+                latency REAL NOT NULL,
+                tokens_per_second REAL,
+                retries INTEGER NOT NULL,
+                cache_hit INTEGER NOT NULL,
+                coalesced INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                cost REAL NOT NULL,
+                error TEXT
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_calls_ts ON llm_calls (ts)")
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(llm_calls)")}
+        for name, definition in self.ADDED_COLUMNS:
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE llm_calls ADD COLUMN {name} {definition}")
+        self._conn.commit()
+
+    def record(self, row: dict) -> None:
+        values = tuple(row.get(column) for column in self.COLUMNS)
+        placeholders = ", ".join("?" for _ in self.COLUMNS)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO llm_calls ({', '.join(self.COLUMNS)}) VALUES ({placeholders})",
+                values,
+            )
+            self._conn.commit()
+
+    def rows(self, since: float = None) -> list:
+        """Appels enregistrés (dictionnaires), éventuellement depuis l'horodatage `since`."""
+        query = f"SELECT {', '.join(self.COLUMNS)} FROM llm_calls"
+        params = ()
+        if since is not None:
+            query += " WHERE ts >= ?"
+            params = (since,)
+        with self._lock:
+            cursor = self._conn.execute(query + " ORDER BY ts", params)
+            return [dict(zip(self.COLUMNS, values)) for values in cursor.fetchall()]
+
+    def summary(self, since: float = None, group_by=("model", "category")) -> list:
+        """
+        Statistiques par groupe (par défaut modèle et catégorie).
+
+        Returns:
+            list: dictionnaires avec les clés du groupe, `calls`, `errors`, `cancelled`,
+            `client_aborted`, `cache_hits`, `retries`, `cost`, `prompt_tokens`, `cached_tokens`,
+            `cached_ratio` (part du prompt servie par le cache du fournisseur), et `<mesure>_p<N>` pour ttft, latency,
+            tokens_per_second et queue_wait aux percentiles de PERCENTILES
+        """
+        groups = {}
+        for row in self.rows(since):
+            groups.setdefault(tuple(row[column] for column in group_by), []).append(row)
+
+        result = []
+        for key, calls in sorted(groups.items()):
+            stats = dict(zip(group_by, key))
+            stats["calls"] = len(calls)
+            stats["errors"] = sum(1 for c in calls if c["status"] == STATUS_ERROR)
+            stats["cancelled"] = sum(1 for c in calls if c["status"] == STATUS_CANCELLED)
+            stats["client_aborted"] = sum(1 for c in calls if c["status"] == STATUS_CLIENT_ABORTED)
+            stats["cache_hits"] = sum(1 for c in calls if c["cache_hit"] or c["coalesced"])
+            stats["retries"] = sum(c["retries"] for c in calls)
+            stats["cost"] = sum(c["cost"] for c in calls)
+            billed = [c for c in calls if not (c["cache_hit"] or c["coalesced"])]
+            stats["prompt_tokens"] = sum(c["prompt_tokens"] for c in billed)
+            stats["cached_tokens"] = sum(c["cached_tokens"] or 0 for c in billed)
+            stats["cached_ratio"] = (
+                stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else None
+            )
+            # Les réponses servies localement fausseraient les latences du fournisseur
+            served = [c for c in calls if c["status"] == STATUS_OK and not c["cache_hit"]]
+            for measure in ("ttft", "latency", "tokens_per_second", "queue_wait"):
+                values = [c[measure] for c in served]
+                for p in PERCENTILES:
+                    stats[f"{measure}_p{p}"] = percentile(values, p)
+            result.append(stats)
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+_listeners = []  # appelés avec chaque ligne enregistrée (ex. services.llm_router)
+
+
+def add_listener(callback) -> None:
+    """Abonne `callback(row)` à tous les appels terminés, dans le thread qui les termine."""
+    _listeners.append(callback)
+
+
+def get_telemetry() -> LLMTelemetry:
+    """Base de télémétrie partagée par tout le processus, ouverte au premier appel."""
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = LLMTelemetry()
+        return _telemetry
+
+
+class CallMetrics:
+    """
+    Mesures d'un appel, de sa création (avant l'attente de débit) à finish().
+
+    Le TTFT et la latence sont comptés depuis la création, attente comprise ;
+    le débit ne porte que sur la phase de génération.
+    """
+
+    def __init__(self, source, provider, model, category="", prompt="", telemetry=None):
+        """
+        Args:
+            source (str): Composant à l'origine de l'appel (ex. « OpenAIStreamingTask »)
+            category (str): Type de document, « chat », « analyse »… (regroupement du panneau)
+            prompt (str | list): Texte du prompt ou liste de messages, pour estimer ses tokens
+                (un prompt de services.prompt_registry fournit aussi sa version)
+            telemetry (LLMTelemetry): Base cible (par défaut la base partagée)
+        """
+        self.source = source
+        self.provider = provider
+        self.model = model
+        self.category = category or ""
+        self.prompt_version = template_id(prompt)
+        if isinstance(prompt, (list, tuple)):
+            prompt = "\n".join(str(m.get("content", "")) for m in prompt)
+        self.prompt_tokens = estimate_tokens(prompt) if prompt else 0
+        self.cached_tokens = 0  # tokens du prompt servis par le cache de préfixe du fournisseur
+        self.completion_tokens = 0
+        self._completion_chars = 0
+        self._usage_reported = False
+        self.queue_wait = 0.0
+        self.retries = 0
+        self.cache_hit = False
+        self.coalesced = False
+        self.started = time.monotonic()
+        self.first_token_at = None
+        self._telemetry = telemetry
+        self._finished = False
+
+    # --- Alimentation ---
+
+    def add_wait(self, seconds: float) -> None:
+        """Attente imposée avant l'envoi (limitation de débit ou délai avant nouvel essai)."""
+        self.queue_wait += max(0.0, seconds)
+
+    def add_retry(self) -> None:
+        self.retries += 1
+
+    def add_output(self, text: str) -> None:
+        """Fragment de réponse reçu ; le premier fixe le TTFT."""
+        if not text:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self._completion_chars += len(text)
+
+    def discard_output(self) -> None:
+        """Oublie la réponse reçue (ex. appel partagé abandonné puis relancé)."""
+        self.first_token_at = None
+        self._completion_chars = 0
+
+    def set_usage(self, usage) -> None:
+        """Comptes exacts renvoyés par l'API (objet `usage`), prioritaires sur les estimations."""
+        if usage is None:
+            return
+        self.prompt_tokens = getattr(usage, "prompt_tokens", None) or self.prompt_tokens
+        self.completion_tokens = getattr(usage, "completion_tokens", None) or self.completion_tokens
+        # OpenAI : usage.prompt_tokens_details.cached_tokens ; DeepSeek : prompt_cache_hit_tokens
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+        if cached is None:
+            cached = getattr(usage, "prompt_cache_hit_tokens", None)
+        self.cached_tokens = cached or 0
+        self._usage_reported = True
+
+    # --- Clôture ---
+
+    def finish(self, status: str = STATUS_OK, error=None) -> None:
+        """Enregistre l'appel (une seule fois ; les appels suivants sont ignorés)."""
+        if self._finished:
+            return
+        self._finished = True
+        now = time.monotonic()
+        latency = now - self.started
+        if not self._usage_reported:
+            # Même estimation que services.rate_limiter.estimate_tokens (~4 caractères par token)
+            self.completion_tokens = max(1, self._completion_chars // 4) if self._completion_chars else 0
+
+        generation_start = self.first_token_at or (self.started + self.queue_wait)
+        generation_time = now - generation_start
+        tokens_per_second = None
+        if self.completion_tokens and generation_time > 0:
+            tokens_per_second = self.completion_tokens / generation_time
+
+        # Un cache local ou un appel partagé ne coûte rien
+        cost = 0.0
+        if not (self.cache_hit or self.coalesced):
+            cost = estimate_cost(self.model, self.prompt_tokens, self.completion_tokens, self.cached_tokens)
+
+        row = {
+            "ts": time.time(),
+            "source": self.source,
+            "provider": self.provider,
+            "model": self.model,
+            "category": self.category,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "queue_wait": self.queue_wait,
+            "ttft": None if self.first_token_at is None else self.first_token_at - self.started,
+            "latency": latency,
+            "tokens_per_second": tokens_per_second,
+            "retries": self.retries,
+            "cache_hit": int(self.cache_hit),
+            "coalesced": int(self.coalesced),
+            "status": status,
+            "cost": cost,
+            "error": None if error is None else str(error)[:500],
+            "cached_tokens": self.cached_tokens,
+            "prompt_version": self.prompt_version,
+        }
+        try:
+            (self._telemetry or get_telemetry()).record(row)
+        except sqlite3.Error as e:
+            # La télémétrie ne doit jamais faire échouer un appel
+            print(f"Télémétrie LLM non enregistrée : {e}")
+        for listener in list(_listeners):
+            try:
+                listener(row)
+            except Exception as e:
+                print(f"Erreur d'un écouteur de télémétrie LLM : {e}")
@@ -0,0 +1,166 @@
+# services/mock_llm.py
+
+"""
+Fournisseur LLM simulé, pour mesurer le serveur SSE sans appeler de vraie API.
+
+MockAsyncClient imite la partie d'AsyncOpenAI utilisée par le serveur
+(`chat.completions.create(stream=True)`) : il produit des fragments au format des
+ChatCompletionChunk, avec un délai avant le premier token, un débit, une longueur de
+réponse et un taux d'erreur configurables.
+
+La configuration est lue dans le champ `model` de la requête :
+    mock                              valeurs par défaut
+    mock:fast, mock:slow, mock:flaky  profils prédéfinis (PRESETS)
+    mock?tps=80&ttft=0.2&tokens=300   réglages explicites, combinables avec un profil
+                                      (ex. mock:slow?errors=0.1)
+
+Paramètres : tps (tokens/s), ttft (s, moyenne), jitter (écart relatif du TTFT),
+tokens (longueur moyenne), spread (écart relatif de la longueur, loi log-normale),
+errors (probabilité d'échec de l'appel), seed (graine, pour rejouer une série).
+"""
+
+import asyncio
+import math
+import random
+from dataclasses import dataclass, replace
+from types import SimpleNamespace
+from urllib.parse import parse_qsl
+
+MOCK_PREFIX = "mock"
+
+WORDS = (
+    "Voici", "la", "structure", "proposée", "pour", "le", "projet", "avec", "un", "dossier",
+    "src", "et", "des", "tests", "unitaires", "séparés", "module", "principal", "configuration",
+)
+
+
+class MockProviderError(RuntimeError):
+    """Échec simulé d'un appel au fournisseur."""
+
+
+@dataclass(frozen=True)
+class MockConfig:
+    tokens_per_second: float = 50.0
+    ttft: float = 0.4
+    ttft_jitter: float = 0.3
+    mean_tokens: int = 200
+    length_spread: float = 0.5
+    error_rate: float = 0.0
+    seed: int = None
+
+    def sample_ttft(self, rng) -> float:
+        return max(0.0, rng.gauss(self.ttft, self.ttft * self.ttft_jitter))
+
+    def sample_length(self, rng) -> int:
+        if self.length_spread <= 0:
+            return max(1, self.mean_tokens)
+        # Loi log-normale de moyenne mean_tokens : longue traîne de réponses longues
+        sigma = math.sqrt(math.log(1 + self.length_spread ** 2))
+        mu = math.log(max(1, self.mean_tokens)) - sigma ** 2 / 2
+        return max(1, int(rng.lognormvariate(mu, sigma)))
+
+
+PRESETS = {
+    "": MockConfig(),
+    "fast": MockConfig(tokens_per_second=200.0, ttft=0.1, mean_tokens=150),
+    "slow": MockConfig(tokens_per_second=15.0, ttft=2.0, mean_tokens=400),
+    "flaky": MockConfig(error_rate=0.2),
+}
+
+_PARAMETERS = {
+    "tps": ("tokens_per_second", float),
+    "ttft": ("ttft", float),
+    "jitter": ("ttft_jitter", float),
+    "tokens": ("mean_tokens", int),
+    "spread": ("length_spread", float),
+    "errors": ("error_rate", float),
+    "seed": ("seed", int),
+}
+
+
+def is_mock_model(model: str) -> bool:
+    return model == MOCK_PREFIX or model.startswith((MOCK_PREFIX + ":", MOCK_PREFIX + "?"))
+
+
+def parse_mock_model(model: str) -> MockConfig:
+    """
+    Configuration décrite par le champ `model` (voir l'en-tête du module).
+
+    Raises:
+        ValueError: profil ou paramètre inconnu, valeur invalide
+    """
+    if not is_mock_model(model):
+        raise ValueError(f"Modèle simulé invalide : {model}")
+    name, _, query = model[len(MOCK_PREFIX):].partition("?")
+    preset = name.lstrip(":")
+    if preset not in PRESETS:
+        raise ValueError(f"Profil simulé inconnu : {preset} (profils : {', '.join(p for p in PRESETS if p)})")
+    config = PRESETS[preset]
+
+    overrides = {}
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        if key not in _PARAMETERS:
+            raise ValueError(f"Paramètre simulé inconnu : {key}")
+        field_name, convert = _PARAMETERS[key]
+        overrides[field_name] = convert(value)
+    config = replace(config, **overrides)
+    if config.tokens_per_second <= 0:
+        raise ValueError("tps doit être strictement positif")
+    return config
+
+
+class MockStream:
+    """Flux de fragments simulé (un mot par fragment), interrompu par close()."""
+
+    def __init__(self, config: MockConfig, rng, max_tokens=None):
+        self.config = config
+        self.rng = rng
+        length = config.sample_length(rng)
+        self.remaining = min(length, max_tokens) if max_tokens else length
+        self.completion_tokens = 0
+        self._first = True
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+        if self.remaining <= 0:
+            self._closed = True
+            usage = SimpleNamespace(
+                prompt_tokens=0, completion_tokens=self.completion_tokens,
+                prompt_tokens_details=None,
+            )
+            return SimpleNamespace(choices=[], usage=usage)  # dernier fragment : comptes de tokens
+
+        delay = self.config.sample_ttft(self.rng) if self._first else 1.0 / self.config.tokens_per_second
+        await asyncio.sleep(delay)
+        if self._closed:
+            raise StopAsyncIteration
+        text = ("" if self._first else " ") + self.rng.choice(WORDS)
+        self._first = False
+        self.remaining -= 1
+        self.completion_tokens += 1
+        delta = SimpleNamespace(content=text)
+        return SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+
+    async def close(self):
+        self._closed = True
+
+
+class MockAsyncClient:
+    """Remplaçant d'AsyncOpenAI pour les appels en streaming du serveur."""
+
+    def __init__(self, config: MockConfig = None):
+        self.config = config or MockConfig()
+        self.rng = random.Random(self.config.seed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, max_tokens=None, **_kwargs):
+        if self.rng.random() < self.config.error_rate:
+            # Échec après un court délai, comme une erreur 5xx du fournisseur
+            await asyncio.sleep(self.config.sample_ttft(self.rng) / 2)
+            raise MockProviderError("Erreur simulée du fournisseur")
+        return MockStream(self.config, self.rng, max_tokens)
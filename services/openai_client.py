@@ -1,10 +1,12 @@
 
-from openai import OpenAI # Importation modifiée
+from services.llm_clients import get_client
+from services.rate_limiter import call_with_retry, estimate_tokens
+from services.llm_telemetry import CallMetrics, STATUS_ERROR
 
 class OpenAIClient:
     def __init__(self, api_key: str):
         try:
-            self.client = OpenAI(api_key=api_key)
+            self.client = get_client("openai", api_key)
         except Exception as e:
             print(f"Erreur lors de l'initialisation du client OpenAI avec la clé API : {e}")
             self.client = None # S'assurer que client est None si l'initialisation échoue
@@ -14,21 +16,35 @@ class OpenAIClient:
             print("Client OpenAI non initialisé correctement. Impossible de générer du code.")
             return None
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4-turbo", # Assurez-vous que ce modèle est toujours disponible et approprié
-                messages=[
-                    {"role": "system", "content": "Tu es un assistant expert en gestion de projet logiciel."}, # Message système adapté
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3 # Une température basse pour des réponses plus déterministes
+            model = "gpt-4-turbo" # Assurez-vous que ce modèle est toujours disponible et approprié
+            metrics = CallMetrics("OpenAIClient", "openai", model, "code", prompt)
+            response = call_with_retry(
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": "Tu es un assistant expert en gestion de projet logiciel."}, # Message système adapté
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.3 # Une température basse pour des réponses plus déterministes
+                ),
+                "openai",
+                model,
+                estimated_tokens=estimate_tokens(prompt) + 1500,
+                on_throttled=lambda wait: print(f"Limitation de débit OpenAI : attente de {wait:.1f} s"),
+                metrics=metrics,
             )
+            metrics.set_usage(getattr(response, "usage", None))
             # Accès à la réponse selon la nouvelle API
             if response.choices and response.choices[0].message:
+                metrics.add_output(response.choices[0].message.content)
+                metrics.finish()
                 return response.choices[0].message.content
             else:
+                metrics.finish()
                 print("Réponse inattendue de l'API OpenAI ou pas de contenu de message.")
                 return None
         except Exception as e:
+            metrics.finish(STATUS_ERROR, e)
             print(f"Erreur lors de l'appel à l'API OpenAI (chat.completions.create) : {e}")
             return None
 
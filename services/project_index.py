@@ -0,0 +1,306 @@
+# services/project_index.py
+
+"""
+Index persistant et incrémental des fichiers d'un projet.
+
+Chaque fichier est décrit par (chemin, taille, mtime, empreinte du contenu, langage,
+résumé). Un rafraîchissement parcourt l'arborescence avec os.scandir en respectant
+les .gitignore (via pathspec) et en ignorant .git, node_modules et les environnements
+virtuels ; seuls les fichiers dont la taille ou la date de modification a changé sont
+relus, en parallèle dans un pool de threads. L'index est stocké dans une base SQLite
+par projet, si bien que re-documenter un gros dépôt ne touche que les fichiers modifiés.
+"""
+
+import ast
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pathspec
+
+from services.rate_limiter import estimate_tokens
+
+DEFAULT_INDEX_DIR = Path(__file__).resolve().parent.parent / "saved_docs" / "project_index"
+
+# Dossiers jamais indexés, même sans .gitignore
+ALWAYS_IGNORED_DIRS = {
+    ".git", ".hg", ".svn", "__pycache__", ".venv", "venv", "env", "node_modules",
+    ".mypy_cache", ".pytest_cache", ".tox", ".idea", ".vscode",
+}
+
+# Fichiers plus gros que cette limite sont indexés sans être lus (binaires, données)
+MAX_FILE_BYTES = 1024 * 1024
+
+LANGUAGES = {
+    ".py": "python", ".js": "javascript", ".jsx": "javascript", ".ts": "typescript",
+    ".tsx": "typescript", ".java": "java", ".kt": "kotlin", ".go": "go", ".rs": "rust",
+    ".c": "c", ".h": "c", ".cpp": "cpp", ".hpp": "cpp", ".cs": "csharp", ".rb": "ruby",
+    ".php": "php", ".swift": "swift", ".sql": "sql", ".sh": "shell", ".bat": "batch",
+    ".html": "html", ".css": "css", ".md": "markdown", ".json": "json", ".yaml": "yaml",
+    ".yml": "yaml", ".toml": "toml", ".ini": "ini", ".txt": "text",
+}
+
+ENTRY_POINT_NAMES = {"main.py", "__main__.py", "app.py", "manage.py", "cli.py", "wsgi.py", "asgi.py"}
+
+
+@dataclass
+class IndexedFile:
+    path: str  # chemin relatif, séparateur "/"
+    size: int
+    mtime_ns: int
+    sha256: str = ""
+    language: str = ""
+    tokens: int = 0
+    summary: str = ""
+    imports: list = field(default_factory=list)
+    is_entry_point: bool = False
+
+
+def detect_language(path: str) -> str:
+    return LANGUAGES.get(os.path.splitext(path)[1].lower(), "")
+
+
+def analyse_python(rel_path: str, text: str):
+    """
+    Résume un module Python : docstring, classes (avec leurs méthodes) et fonctions.
+
+    Returns:
+        tuple: (résumé, modules importés, point d'entrée ?)
+    """
+    name = rel_path.rsplit("/", 1)[-1]
+    is_entry_point = (
+        name in ENTRY_POINT_NAMES
+        or "__name__ == \"__main__\"" in text
+        or "__name__ == '__main__'" in text
+    )
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return f"### {rel_path} (non analysable)", [], is_entry_point
+
+    imports = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            imports.add(node.module)
+            imports.update(f"{node.module}.{alias.name}" for alias in node.names)
+
+    lines = [f"### {rel_path}"]
+    docstring = ast.get_docstring(tree)
+    if docstring and docstring.strip():
+        lines.append(docstring.strip().splitlines()[0])
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            methods = [n.name for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            suffix = f" : {', '.join(methods[:12])}" if methods else ""
+            lines.append(f"- classe {node.name}{suffix}")
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            lines.append(f"- fonction {node.name}()")
+    return "\n".join(lines), sorted(imports), is_entry_point
+
+
+def _load_ignore_spec(directory: str):
+    gitignore = os.path.join(directory, ".gitignore")
+    if not os.path.isfile(gitignore):
+        return None
+    try:
+        with open(gitignore, encoding="utf-8", errors="replace") as f:
+            return pathspec.GitIgnoreSpec.from_lines(f)
+    except OSError:
+        return None
+
+
+class ProjectIndex:
+    """Index d'un projet, partagé entre threads (opérations protégées par un verrou)."""
+
+    def __init__(self, root, index_path=None, max_workers=8):
+        self.root = os.path.abspath(root)
+        if index_path is None:
+            digest = hashlib.sha1(self.root.encode("utf-8")).hexdigest()[:16]
+            index_path = DEFAULT_INDEX_DIR / f"{os.path.basename(self.root) or 'root'}-{digest}.sqlite"
+        self.index_path = Path(index_path)
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._files = {}
+
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.index_path), check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                language TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                imports TEXT NOT NULL,
+                is_entry_point INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        for row in self._conn.execute(
+            "SELECT path, size, mtime_ns, sha256, language, tokens, summary, imports, is_entry_point FROM files"
+        ):
+            self._files[row[0]] = IndexedFile(
+                row[0], row[1], row[2], row[3], row[4], row[5], row[6], json.loads(row[7]), bool(row[8])
+            )
+
+    # --- Parcours ---
+
+    def _scan(self):
+        """Retourne {chemin relatif: (taille, mtime_ns)} des fichiers non ignorés."""
+        found = {}
+        # Pile de (dossier absolu, préfixe relatif, règles .gitignore applicables)
+        stack = [(self.root, "", [])]
+        while stack:
+            directory, prefix, specs = stack.pop()
+            spec = _load_ignore_spec(directory)
+            if spec is not None:
+                specs = specs + [(prefix, spec)]
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                rel = f"{prefix}{entry.name}"
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if not is_dir and not entry.is_file(follow_symlinks=False):
+                        continue
+                except OSError:
+                    continue
+                if is_dir and entry.name in ALWAYS_IGNORED_DIRS:
+                    continue
+                if self._ignored(rel, is_dir, specs):
+                    continue
+                if is_dir:
+                    stack.append((entry.path, f"{rel}/", specs))
+                else:
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    found[rel] = (stat.st_size, stat.st_mtime_ns)
+        return found
+
+    @staticmethod
+    def _ignored(rel, is_dir, specs):
+        for base, spec in specs:
+            local = rel[len(base):]
+            if spec.match_file(f"{local}/" if is_dir else local):
+                return True
+        return False
+
+    def _read_entry(self, rel, size, mtime_ns, previous):
+        """Lit et analyse un fichier modifié (exécuté dans le pool de threads)."""
+        entry = IndexedFile(rel, size, mtime_ns, language=detect_language(rel))
+        if size > MAX_FILE_BYTES:
+            return entry
+        try:
+            with open(os.path.join(self.root, rel), "rb") as f:
+                data = f.read()
+        except OSError:
+            return entry
+        entry.sha256 = hashlib.sha256(data).hexdigest()
+
+        # Contenu identique (fichier simplement touché) : garder l'analyse existante
+        if previous is not None and previous.sha256 == entry.sha256:
+            entry.tokens = previous.tokens
+            entry.summary = previous.summary
+            entry.imports = previous.imports
+            entry.is_entry_point = previous.is_entry_point
+            return entry
+
+        try:
+            text = data.decode("utf-8")
+        except UnicodeDecodeError:
+            return entry  # fichier binaire : indexé sans résumé
+        entry.tokens = estimate_tokens(text)
+        if entry.language == "python":
+            entry.summary, entry.imports, entry.is_entry_point = analyse_python(rel, text)
+        else:
+            entry.summary = f"### {rel}"
+        return entry
+
+    def refresh(self) -> dict:
+        """
+        Met l'index à jour : seuls les fichiers nouveaux ou modifiés (taille/mtime) sont relus.
+
+        Returns:
+            dict: compteurs {"scanned", "updated", "removed", "unchanged"}
+        """
+        found = self._scan()
+        with self._lock:
+            current = dict(self._files)
+
+        changed = [
+            (rel, size, mtime_ns, current.get(rel))
+            for rel, (size, mtime_ns) in found.items()
+            if rel not in current
+            or current[rel].size != size
+            or current[rel].mtime_ns != mtime_ns
+        ]
+        removed = [rel for rel in current if rel not in found]
+
+        updated = []
+        if changed:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                updated = list(pool.map(lambda args: self._read_entry(*args), changed))
+
+        with self._lock:
+            for entry in updated:
+                self._files[entry.path] = entry
+            for rel in removed:
+                self._files.pop(rel, None)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (e.path, e.size, e.mtime_ns, e.sha256, e.language, e.tokens,
+                     e.summary, json.dumps(e.imports), int(e.is_entry_point))
+                    for e in updated
+                ],
+            )
+            self._conn.executemany("DELETE FROM files WHERE path = ?", [(rel,) for rel in removed])
+            self._conn.commit()
+
+        return {
+            "scanned": len(found),
+            "updated": len(updated),
+            "removed": len(removed),
+            "unchanged": len(found) - len(updated),
+        }
+
+    # --- Consultation ---
+
+    def files(self, language: str = None) -> list:
+        """Fichiers indexés (triés par chemin), éventuellement filtrés par langage."""
+        with self._lock:
+            entries = list(self._files.values())
+        if language is not None:
+            entries = [e for e in entries if e.language == language]
+        return sorted(entries, key=lambda e: e.path)
+
+    def get(self, rel_path: str):
+        with self._lock:
+            return self._files.get(rel_path)
+
+    def read(self, rel_path: str) -> str:
+        """Contenu actuel d'un fichier indexé (chaîne vide s'il est illisible)."""
+        try:
+            with open(os.path.join(self.root, rel_path), encoding="utf-8") as f:
+                return f.read()
+        except (OSError, UnicodeDecodeError):
+            return ""
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,25 +1,8 @@
 # services/prompt_builder.py
 
-def build_prompt(doc_type: str, full_path: str) -> str:
-    return f"""
-Tu es un assistant expert en documentation projet.
-Génère un contenu HTML structuré pour la section : {doc_type} > {full_path}
+from services.prompt_registry import render
 
-**Instructions strictes :**
-1. Uniquement du contenu technique utile 
-2. Pas de notes d'installation/configuration
-3. Pas de mentions aux bibliothèques utilisées
-4. Pas de conclusion ou méta-commentaires
 
-**Format :**
-- Titre h2 avec icône Lucide (sans mentionner Lucide)
-- Contenu technique concis
-- Diagrammes Mermaid si pertinent (sans instructions d'installation)
-- Code formaté (sans mention de Prism)
-- Icônes SVG (sans référence à Lucide)
-
-**Interdictions :**
-- Ne jamais expliquer comment afficher le contenu
-- Ne jamais mentionner les dépendances techniques
-- Ne jamais ajouter de notes techniques ou pédagogiques
-"""
+def build_prompt(doc_type: str, full_path: str):
+    """Messages (système statique, puis section demandée) pour générer une section de documentation."""
+    return render("doc.section", doc_type=doc_type, section=full_path)
@@ -0,0 +1,239 @@
+# services/prompt_registry.py
+
+"""
+Registre versionné des prompts envoyés aux modèles.
+
+Les fournisseurs (OpenAI, DeepSeek) mettent automatiquement en cache le plus long
+préfixe commun des prompts récents : les tokens déjà vus sont facturés moins cher
+et traités plus vite. Pour en profiter, chaque modèle de prompt sépare :
+    - un message système statique (consignes), identique d'un appel à l'autre et
+      placé en tête ;
+    - un message utilisateur qui ne contient que les données variables (section,
+      contexte de code), placé en dernier.
+
+Chaque modèle porte un numéro de version, à incrémenter dès que le texte statique
+change : il est enregistré avec chaque appel dans la télémétrie (services.llm_telemetry),
+ce qui permet de comparer latence, coût et tokens servis par le cache entre versions.
+"""
+
+import json
+from dataclasses import dataclass
+
+
+class RenderedPrompt(list):
+    """Liste de messages produite par un modèle de prompt, qui retient son identifiant."""
+
+    def __init__(self, messages, template_id=""):
+        super().__init__(messages)
+        self.template_id = template_id
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    name: str
+    version: int
+    system: str  # consignes statiques (préfixe commun à tous les appels)
+    user: str  # données variables, gabarit str.format
+
+    @property
+    def template_id(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    def render(self, **variables) -> RenderedPrompt:
+        return RenderedPrompt(
+            [
+                {"role": "system", "content": self.system},
+                {"role": "user", "content": self.user.format(**variables)},
+            ],
+            self.template_id,
+        )
+
+
+_templates = {}  # {nom: {version: PromptTemplate}}
+
+
+def register(template: PromptTemplate) -> PromptTemplate:
+    versions = _templates.setdefault(template.name, {})
+    if template.version in versions and versions[template.version] != template:
+        raise ValueError(f"Le prompt {template.template_id} est déjà enregistré avec un autre texte")
+    versions[template.version] = template
+    return template
+
+
+def get_template(name: str, version: int = None) -> PromptTemplate:
+    """Modèle `name` dans la version demandée (par défaut la plus récente)."""
+    versions = _templates.get(name)
+    if not versions:
+        raise KeyError(f"Prompt inconnu : {name}")
+    if version is None:
+        version = max(versions)
+    try:
+        return versions[version]
+    except KeyError:
+        raise KeyError(f"Version inconnue pour le prompt {name} : {version}") from None
+
+
+def render(name: str, version: int = None, **variables) -> RenderedPrompt:
+    return get_template(name, version).render(**variables)
+
+
+# --- Conversion des prompts (texte libre ou liste de messages) ---
+
+def as_messages(prompt) -> list:
+    """Messages à envoyer à l'API ; un texte libre devient un unique message utilisateur."""
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return prompt
+
+
+def prompt_text(prompt) -> str:
+    """Texte complet du prompt (estimation des tokens, édition par l'utilisateur)."""
+    if isinstance(prompt, str):
+        return prompt
+    return "\n\n".join(m.get("content", "") for m in prompt)
+
+
+def prompt_key(prompt) -> str:
+    """
+    Représentation stable du prompt pour les clés de cache. Un texte libre est
+    conservé tel quel : les réponses déjà en cache restent valides.
+    """
+    if isinstance(prompt, str):
+        return prompt
+    return json.dumps(list(prompt), ensure_ascii=False, sort_keys=True)
+
+
+def template_id(prompt) -> str:
+    """Identifiant « nom@vN » du modèle ayant produit le prompt ("" pour un texte libre)."""
+    return getattr(prompt, "template_id", "")
+
+
+# --- Modèles de l'application ---
+# v1 (historique) : consignes et données variables mêlées dans un seul message utilisateur.
+
+DOC_SECTION = register(PromptTemplate(
+    name="doc.section",
+    version=2,
+    system="""Tu es un assistant expert en documentation projet.
+Tu génères le contenu HTML structuré de la section de documentation indiquée par l'utilisateur.
+
+**Instructions strictes :**
+1. Uniquement du contenu technique utile
+2. Pas de notes d'installation/configuration
+3. Pas de mentions aux bibliothèques utilisées
+4. Pas de conclusion ou méta-commentaires
+
+**Format :**
+- Titre h2 avec icône Lucide (sans mentionner Lucide)
+- Contenu technique concis
+- Diagrammes Mermaid si pertinent (sans instructions d'installation)
+- Code formaté (sans mention de Prism)
+- Icônes SVG (sans référence à Lucide)
+
+**Interdictions :**
+- Ne jamais expliquer comment afficher le contenu
+- Ne jamais mentionner les dépendances techniques
+- Ne jamais ajouter de notes techniques ou pédagogiques""",
+    user="Section à rédiger : {doc_type} > {section}",
+))
+
+DOC_SECTION_HISTORY = register(PromptTemplate(
+    name="doc.section.history",
+    version=2,
+    system="""Tu es un assistant expert en documentation projet.
+Tu génères le contenu HTML structuré de la section historique indiquée par l'utilisateur.
+
+**Instructions strictes :**
+1. Uniquement du contenu technique utile
+2. Pas de notes d'installation/configuration
+3. Pas de mentions aux bibliothèques utilisées
+4. Pas de conclusion ou méta-commentaires
+
+**Format :**
+- Titre h2 reprenant le nom de la section, avec l'icône 'clock-9' de Lucide (sans mentionner Lucide)
+- Contenu technique concis
+- OBLIGATOIREMENT inclure un diagramme Mermaid de type Gantt avec les années (format YYYY)
+- Code formaté (sans mention de Prism)
+- Icônes SVG (sans référence à Lucide)
+
+**Interdictions :**
+- Ne jamais expliquer comment afficher le contenu
+- Ne jamais mentionner les dépendances techniques
+- Ne jamais ajouter de notes techniques ou pédagogiques
+- Ne jamais ajouter ```html en premier ou ``` en dernier""",
+    user="Section à rédiger : {section}",
+))
+
+DOC_PROJECT = register(PromptTemplate(
+    name="doc.project",
+    version=2,
+    system=(
+        "Tu es un assistant technique expert en HTML et en documentation logicielle. Génère une documentation structurée, professionnelle et esthétique en HTML "
+        "pour le projet/code fourni par l'utilisateur.\n\n"
+        "Instructions pour la documentation HTML :\n"
+        "1.  **Document HTML Complet :** Inclure `<!DOCTYPE html>`, `<html>`, `<head>`, `<body>`.\n"
+        "2.  **Titre :** Mettre un titre pertinent dans `<title>` et dans un `<h1>`.\n"
+        "3.  **Style CSS Intégré :** Inclure une section `<style>` dans le `<head>` avec du CSS pour rendre la page agréable à lire (choix de police, marges, espacements, couleurs sobres, style pour les titres, paragraphes, listes). NE PAS inclure de CSS pour la coloration syntaxique ici.\n"
+        "4.  **Coloration Syntaxique JS (Prism.js) :**\n"
+        "    a. Dans le `<head>`, inclure le CSS d'un thème Prism.js depuis un CDN, par exemple : `<link href=\"https://cdnjs.cloudflare.com/ajax/libs/prism/1.29.0/themes/prism-okaidia.min.css\" rel=\"stylesheet\" />`\n"
+        "    b. Pour chaque bloc de code `<pre><code>`, ajouter la classe de langage appropriée, par exemple : `<pre><code class=\"language-python\">...</code></pre>`.\n"
+        "    c. Juste avant la balise `</body>`, inclure le script principal de Prism.js et le composant pour Python depuis un CDN : \n"
+        "       `<script src=\"https://cdnjs.cloudflare.com/ajax/libs/prism/1.29.0/components/prism-core.min.js\"></script>`\n"
+        "       `<script src=\"https://cdnjs.cloudflare.com/ajax/libs/prism/1.29.0/plugins/autoloader/prism-autoloader.min.js\"></script>` (L'autoloader simplifie l'ajout de langages)\n"
+        "5.  **Structure :** Utiliser des balises sémantiques HTML5 (`<header>`, `<nav>`, `<main>`, `<section>`, `<footer>` si pertinent).\n"
+        "6.  **Sections Requises :** Inclure au minimum les sections suivantes avec des titres `<h2>` ou `<h3>` appropriés : Introduction, Architecture/Fonctionnement, Modules/Composants (si pertinent), Dépendances (si pertinent), Blocs de code importants (utiliser `<pre><code class=\"language-...\">`), Conclusion.\n"
+        "7.  **Diagrammes Mermaid (Syntaxe Valide!) :** Si pertinent pour illustrer l'architecture, les dépendances ou un flux, inclure un diagramme Mermaid. Utiliser une syntaxe Mermaid **simple et strictement valide** (ex: `graph TD; A-->B; C---D;`) directement à l'intérieur d'un `<pre class=\"mermaid\">`. NE PAS inclure les délimiteurs ```mermaid.\n"
+        "8.  **Inclusion de Mermaid.js (TRÈS IMPORTANT) :** IMPÉRATIVEMENT, juste avant la balise de fermeture `</body>` (mais APRÈS les scripts Prism.js), inclure les deux lignes suivantes pour que les diagrammes Mermaid s'affichent :\n"
+        "    `<script src=\"https://cdn.jsdelivr.net/npm/mermaid@10/dist/mermaid.min.js\"></script>`\n"
+        "    `<script>mermaid.initialize({startOnLoad:true});</script>`\n"
+        "9.  **Profondeur de l'Analyse :** Ne te contente pas de décrire le code. Explique la *logique métier*, les *interactions* entre les composants principaux, les *choix de conception* apparents, et les *objectifs* de chaque module ou section de code importante. Sois aussi détaillé que possible.\n"
+        "10. **Clarté et Professionnalisme :** Le contenu doit être clair, bien organisé et techniquement précis.\n\n"
+        "Génère uniquement le code HTML complet, en étant détaillé et en n'oubliant PAS les étapes 4, 7 (syntaxe Mermaid valide!), et 8."
+    ),
+    user="Projet/code à documenter :\n\n'''\n{context}\n'''",
+))
+
+REFACTOR_CHUNK = register(PromptTemplate(
+    name="refactor.chunk",
+    version=1,
+    system=(
+        "Tu es un assistant expert Python. Tu refactorises une partie d'un module plus grand, "
+        "dont les autres parties sont traitées séparément.\n\n"
+        "**Règles :**\n"
+        "1. Conserver les noms et signatures publics des fonctions et classes de la partie : "
+        "le reste du module les utilise\n"
+        "2. Ne pas renvoyer le contexte du module (imports, variables globales) ni ajouter d'imports : "
+        "signaler en commentaire un import manquant\n"
+        "3. Renvoyer uniquement la partie refactorisée, complète, dans un seul bloc Markdown Python"
+    ),
+    user=(
+        "Consigne de refactorisation : {instruction}\n\n"
+        "Contexte du module (lecture seule) :\n```python\n{context}\n```\n\n"
+        "Partie à refactoriser ({part}) :\n```python\n{code}\n```"
+    ),
+))
+
+REFACTOR_EDITS = register(PromptTemplate(
+    name="refactor.edits",
+    version=1,
+    system=(
+        "Tu es un assistant expert Python. Tu appliques une consigne de refactorisation en "
+        "renvoyant uniquement les modifications à apporter, jamais le fichier complet.\n\n"
+        "**Format de réponse :** une suite de blocs, un par endroit modifié :\n"
+        "<<<<<<< SEARCH\n"
+        "lignes actuelles, recopiées exactement (indentation comprise)\n"
+        "=======\n"
+        "lignes qui les remplacent\n"
+        ">>>>>>> REPLACE\n\n"
+        "**Règles :**\n"
+        "1. Chaque passage SEARCH doit apparaître une seule fois dans le code : inclure juste "
+        "assez de lignes voisines pour qu'il soit unique\n"
+        "2. Des passages courts : ne recopier que les lignes modifiées et leur contexte immédiat\n"
+        "3. Pour supprimer des lignes, laisser la partie REPLACE vide\n"
+        "4. Aucun texte hors des blocs"
+    ),
+    user=(
+        "Consigne de refactorisation : {instruction}\n\n"
+        "Code actuel :\n```python\n{code}\n```"
+    ),
+))
@@ -0,0 +1,260 @@
+# services/rate_limiter.py
+
+"""
+Limitation de débit partagée pour tous les appels LLM.
+
+Chaque couple (fournisseur, modèle) dispose de deux seaux à jetons : un pour les
+requêtes par minute, un pour les tokens par minute. Un appel attend que les deux
+seaux aient assez de capacité avant de partir. Lorsqu'un fournisseur répond 429,
+l'en-tête Retry-After (ou, à défaut, un délai exponentiel avec gigue) bloque tout
+le couple (fournisseur, modèle), pas seulement la requête concernée.
+"""
+
+import asyncio
+import random
+import threading
+import time
+
+import openai
+
+from services.cancellation import GenerationCancelled
+
+# Limites par défaut (requêtes/min, tokens/min), ajustables par fournisseur ou par modèle
+DEFAULT_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 150_000},
+    "deepseek": {"rpm": 300, "tpm": 300_000},
+    # Fournisseur simulé (services.mock_llm) : ne pas fausser les tests de charge
+    "mock": {"rpm": 1_000_000, "tpm": 1_000_000_000},
+}
+MODEL_LIMITS = {
+    ("openai", "gpt-4"): {"rpm": 500, "tpm": 40_000},
+}
+FALLBACK_LIMITS = {"rpm": 60, "tpm": 60_000}
+
+MAX_RETRIES = 5
+BASE_BACKOFF = 1.0  # secondes
+MAX_BACKOFF = 60.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimation grossière du nombre de tokens (~4 caractères par token)."""
+    return max(1, len(text or "") // 4)
+
+
+class TokenBucket:
+    """Seau à jetons rechargé en continu."""
+
+    def __init__(self, capacity: float, per_minute: float):
+        self.capacity = float(capacity)
+        self.rate = per_minute / 60.0
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        Réserve `amount` jetons et retourne le délai à attendre avant de les utiliser.
+        Une demande plus grande que la capacité est plafonnée pour ne jamais bloquer indéfiniment.
+        """
+        amount = min(amount, self.capacity)
+        self._refill(now)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class RateLimiter:
+    def __init__(self, default_limits=None, model_limits=None):
+        self.default_limits = dict(DEFAULT_LIMITS if default_limits is None else default_limits)
+        self.model_limits = dict(MODEL_LIMITS if model_limits is None else model_limits)
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._blocked_until = {}
+
+    def limits_for(self, provider: str, model: str) -> dict:
+        return (
+            self.model_limits.get((provider, model))
+            or self.default_limits.get(provider)
+            or FALLBACK_LIMITS
+        )
+
+    def _buckets_for(self, provider, model):
+        key = (provider, model)
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            limits = self.limits_for(provider, model)
+            buckets = (
+                TokenBucket(limits["rpm"], limits["rpm"]),
+                TokenBucket(limits["tpm"], limits["tpm"]),
+            )
+            self._buckets[key] = buckets
+        return buckets
+
+    def reserve(self, provider: str, model: str, tokens: int) -> float:
+        """Réserve une requête de `tokens` tokens et retourne le temps d'attente nécessaire."""
+        now = time.monotonic()
+        with self._lock:
+            requests_bucket, tokens_bucket = self._buckets_for(provider, model)
+            wait = max(
+                requests_bucket.reserve(1, now),
+                tokens_bucket.reserve(tokens, now),
+                self._blocked_until.get((provider, model), 0.0) - now,
+            )
+        return max(0.0, wait)
+
+    def block(self, provider: str, model: str, delay: float) -> None:
+        """Suspend tous les appels vers (fournisseur, modèle) pendant `delay` secondes."""
+        until = time.monotonic() + delay
+        with self._lock:
+            key = (provider, model)
+            self._blocked_until[key] = max(self._blocked_until.get(key, 0.0), until)
+
+
+# Instance partagée par tout le processus
+rate_limiter = RateLimiter()
+
+
+def retry_after_seconds(error) -> float | None:
+    """Extrait le délai Retry-After (en secondes) d'une erreur HTTP du SDK OpenAI."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    for name in ("retry-after-ms", "retry-after"):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            seconds = float(value)
+        except ValueError:
+            continue
+        return seconds / 1000.0 if name == "retry-after-ms" else seconds
+    return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Délai exponentiel avec gigue complète (« full jitter »)."""
+    return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * (2 ** attempt)))
+
+
+def _is_retryable(error) -> bool:
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_delay(error, attempt):
+    delay = retry_after_seconds(error) if isinstance(error, openai.APIStatusError) else None
+    return delay if delay is not None else backoff_delay(attempt)
+
+
+def _sleep(delay, cancel_token=None):
+    if cancel_token is None:
+        time.sleep(delay)
+        return
+    deadline = time.monotonic() + delay
+    while True:
+        cancel_token.raise_if_cancelled()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 0.1))
+
+
+def call_with_retry(
+    request,
+    provider: str,
+    model: str,
+    estimated_tokens: int = 0,
+    on_throttled=None,
+    cancel_token=None,
+    max_retries: int = MAX_RETRIES,
+    limiter: RateLimiter = None,
+    metrics=None,
+):
+    """
+    Exécute `request()` en respectant les limites de débit et en réessayant sur 429/5xx.
+
+    Args:
+        request (callable): Effectue l'appel à l'API et retourne sa réponse
+        estimated_tokens (int): Tokens attendus (prompt + réponse) pour le seau tokens/min
+        on_throttled (callable): Appelé avec le temps d'attente (s) quand l'appel est retardé
+        cancel_token: CancellationToken interrompant l'attente
+        metrics (CallMetrics): Reçoit les attentes et le nombre de nouvelles tentatives
+    """
+    limiter = limiter or rate_limiter
+    attempt = 0
+    while True:
+        wait = limiter.reserve(provider, model, estimated_tokens)
+        if wait > 0:
+            if metrics is not None:
+                metrics.add_wait(wait)
+            if on_throttled:
+                on_throttled(wait)
+            _sleep(wait, cancel_token)
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+
+        try:
+            return request()
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            if attempt >= max_retries or not _is_retryable(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            if isinstance(e, openai.RateLimitError):
+                limiter.block(provider, model, delay)
+            attempt += 1
+            if metrics is not None:
+                metrics.add_retry()
+                metrics.add_wait(delay)
+            if on_throttled:
+                on_throttled(delay)
+            _sleep(delay, cancel_token)
+
+
+async def call_with_retry_async(
+    request,
+    provider: str,
+    model: str,
+    estimated_tokens: int = 0,
+    on_throttled=None,
+    max_retries: int = MAX_RETRIES,
+    limiter: RateLimiter = None,
+    metrics=None,
+):
+    """
+    Variante asyncio de call_with_retry : `request()` retourne un awaitable.
+    `on_throttled` reste une fonction synchrone (ex. `queue.put_nowait`).
+    """
+    limiter = limiter or rate_limiter
+    attempt = 0
+    while True:
+        wait = limiter.reserve(provider, model, estimated_tokens)
+        if wait > 0:
+            if metrics is not None:
+                metrics.add_wait(wait)
+            if on_throttled:
+                on_throttled(wait)
+            await asyncio.sleep(wait)
+
+        try:
+            return await request()
+        except Exception as e:
+            if attempt >= max_retries or not _is_retryable(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            if isinstance(e, openai.RateLimitError):
+                limiter.block(provider, model, delay)
+            attempt += 1
+            if metrics is not None:
+                metrics.add_retry()
+                metrics.add_wait(delay)
+            if on_throttled:
+                on_throttled(delay)
+            await asyncio.sleep(delay)
@@ -0,0 +1,186 @@
+# services/single_flight.py
+
+"""
+Regroupement des requêtes LLM identiques en cours d'exécution ("single-flight").
+
+La première requête pour une clé donnée devient le « leader » et appelle réellement
+le modèle. Les requêtes identiques qui arrivent pendant son exécution s'y attachent :
+elles reçoivent les mêmes fragments (y compris ceux déjà produits) puis le même
+résultat final, sans nouvel appel payant à l'API.
+"""
+
+import threading
+
+
+class Flight:
+    """Une requête en cours, partagée entre son leader et ses abonnés."""
+
+    def __init__(self, key):
+        self.key = key
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.done = False
+        self.subscribers = 0
+        self._listeners = []
+        self._cond = threading.Condition()
+
+    def publish(self, chunk: str) -> None:
+        """Diffuse un fragment produit par le leader."""
+        with self._cond:
+            self.chunks.append(chunk)
+            listeners = list(self._listeners)
+            self._cond.notify_all()
+        for on_chunk, _on_done in listeners:
+            if on_chunk is not None:
+                on_chunk(chunk)
+
+    def finish(self, result) -> None:
+        with self._cond:
+            self.result = result
+            self.done = True
+            listeners, self._listeners = self._listeners, []
+            self._cond.notify_all()
+        for _on_chunk, on_done in listeners:
+            on_done(result, None)
+
+    def fail(self, error: Exception) -> None:
+        with self._cond:
+            self.error = error
+            self.done = True
+            listeners, self._listeners = self._listeners, []
+            self._cond.notify_all()
+        for _on_chunk, on_done in listeners:
+            on_done(None, error)
+
+    def subscribe(self, on_chunk, on_done):
+        """
+        Variante non bloquante de wait() : rejoue les fragments déjà diffusés puis
+        enregistre des rappels appelés depuis le thread du leader.
+
+        Args:
+            on_chunk (callable): Appelé pour chaque fragment (peut être None)
+            on_done (callable): Appelé avec (résultat, erreur) à la fin de la requête
+
+        Returns:
+            Identifiant à passer à unsubscribe() pour se détacher avant la fin
+        """
+        listener = (on_chunk, on_done)
+        # Le rejeu se fait sous le verrou pour que les fragments suivants,
+        # diffusés par publish(), arrivent forcément après lui.
+        with self._cond:
+            if on_chunk is not None:
+                for chunk in self.chunks:
+                    on_chunk(chunk)
+            done = self.done
+            if not done:
+                self._listeners.append(listener)
+        if done:
+            on_done(self.result, self.error)
+        return listener
+
+    def unsubscribe(self, listener) -> None:
+        """Détache un abonné (ex. requête annulée) ; ses rappels ne seront plus appelés."""
+        with self._cond:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait(self, on_chunk=None, timeout=None, cancel_token=None):
+        """
+        Attend la fin de la requête partagée et retourne son résultat.
+
+        Args:
+            on_chunk (callable): Appelé pour chaque fragment, y compris ceux déjà diffusés
+            timeout (float): Délai maximal d'attente entre deux événements, en secondes
+            cancel_token: CancellationToken interrompant l'attente (sans annuler le leader)
+
+        Raises:
+            Exception: L'erreur rencontrée par le leader, TimeoutError ou GenerationCancelled
+        """
+        if cancel_token is not None:
+            cancel_token.register(self._wake)
+        try:
+            index = 0
+            while True:
+                with self._cond:
+                    while index >= len(self.chunks) and not self.done:
+                        if cancel_token is not None:
+                            cancel_token.raise_if_cancelled()
+                        if not self._cond.wait(timeout):
+                            raise TimeoutError(
+                                "Délai dépassé en attendant une requête identique en cours"
+                            )
+                    pending = self.chunks[index:]
+                    index = len(self.chunks)
+                    done = self.done
+
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                if on_chunk is not None:
+                    for chunk in pending:
+                        on_chunk(chunk)
+
+                if done:
+                    if self.error is not None:
+                        raise self.error
+                    return self.result
+        finally:
+            if cancel_token is not None:
+                cancel_token.unregister(self._wake)
+
+
+class SingleFlight:
+    """Registre des requêtes en cours indexées par clé."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def acquire(self, key):
+        """
+        Retourne (flight, is_leader). Le leader doit obligatoirement appeler
+        complete() ou abort() pour libérer les abonnés.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.subscribers += 1
+                self.coalesced += 1
+                return flight, False
+
+            flight = Flight(key)
+            self._flights[key] = flight
+            self.leaders += 1
+            return flight, True
+
+    def complete(self, flight: Flight, result) -> None:
+        """Termine la requête du leader avec succès."""
+        with self._lock:
+            self._flights.pop(flight.key, None)
+        flight.finish(result)
+
+    def abort(self, flight: Flight, error: Exception) -> None:
+        """Termine la requête du leader en erreur; les abonnés reçoivent la même erreur."""
+        with self._lock:
+            self._flights.pop(flight.key, None)
+        flight.fail(error)
+
+    def stats(self) -> dict:
+        """Compteurs de regroupement pour la supervision."""
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights),
+                "waiting_subscribers": sum(f.subscribers for f in self._flights.values()),
+            }
+
+
+# Instance partagée par tous les modules et tâches de génération
+llm_flights = SingleFlight()